@@ -1,6 +1,8 @@
 import express from 'express';
 import apiRoutes from './routes/api.mjs';
 import logger from './middlewares/logger.mjs';
+import { getMapWorkerPool } from './services/mapWorkerPool.mjs';
+import { startJobArtifactSweeper } from './services/mapJobs.mjs';
 import dotenv from 'dotenv'; 
 import path from 'path';
 import { fileURLToPath } from 'url';
@@ -18,6 +20,15 @@ const port = 5000;
 
 app.use(express.json()); 
 
+// Vector tiles written by the Python map pipeline
+app.use('/tiles', express.static(path.join(publicDirectory, 'tiles'), {
+  setHeaders: (res, filePath) => {
+    if (filePath.endsWith('.pbf')) {
+      res.setHeader('Content-Type', 'application/x-protobuf');
+    }
+  }
+}));
+
 app.use(express.static(publicDirectory));
 app.use(express.static('public'));
 
@@ -43,5 +54,12 @@ function getLocalIP() {
 
 app.listen(port, '0.0.0.0', () => {
   console.log(`Server running at http://${getLocalIP()}:${port}`);
+
+  // Start the Python map workers so they are warm before the first request
+  getMapWorkerPool();
+
+  // Remove job maps, tiles and worker output once they outlive their TTL
+  const ttlMinutes = Number(process.env.MAP_JOB_TTL_MINUTES) || 60;
+  startJobArtifactSweeper({ ttlMs: ttlMinutes * 60 * 1000, intervalMs: Math.min(ttlMinutes, 10) * 60 * 1000 });
 });
 
@@ -0,0 +1,30 @@
+import os
+import tempfile
+
+TEMPORARY_SUFFIX = '.tmp'
+
+def write_atomically(path: str, write) -> None:
+    """
+    Writes a file through a uniquely named temporary file in the same directory and then renames it into
+    place, so concurrent writers never share a partial file and readers only ever see complete ones.
+
+    Parameters:
+        path (str): The file to write.
+        write: Called with the temporary file path, which it writes the contents to.
+    """
+    directory = os.path.dirname(path)
+    os.makedirs(directory, exist_ok=True)
+
+    descriptor, temporary_path = tempfile.mkstemp(dir=directory, prefix=f'.{os.path.basename(path)}.', suffix=TEMPORARY_SUFFIX)
+    os.close(descriptor)
+    try:
+        write(temporary_path)
+        os.replace(temporary_path, path)
+    except BaseException:
+        if os.path.exists(temporary_path):
+            os.remove(temporary_path)
+        raise
+
+def is_temporary_file(filename: str) -> bool:
+    """Returns whether a file name is an in-progress write of write_atomically."""
+    return filename.endswith(TEMPORARY_SUFFIX)
@@ -0,0 +1,164 @@
+import geopandas as gpd
+import hashlib
+import json
+import os
+from atomic_file import write_atomically, is_temporary_file
+
+CACHE_DIRECTORY = '.boundary_cache'
+
+# Simplification tolerances (in metres for projected CRSs) of the stored levels of detail, finest first
+LOD_TOLERANCES = (5, 50, 500, 5000)
+
+# Roughly the number of tolerance steps across the longest side of the mapped area. The level chosen
+# for an area is the coarsest whose tolerance does not exceed the area's extent divided by this.
+VIEW_RESOLUTION = 2000
+
+# Pyramids already loaded by this process, keyed by cache path, so long-lived workers keep them warm
+_loaded_pyramids = {}
+
+def _level_column(tolerance: float) -> str:
+    return f'geometry_{tolerance:g}m'
+
+def _cache_path(shapefile_path: str, crs: str, tolerances: tuple) -> str:
+    """
+    Returns the cache file path for a shapefile processed with a given CRS and set of simplification
+    tolerances. The file name holds a hash of the shapefile path, modification time, CRS and tolerances,
+    so editing the shapefile or changing the processing parameters produces a different cache file.
+    """
+    shapefile_path = os.path.abspath(shapefile_path)
+    key = json.dumps([shapefile_path, os.stat(shapefile_path).st_mtime, crs, list(tolerances)])
+    digest = hashlib.sha256(key.encode('utf-8')).hexdigest()[:16]
+    shapefile_name = os.path.splitext(os.path.basename(shapefile_path))[0]
+
+    return os.path.join(os.path.dirname(shapefile_path), CACHE_DIRECTORY, f'{shapefile_name}-{digest}.parquet')
+
+def _remove_stale_caches(cache_path: str) -> None:
+    """Removes cache files of the same shapefile that were built with a different key."""
+    cache_directory = os.path.dirname(cache_path)
+    shapefile_name = os.path.basename(cache_path).rsplit('-', 1)[0]
+    for filename in os.listdir(cache_directory):
+        # Temporary files are other processes' writes in progress
+        if is_temporary_file(filename):
+            continue
+        if filename.rsplit('-', 1)[0] == shapefile_name and filename != os.path.basename(cache_path):
+            try:
+                os.remove(os.path.join(cache_directory, filename))
+            except FileNotFoundError:
+                # Another process removed it first
+                pass
+
+def load_boundary_pyramid(shapefile_path: str, crs: str = 'EPSG:7855', tolerances: tuple = LOD_TOLERANCES) -> gpd.GeoDataFrame:
+    """
+    Loads a shapefile projected to a CRS with one geometry column per level of detail. The processed
+    boundaries are cached as GeoParquet next to the shapefile, so later loads skip parsing, reprojection
+    and simplification entirely, and kept in memory for the rest of the process.
+
+    Parameters:
+        shapefile_path (str): Path to the shapefile to load.
+        crs (str): The CRS to project the boundaries to. Default is GDA2020 (EPSG:7855).
+        tolerances (tuple): The simplification tolerances of the levels, in CRS units, finest first.
+
+    Returns:
+        gpd.GeoDataFrame: The shapefile attributes plus a 'geometry_<tolerance>m' column per level.
+            The finest level is the active geometry.
+    """
+    if not shapefile_path or not os.path.exists(shapefile_path):
+        raise FileNotFoundError(f"Shapefile path '{shapefile_path}' is invalid or does not exist.")
+
+    cache_path = _cache_path(shapefile_path, crs, tolerances)
+    if cache_path in _loaded_pyramids:
+        # Shallow copy so callers adding columns do not modify the kept pyramid
+        return _loaded_pyramids[cache_path].copy(deep=False)
+
+    if os.path.exists(cache_path):
+        try:
+            gdf = gpd.read_parquet(cache_path)
+            _loaded_pyramids[cache_path] = gdf
+            return gdf.copy(deep=False)
+        except Exception:
+            # A corrupt or unreadable cache file is rebuilt below
+            pass
+
+    # Load shapefile
+    try:
+        gdf = gpd.read_file(shapefile_path)
+    except Exception as e:
+        raise ValueError(f"Failed to load shapefile '{shapefile_path}': {e}")
+
+    # Project to the requested CRS
+    try:
+        gdf = gdf.to_crs(crs)
+    except Exception as e:
+        raise ValueError(f"Failed to project GeoDataFrame to {crs}: {e}")
+
+    # Simplify geometries once per level of detail
+    try:
+        geometry = gdf.geometry
+        gdf = gdf.drop(columns=gdf.geometry.name)
+        for tolerance in tolerances:
+            gdf[_level_column(tolerance)] = geometry.simplify(tolerance, preserve_topology=True)
+        gdf = gpd.GeoDataFrame(gdf, geometry=_level_column(tolerances[0]), crs=geometry.crs)
+    except Exception as e:
+        raise ValueError(f"Error simplifying geometries: {e}")
+
+    write_atomically(cache_path, lambda temporary_path: gdf.to_parquet(temporary_path, index=False))
+    _remove_stale_caches(cache_path)
+
+    _loaded_pyramids[cache_path] = gdf
+    return gdf.copy(deep=False)
+
+def select_tolerance(bounds, tolerances: tuple = LOD_TOLERANCES) -> float:
+    """
+    Picks the level of detail that suits the extent of an area.
+
+    Parameters:
+        bounds: The (minx, miny, maxx, maxy) bounds of the area, in the units of the levels' CRS.
+        tolerances (tuple): The tolerances of the available levels, finest first.
+
+    Returns:
+        float: The coarsest tolerance not exceeding the extent divided by VIEW_RESOLUTION.
+    """
+    extent = max(bounds[2] - bounds[0], bounds[3] - bounds[1])
+    suitable = [tolerance for tolerance in tolerances if tolerance <= extent / VIEW_RESOLUTION]
+    return max(suitable) if suitable else min(tolerances)
+
+def select_level(pyramid_gdf: gpd.GeoDataFrame, tolerance: float = None) -> gpd.GeoDataFrame:
+    """
+    Reduces a boundary pyramid to a single level of detail.
+
+    Parameters:
+        pyramid_gdf (gpd.GeoDataFrame): Boundaries as returned by load_boundary_pyramid, possibly filtered.
+        tolerance (float, optional): The tolerance of the level to use. Default is None (pick the level
+            that suits the bounds of the boundaries).
+
+    Returns:
+        gpd.GeoDataFrame: The boundaries with the chosen level as the 'geometry' column, without empty geometries.
+    """
+    level_columns = [column for column in pyramid_gdf.columns if column.startswith('geometry_') and column.endswith('m')]
+    tolerances = tuple(float(column[len('geometry_'):-1]) for column in level_columns)
+
+    if tolerance is None:
+        tolerance = select_tolerance(pyramid_gdf.total_bounds, tolerances) if len(pyramid_gdf) else min(tolerances)
+    elif tolerance not in tolerances:
+        raise ValueError(f"No level of detail with tolerance {tolerance}. Available tolerances: {tolerances}.")
+
+    level_column = level_columns[tolerances.index(tolerance)]
+    gdf = pyramid_gdf.set_geometry(level_column).drop(columns=[column for column in level_columns if column != level_column])
+    gdf = gdf.rename_geometry('geometry')
+
+    return gdf[~gdf.geometry.is_empty]
+
+def load_boundaries(shapefile_path: str, crs: str = 'EPSG:7855', tolerance: float = None) -> gpd.GeoDataFrame:
+    """
+    Loads a shapefile projected to a CRS at a single level of detail, from the boundary cache if possible.
+
+    Parameters:
+        shapefile_path (str): Path to the shapefile to load.
+        crs (str): The CRS to project the boundaries to. Default is GDA2020 (EPSG:7855).
+        tolerance (float, optional): The tolerance of the level to use. Default is None (pick the level
+            that suits the bounds of the whole shapefile).
+
+    Returns:
+        gpd.GeoDataFrame: The projected and simplified boundaries, without empty geometries.
+    """
+    return select_level(load_boundary_pyramid(shapefile_path, crs), tolerance)
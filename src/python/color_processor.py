@@ -0,0 +1,86 @@
+import pandas as pd
+import numpy as np
+import branca.colormap as cm
+import matplotlib
+from matplotlib.colors import to_hex
+from functools import lru_cache
+
+COLOR_TABLE_SIZE = 256
+SEQUENTIAL_COLORMAP = 'Blues'
+DIVERGING_COLORMAP = 'RdYlGn'
+NO_DATA_COLOR = '#d3d3d3'
+
+@lru_cache(maxsize=None)
+def color_table(colormap_name: str, size: int = COLOR_TABLE_SIZE) -> np.ndarray:
+    """
+    Returns a lookup table of evenly spaced hex colours sampled from a Matplotlib colormap, from its
+    lowest to its highest colour. Tables are cached, so the colormap is only sampled once per process.
+
+    Parameters:
+        colormap_name (str): The name of the Matplotlib colormap (e.g. 'Blues').
+        size (int): The number of colours in the table. Default is 256.
+
+    Returns:
+        np.ndarray: The hex colours. The array is read-only as it is shared between callers.
+    """
+    colormap = matplotlib.colormaps[colormap_name].resampled(size)
+    table = np.array([to_hex(color) for color in colormap(np.arange(size))], dtype=object)
+    table.setflags(write=False)
+    return table
+
+def compute_colors(values, vmin: float, vmax: float, table: np.ndarray) -> np.ndarray:
+    """
+    Maps every value to a colour in one vectorised pass: values are scaled to the table between vmin
+    and vmax (clipping values outside it) and the nearest table entry is looked up.
+
+    Parameters:
+        values: The values to colour.
+        vmin (float): The value mapped to the first colour of the table.
+        vmax (float): The value mapped to the last colour of the table.
+        table (np.ndarray): The colour lookup table, as returned by color_table.
+
+    Returns:
+        np.ndarray: The hex colour of each value. Missing values get NO_DATA_COLOR.
+    """
+    values = np.asarray(values, dtype=np.float64)
+    span = vmax - vmin
+    positions = (values - vmin) / span if span > 0 else np.zeros_like(values)
+
+    missing = np.isnan(positions)
+    bins = np.rint(np.clip(np.nan_to_num(positions), 0, 1) * (len(table) - 1)).astype(np.intp)
+
+    colors = table[bins]
+    colors[missing] = NO_DATA_COLOR
+    return colors
+
+def colorize(values: pd.Series, is_percentage: bool = False, diverging: bool = None) -> tuple[np.ndarray, cm.LinearColormap]:
+    """
+    Computes the choropleth colour of every value and the matching legend. Absolute values use a
+    sequential scale over their range; changes use a diverging scale symmetric around zero.
+
+    Parameters:
+        values (pd.Series): The values to colour. The series name is used for the legend caption.
+        is_percentage (bool): Whether the values are percentage changes. Default is False.
+        diverging (bool, optional): Whether to use the diverging scale. Default is None (only for percentages).
+
+    Returns:
+        tuple[np.ndarray, cm.LinearColormap]: The hex colour of each value, and the legend.
+    """
+    if diverging is None:
+        diverging = is_percentage
+
+    if diverging:
+        max_abs_value = max(abs(values.min()), abs(values.max()))
+        vmin, vmax = -max_abs_value, max_abs_value
+        table = color_table(DIVERGING_COLORMAP)
+    else:
+        vmin, vmax = values.min(), values.max()
+        table = color_table(SEQUENTIAL_COLORMAP)
+    caption = f'{str(values.name).replace("_", " ").title()} ({"%" if is_percentage else "$"})'
+
+    if pd.isna(vmin) or pd.isna(vmax):
+        vmin, vmax = 0.0, 0.0
+
+    colors = compute_colors(values, float(vmin), float(vmax), table)
+    legend = cm.LinearColormap(colors=list(table), vmin=float(vmin), vmax=float(vmax), caption=caption)
+    return colors, legend
@@ -0,0 +1,125 @@
+import geopandas as gpd
+import pandas as pd
+import numpy as np
+from scipy import sparse
+import hashlib
+import json
+import os
+from boundary_cache import load_boundaries, CACHE_DIRECTORY, LOD_TOLERANCES
+from atomic_file import write_atomically
+
+# Pieces of a postcode smaller than this share of its area are treated as slivers from boundary mismatches
+MIN_CROSSWALK_WEIGHT = 0.001
+
+def build_crosswalk(
+    postcode_gdf: gpd.GeoDataFrame,
+    postcode_column: str,
+    region_gdf: gpd.GeoDataFrame,
+    region_column: str
+) -> pd.DataFrame:
+    """
+    Builds an area-weighted crosswalk from postcodes to regions. Each postcode is intersected with the
+    regions it overlaps and weighted by the share of its area inside each of them, so postcodes straddling
+    a boundary are split between regions rather than assigned wholly to one.
+
+    Parameters:
+        postcode_gdf (gpd.GeoDataFrame): Postcode boundaries in a projected CRS.
+        postcode_column (str): The column holding postcodes.
+        region_gdf (gpd.GeoDataFrame): Region boundaries (e.g. electorates) in the same CRS.
+        region_column (str): The column identifying regions.
+
+    Returns:
+        pd.DataFrame: Columns 'postcode', 'region' and 'weight'. The weights of each postcode sum to 1.
+    """
+    postcodes = postcode_gdf[[postcode_column, 'geometry']].rename(columns={postcode_column: 'postcode'})
+    regions = region_gdf[[region_column, 'geometry']].rename(columns={region_column: 'region'})
+
+    try:
+        pieces = gpd.overlay(postcodes, regions, how='intersection', keep_geom_type=True)
+    except Exception as e:
+        raise ValueError(f"Failed to intersect postcodes with regions: {e}")
+
+    pieces['area'] = pieces.geometry.area
+    crosswalk = pieces.groupby(['postcode', 'region'], as_index=False)['area'].sum()
+
+    # Weight by the share of the postcode's area, ignoring slivers, then renormalise so sales are conserved
+    crosswalk['weight'] = crosswalk['area'] / crosswalk.groupby('postcode')['area'].transform('sum')
+    crosswalk = crosswalk[crosswalk['weight'] >= MIN_CROSSWALK_WEIGHT]
+    crosswalk['weight'] = crosswalk['weight'] / crosswalk.groupby('postcode')['weight'].transform('sum')
+
+    return crosswalk[['postcode', 'region', 'weight']].reset_index(drop=True)
+
+def _crosswalk_path(postcode_shapefile_path: str, region_shapefile_path: str, region_column: str, crs: str) -> str:
+    """
+    Returns the cache file path of a crosswalk. The file name holds a hash of both shapefiles' paths and
+    modification times (the boundary vintage), the region column and the CRS.
+    """
+    postcode_shapefile_path = os.path.abspath(postcode_shapefile_path)
+    region_shapefile_path = os.path.abspath(region_shapefile_path)
+    key = json.dumps([
+        postcode_shapefile_path, os.stat(postcode_shapefile_path).st_mtime,
+        region_shapefile_path, os.stat(region_shapefile_path).st_mtime,
+        region_column, crs
+    ])
+    digest = hashlib.sha256(key.encode('utf-8')).hexdigest()[:16]
+    region_name = os.path.splitext(os.path.basename(region_shapefile_path))[0]
+
+    return os.path.join(os.path.dirname(region_shapefile_path), CACHE_DIRECTORY, f'crosswalk-{region_name}-{digest}.parquet')
+
+def load_crosswalk(
+    postcode_shapefile_path: str,
+    postcode_id_column: str,
+    region_shapefile_path: str,
+    region_column: str,
+    crs: str = 'EPSG:7855'
+) -> pd.DataFrame:
+    """
+    Loads the postcode-to-region crosswalk for a pair of shapefiles, building and persisting it first if
+    it has not been built for this boundary vintage. Crosswalks are built from the finest level of detail
+    over the whole country, so one crosswalk serves every state filter.
+
+    Parameters:
+        postcode_shapefile_path (str): Path to the postcode shapefile.
+        postcode_id_column (str): The postcode column of the postcode shapefile.
+        region_shapefile_path (str): Path to the region shapefile.
+        region_column (str): The column identifying regions in the region shapefile.
+        crs (str): The projected CRS areas are measured in. Default is GDA2020 (EPSG:7855).
+
+    Returns:
+        pd.DataFrame: Columns 'postcode' (4-digit strings), 'region' and 'weight'.
+    """
+    for shapefile_path in (postcode_shapefile_path, region_shapefile_path):
+        if not shapefile_path or not os.path.exists(shapefile_path):
+            raise FileNotFoundError(f"Shapefile path '{shapefile_path}' is invalid or does not exist.")
+
+    crosswalk_path = _crosswalk_path(postcode_shapefile_path, region_shapefile_path, region_column, crs)
+    if os.path.exists(crosswalk_path):
+        try:
+            return pd.read_parquet(crosswalk_path)
+        except Exception:
+            # A corrupt or unreadable crosswalk is rebuilt below
+            pass
+
+    postcode_gdf = load_boundaries(postcode_shapefile_path, crs=crs, tolerance=min(LOD_TOLERANCES))
+    postcode_gdf['postcode'] = postcode_gdf[postcode_id_column].astype(str).str.zfill(4)
+    region_gdf = load_boundaries(region_shapefile_path, crs=crs, tolerance=min(LOD_TOLERANCES))
+
+    crosswalk = build_crosswalk(postcode_gdf, 'postcode', region_gdf, region_column)
+
+    write_atomically(crosswalk_path, lambda temporary_path: crosswalk.to_parquet(temporary_path, index=False))
+
+    return crosswalk
+
+def crosswalk_weights(crosswalk: pd.DataFrame) -> tuple[sparse.csr_matrix, pd.Index, pd.Index]:
+    """
+    Returns the weights of a crosswalk as a sparse region-by-postcode matrix, with the postcodes of its
+    columns and the regions of its rows.
+    """
+    postcode_codes, postcodes = pd.factorize(crosswalk['postcode'])
+    region_codes, regions = pd.factorize(crosswalk['region'])
+
+    weights = sparse.csr_matrix(
+        (crosswalk['weight'].to_numpy(dtype=np.float64), (region_codes, postcode_codes)),
+        shape=(len(regions), len(postcodes))
+    )
+    return weights, pd.Index(postcodes), pd.Index(regions, name='region')
@@ -2,35 +2,16 @@ import pandas as pd
 import numpy as np
 import random
 from datetime import timedelta
+import os
+import sys
+
+sys.path.insert(0, os.path.dirname(os.path.dirname(os.path.abspath(__file__))))
+from postcode_lookup import classify_postcodes, load_postcode_ranges
+
+POSTCODE_RANGES = load_postcode_ranges('Australia')
 
 def get_australian_state_from_postcode(postcode):
-    postcode = str(postcode).strip()
-    
-    # Postcode ranges for Australian states and territories
-    postcode_ranges = {
-        'New South Wales': [(1000, 2599), (2619, 2899), (2921, 2999)],
-        'Australian Capital Territory': [(2600, 2618), (2900, 2920)],
-        'Victoria': [(3000, 3999)],
-        'Queensland': [(4000, 4999), (9000, 9999)],
-        'South Australia': [(5000, 5999)],
-        'Western Australia': [(6000, 6797), (6800, 6999)],
-        'Tasmania': [(7000, 7999)],
-        'Northern Territory': [(800, 899)]
-    }
-    
-    # Try to convert postcode to integer
-    try:
-        postcode_int = int(postcode)
-    except ValueError:
-        return 'Unknown'
-    
-    # Check which state the postcode belongs to
-    for state, ranges in postcode_ranges.items():
-        for (start, end) in ranges:
-            if start <= postcode_int <= end:
-                return state
-    
-    return 'Unknown'
+    return classify_postcodes([postcode], POSTCODE_RANGES)[0]
 
 def generate_transaction_log(start_date, end_date, num_transactions):
     """ 
@@ -53,7 +34,7 @@ def generate_transaction_log(start_date, end_date, num_transactions):
     
     # Generate random postcodes between 1 and 1000, converted to 4-digit strings
     postcodes = [f'{postcode:04d}' for postcode in np.random.randint(1000, 8000, num_transactions)]
-    provinces = [get_australian_state_from_postcode(postcode) for postcode in postcodes]
+    provinces = classify_postcodes(postcodes, POSTCODE_RANGES)
     countries = ['Australia' for postcode in postcodes] 
     
     # Generate random transaction values (between $0.01 and $1000)
@@ -1,11 +1,25 @@
 import geopandas as gpd
 import pandas as pd
 import json
-from sales_processor import process_sales
+from sales_processor import process_sales_matrix
 from shapefile_processor import national_shapefile_parser
+from crosswalk_processor import load_crosswalk
+from progress_reporter import report_progress
+from time_bucketing import (
+    rolling_sums,
+    like_for_like_change,
+    partial_periods,
+    period_labels,
+    ROLLING_SALES_COLUMN,
+    PERIOD_CHANGE_COLUMN,
+    PARTIAL_PERIOD_SUFFIX,
+    PERIOD_COLUMNS_ATTR
+)
+from instrumentation import instrumented_stage
 
+@instrumented_stage('generate_choropleth_gdf')
 def generate_choropleth_gdf(
-    sales_data_filepath: str,
+    sales_data_filepath: str | list[str],
     shapefile_country: str,
     shapefile_resolution: str,
     shapefile_config: dict,
@@ -14,12 +28,14 @@ def generate_choropleth_gdf(
     included_states: list[str],
     time_resolution: str, 
     time_length: int,
+    shapefile_tolerance: float = None,
+    max_workers: int = None,
 ) -> gpd.GeoDataFrame:
     """ 
     Generates a GeoJSON for a choropleth map based on sales data and a shapefile.
 
     Parameters:
-        sales_data_filepath (str): Path to the Excel file containing sales data.
+        sales_data_filepath (str | list[str]): Path or glob pattern of the Excel files containing sales data, or a list of them.
         shapefile_country (str): The country for which the shapefile will be processed.
         shapefile_resolution (str): The resolution of the shapefile ('Postcode', 'StateElectorate', etc.).
         shapefile_config (dict): Configuration dictionary for shapefile paths and attributes.
@@ -27,74 +43,108 @@ def generate_choropleth_gdf(
         end_date (pd.Timestamp): End date for sales data aggregation.
         included_states (list[str]): List of states to include in the shapefile and sales analysis.
         time_resolution(str): The resolution of time used for analysis. Can be one of Month, Quarter or Year.
-        time_lenght(int): The number of resolution period (e.g. 5 paired with Month resolution implies 5 months of historical data)
+        time_length(int): The number of resolution periods kept (e.g. 5 paired with Month resolution implies 5 months of historical data),
+            along with their rolling total ('rolling_sales') and the change of the last period from the one before ('period_change')
+        shapefile_tolerance (float, optional): Simplification tolerance of the boundary level of detail to use. Default is None
+            (pick the level that suits the included states). Use the finest level when the map is rendered as TopoJSON, which 
+            simplifies shared borders itself.
+        max_workers (int, optional): Maximum number of processes parsing sales files at once. Default is None (one per
+            CPU core, up to the number of files). Pass 1 from processes that already run alongside others.
 
     Returns:
-        dict: A GeoJSON dictionary suitable for a Leaflet.js choropleth layer.
+        gpd.GeoDataFrame: One row per region of the shapefile, holding its identifiers, geometry, total sales over the
+            date range, sales per kept period (labelled as by period_labels, with partly covered periods marked
+            ' (partial)' and listed oldest first in attrs['period_columns']), 'rolling_sales' (the sum of the last
+            time_length periods) and 'period_change' (the like-for-like change of the last period).
     """
-    # Process the sales data
-    sales_df = process_sales(sales_data_filepath, start_date, end_date, shapefile_resolution)
+    if time_length < 1:
+        raise ValueError(f"Invalid time length ({time_length}). Must be at least 1")
 
-    print("Sales Data Processed")
+    # Process the sales data into a region-by-month matrix
+    sales = process_sales_matrix(sales_data_filepath, start_date, end_date, shapefile_resolution, included_states, max_workers=max_workers)
+    if len(sales) == 0:
+        raise ValueError("No transactions found in the specified date range.")
+
+    report_progress('sales_processed', rows=len(sales))
 
     # Process the necessary shapefiles
     shapefile_gdf = national_shapefile_parser(
         country=shapefile_country,
         resolution=shapefile_resolution,
         config=shapefile_config,
-        included_states=included_states
+        included_states=included_states,
+        tolerance=shapefile_tolerance
     )
 
+    report_progress('shapefile_loaded', features=len(shapefile_gdf))
 
-    # Merge sales data with shapefile GeoDataFrame
+    # Key the regions of the shapefile the same way as the sales matrix
     if shapefile_resolution == "Postcode":
         id_column = shapefile_config[shapefile_resolution]['id_column']
-        shapefile_gdf[id_column] = shapefile_gdf[id_column].astype(str)
-        sales_df['zip'] = sales_df['zip'].astype(str)
-        sales_df_columns = [col.strftime('%b-%Y') if isinstance(col, pd.Timestamp) else col for col in sales_df.columns]
-
-        sales_df.columns = sales_df_columns
-    
-        merged_gdf = shapefile_gdf.merge(
-            sales_df,
-            how='left',
-            left_on=shapefile_gdf[id_column],
-            right_on='zip'
-        )
+        region_ids = shapefile_gdf[id_column].astype(str).str.zfill(4)
+        identifier_columns = {'zip': region_ids.to_numpy(), 'country': shapefile_country}
 
     elif shapefile_resolution == "State":
-        id_column = shapefile_config[shapefile_resolution]['name_column']
-        shapefile_gdf[id_column] = shapefile_gdf[id_column].astype(str)
-        sales_df['province'] = sales_df['province'].astype(str)
-        sales_df_columns = [col.strftime('%b-%Y') if isinstance(col, pd.Timestamp) else col for col in sales_df.columns]
-
-        sales_df.columns = sales_df_columns
-            
-        merged_gdf = shapefile_gdf.merge(
-            sales_df,
-            how='left',
-            left_on=shapefile_gdf[id_column],
-            right_on='province'
-        )
-    
-    # Fill missing sales values with 0 for non-geometry columns
-    non_geometry_columns = [col for col in merged_gdf.columns if col != 'geometry']
-    merged_gdf[non_geometry_columns] = merged_gdf[non_geometry_columns].fillna(0)
-
-    # Ensure missing geometry values are set to None
-    merged_gdf['geometry'] = merged_gdf['geometry'].fillna(None)
-
-    # Reorder columns: postcode, province, country, geometry, total sales, monthly sales
-    if shapefile_resolution != 'State':
-        columns_order = (
-            ['zip', 'country', 'geometry', 'total_sales'] +
-            [col for col in sales_df_columns if col not in ['zip', 'country', 'total_sales']]
+        name_column = shapefile_config[shapefile_resolution]['name_column']
+        region_ids = shapefile_gdf[name_column].astype(str)
+        identifier_columns = {'province': region_ids.to_numpy(), 'country': shapefile_country}
+
+    elif shapefile_resolution in ("StateElectorate", "FederalElectorate"):
+        # Aggregate postcode sales to electorates through the precomputed area-weighted
+        # postcode-to-electorate crosswalk instead of an on-the-fly spatial join
+        resolution_config = shapefile_config[shapefile_resolution]
+        id_column = resolution_config['id_column']
+        crosswalk = load_crosswalk(
+            shapefile_config['Postcode']['path'],
+            shapefile_config['Postcode']['id_column'],
+            resolution_config['path'],
+            id_column
         )
+        sales = sales.aggregate(crosswalk.assign(region=crosswalk['region'].astype(str)))
+
+        region_ids = shapefile_gdf[id_column].astype(str)
+        identifier_columns = {
+            column: shapefile_gdf[column].to_numpy()
+            for column in (id_column, resolution_config['name_column'], resolution_config['state_column'])
+        }
+
     else:
-        columns_order = (
-            ['province', 'country', 'geometry', 'total_sales'] +
-            [col for col in sales_df_columns if col not in ['province', 'country', 'total_sales']]
+        raise ValueError(f"{shapefile_resolution} is not a supported resolution.")
+
+    # Align sales to the geometries by position; regions without sales get zero rows
+    monthly_sales = sales.reindex(region_ids)
+    total_sales = monthly_sales.totals()
+
+    # Roll the monthly sales up to the requested time resolution over the months of the matrix and keep the most recent periods
+    period_sales = monthly_sales.resample(time_resolution)
+    rolling_sales = rolling_sums(period_sales.values, time_length)[:, -1]
+    period_change = like_for_like_change(monthly_sales.values, monthly_sales.periods, time_resolution)
+    period_sales = period_sales.last_periods(time_length)
+
+    # Label the period columns, marking periods the date range only partly covers
+    period_columns = [
+        f'{label}{PARTIAL_PERIOD_SUFFIX}' if partial else label
+        for label, partial in zip(
+            period_labels(period_sales.periods, time_resolution),
+            partial_periods(period_sales.periods, start_date, end_date)
         )
-    merged_gdf = merged_gdf[columns_order]
+    ]
+
+    # Only now build the labelled frame for rendering: region identifiers, geometry, total sales, period sales
+    merged_gdf = gpd.GeoDataFrame(
+        {
+            **identifier_columns,
+            'geometry': shapefile_gdf.geometry.values,
+            'total_sales': total_sales,
+            **dict(zip(period_columns, period_sales.values.T)),
+            ROLLING_SALES_COLUMN: rolling_sales,
+            PERIOD_CHANGE_COLUMN: period_change,
+        },
+        geometry='geometry',
+        crs=shapefile_gdf.crs
+    )
+    merged_gdf.attrs[PERIOD_COLUMNS_ATTR] = period_columns
+
+    report_progress('merged', features=len(merged_gdf))
 
     return merged_gdf
@@ -0,0 +1,100 @@
+import numpy as np
+from collections import OrderedDict
+from sales_matrix import SalesMatrix
+
+# Controls how strongly a region's sales volume weights its percentage change
+DEFAULT_ALPHA = 0.5
+CACHE_SIZE = 32
+
+# Computed metrics, keyed by dataset, periods and alpha, least recently used first
+_cached_metrics = OrderedDict()
+
+def compute_growth_metrics(sales: SalesMatrix, alpha: float = DEFAULT_ALPHA) -> dict[str, np.ndarray]:
+    """
+    Computes growth metrics between every pair of consecutive periods of a sales matrix in one broadcasted
+    pass over its array. Pairwise metrics have one column per pair (the change into periods 1..n-1):
+
+        yoy_pct_change                  change relative to the earlier period (%), zero where it had no sales
+        sales_avg                       the average sales of the pair
+        sales_pct_change                change relative to the pair's average (%), zero where both had no sales
+        sales_weight                    sales_avg ** alpha, zero where the average is not positive
+        weighted_pct_change             sales_pct_change weighted by sales_weight
+        normalized_weighted_pct_change  weighted_pct_change over the total weight of every region for the pair
+        log_growth                      log(1 + later sales) - log(1 + earlier sales)
+
+    and 'cagr' holds each region's compound growth rate per period (%) from the first to the last period
+    (annual when the periods are years), zero where it had no sales in the first period.
+
+    Parameters:
+        sales (SalesMatrix): The sales, with at least two periods.
+        alpha (float): The weight emphasis of sales volume. Default is 0.5.
+
+    Returns:
+        dict[str, np.ndarray]: The metrics, each with a row per region of the matrix.
+    """
+    if len(sales.periods) < 2:
+        raise ValueError("Growth metrics need at least two periods of sales.")
+
+    values = sales.values
+    earlier, later = values[:, :-1], values[:, 1:]
+    change = later - earlier
+
+    with np.errstate(divide='ignore', invalid='ignore'):
+        yoy_pct_change = np.where(earlier != 0, change / earlier, 0) * 100
+
+        sales_avg = (earlier + later) / 2
+        sales_pct_change = np.where(sales_avg != 0, change / sales_avg, 0) * 100
+
+        sales_weight = np.where(sales_avg > 0, np.maximum(sales_avg, 0) ** alpha, 0)
+        weighted_pct_change = np.round(sales_pct_change * sales_weight, 0) * 100
+        total_weight = sales_weight.sum(axis=0)
+        normalized_weighted_pct_change = np.round(
+            np.where(total_weight != 0, weighted_pct_change / total_weight, 0), 2
+        )
+
+        log_growth = np.log1p(np.maximum(later, 0)) - np.log1p(np.maximum(earlier, 0))
+
+        first, last = values[:, 0], values[:, -1]
+        years = len(sales.periods) - 1
+        cagr = np.where((first > 0) & (last >= 0), (np.maximum(last, 0) / first) ** (1 / years) - 1, 0) * 100
+
+    return {
+        'yoy_pct_change': yoy_pct_change,
+        'sales_avg': sales_avg,
+        'sales_pct_change': sales_pct_change,
+        'sales_weight': sales_weight,
+        'weighted_pct_change': weighted_pct_change,
+        'normalized_weighted_pct_change': normalized_weighted_pct_change,
+        'log_growth': log_growth,
+        'cagr': cagr,
+    }
+
+def load_growth_metrics(dataset_key, sales: SalesMatrix, alpha: float = DEFAULT_ALPHA) -> dict[str, np.ndarray]:
+    """
+    Returns the growth metrics of a sales matrix, computing them only if the same dataset, periods and
+    alpha have not been computed recently.
+
+    Parameters:
+        dataset_key: A hashable identifier of the dataset the matrix was built from (e.g. file fingerprints
+            and filters). It must change whenever the matrix's values or regions would.
+        sales (SalesMatrix): The sales, with at least two periods.
+        alpha (float): The weight emphasis of sales volume. Default is 0.5.
+
+    Returns:
+        dict[str, np.ndarray]: The metrics, as returned by compute_growth_metrics. Shared with the cache,
+            so the arrays must not be modified.
+    """
+    key = (dataset_key, tuple(str(period) for period in sales.periods), alpha)
+    if key in _cached_metrics:
+        _cached_metrics.move_to_end(key)
+        return _cached_metrics[key]
+
+    metrics = compute_growth_metrics(sales, alpha)
+    for metric in metrics.values():
+        metric.setflags(write=False)
+
+    _cached_metrics[key] = metrics
+    if len(_cached_metrics) > CACHE_SIZE:
+        _cached_metrics.popitem(last=False)
+
+    return metrics
@@ -0,0 +1,167 @@
+"""
+Stage-level metrics for the map pipeline. Functions decorated with instrumented_stage append one
+JSON line per call to the metrics log, recording:
+
+    wall_seconds, cpu_seconds    time spent in the stage
+    rss_before_bytes,            the process' current resident set size when the stage started and finished
+    rss_after_bytes              (read from /proc/self/statm; None where unsupported)
+    rss_delta_bytes              rss_after_bytes - rss_before_bytes, the memory the stage kept
+    max_rss_growth_bytes         how far the stage raised the process' peak resident set size. Zero unless
+                                 the stage used more memory than any earlier stage of the process; in a
+                                 long-lived worker compare rss_delta_bytes or traced_peak_bytes instead
+    rows                         the length of the stage's result, when it has one
+    output_bytes                 the size of the file the stage returned the path of, if any
+
+Configured through the environment:
+
+    PIPELINE_METRICS_PATH        the JSON-lines log to append to. Default is logs/pipeline_metrics.jsonl
+                                 next to this file; an empty value disables metrics
+    PIPELINE_PROFILE_DIRECTORY   if set, each outermost stage is run under cProfile and its stats dumped
+                                 to <stage>-<timestamp>.prof in this directory
+    PIPELINE_TRACEMALLOC         if set to 1, outermost stages also record traced_peak_bytes, the peak
+                                 memory allocated by Python during the stage
+"""
+import cProfile
+import contextlib
+import functools
+import json
+import os
+import sys
+import time
+import tracemalloc
+from datetime import datetime, timezone
+
+try:
+    import resource
+except ImportError:
+    # Not available on Windows
+    resource = None
+
+DEFAULT_METRICS_PATH = os.path.join(os.path.dirname(os.path.abspath(__file__)), 'logs', 'pipeline_metrics.jsonl')
+
+# Labels added to every record, e.g. the id of the job being run
+_labels = {}
+
+# The number of instrumented stages currently running, so profilers only wrap outermost stages
+_depth = 0
+
+def _current_rss_bytes() -> int:
+    """Returns the current resident set size of the process in bytes, or None where it cannot be measured."""
+    try:
+        with open('/proc/self/statm') as file:
+            resident_pages = int(file.read().split()[1])
+        return resident_pages * os.sysconf('SC_PAGE_SIZE')
+    except (OSError, ValueError, IndexError, AttributeError):
+        return None
+
+def _max_rss_bytes() -> int:
+    """Returns the peak resident set size of the process so far in bytes, or None where it cannot be measured."""
+    if resource is None:
+        return None
+    max_rss = resource.getrusage(resource.RUSAGE_SELF).ru_maxrss
+    # Reported in bytes on macOS and kilobytes elsewhere
+    return max_rss if sys.platform == 'darwin' else max_rss * 1024
+
+def _difference(after: int, before: int) -> int:
+    return after - before if after is not None and before is not None else None
+
+def _result_metrics(result) -> dict:
+    """Returns the row count or output size of a stage's result."""
+    if isinstance(result, str):
+        return {'output_bytes': os.path.getsize(result)} if os.path.isfile(result) else {}
+    if hasattr(result, '__len__'):
+        return {'rows': len(result)}
+    return {}
+
+def write_metrics(record: dict) -> None:
+    """Appends a metrics record to the metrics log, unless metrics are disabled."""
+    metrics_path = os.environ.get('PIPELINE_METRICS_PATH', DEFAULT_METRICS_PATH)
+    if not metrics_path:
+        return
+
+    try:
+        os.makedirs(os.path.dirname(os.path.abspath(metrics_path)), exist_ok=True)
+        with open(metrics_path, 'a') as file:
+            file.write(json.dumps(record, default=str) + '\n')
+    except OSError as e:
+        # Metrics must never fail the pipeline itself
+        print(f"Failed to write pipeline metrics: {e}", file=sys.stderr)
+
+@contextlib.contextmanager
+def metrics_labels(**labels):
+    """Adds labels (e.g. job_id) to the metrics recorded inside the with block."""
+    global _labels
+    previous_labels = _labels
+    _labels = {**previous_labels, **labels}
+    try:
+        yield
+    finally:
+        _labels = previous_labels
+
+def instrumented_stage(stage: str):
+    """
+    Decorates a pipeline function so every call records its metrics as a stage.
+
+    Parameters:
+        stage (str): The stage name recorded in the metrics log.
+    """
+    def decorator(function):
+        @functools.wraps(function)
+        def wrapper(*args, **kwargs):
+            global _depth
+            outermost = _depth == 0
+            profile_directory = os.environ.get('PIPELINE_PROFILE_DIRECTORY') if outermost else None
+            trace_memory = outermost and os.environ.get('PIPELINE_TRACEMALLOC') == '1'
+
+            profiler = cProfile.Profile() if profile_directory else None
+            started_tracing = trace_memory and not tracemalloc.is_tracing()
+            if started_tracing:
+                tracemalloc.start()
+            elif trace_memory:
+                tracemalloc.reset_peak()
+
+            record = {'stage': stage, 'started_at': datetime.now(timezone.utc).isoformat(), 'pid': os.getpid(), **_labels}
+            rss_before = _current_rss_bytes()
+            max_rss_before = _max_rss_bytes()
+            wall_started = time.perf_counter()
+            cpu_started = time.process_time()
+            _depth += 1
+            try:
+                if profiler is not None:
+                    result = profiler.runcall(function, *args, **kwargs)
+                else:
+                    result = function(*args, **kwargs)
+                record['status'] = 'ok'
+                record.update(_result_metrics(result))
+                return result
+
+            except Exception as e:
+                record['status'] = 'error'
+                record['error'] = str(e)
+                raise
+
+            finally:
+                _depth -= 1
+                record['wall_seconds'] = round(time.perf_counter() - wall_started, 4)
+                record['cpu_seconds'] = round(time.process_time() - cpu_started, 4)
+                rss_after = _current_rss_bytes()
+                record['rss_before_bytes'] = rss_before
+                record['rss_after_bytes'] = rss_after
+                record['rss_delta_bytes'] = _difference(rss_after, rss_before)
+                record['max_rss_growth_bytes'] = _difference(_max_rss_bytes(), max_rss_before)
+
+                if trace_memory:
+                    record['traced_peak_bytes'] = tracemalloc.get_traced_memory()[1]
+                    if started_tracing:
+                        tracemalloc.stop()
+
+                if profiler is not None:
+                    os.makedirs(profile_directory, exist_ok=True)
+                    profile_path = os.path.join(profile_directory, f"{stage}-{datetime.now().strftime('%Y%m%d-%H%M%S-%f')}.prof")
+                    profiler.dump_stats(profile_path)
+                    record['profile_path'] = profile_path
+
+                write_metrics(record)
+
+        return wrapper
+    return decorator
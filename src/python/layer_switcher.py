@@ -0,0 +1,113 @@
+import geopandas as gpd
+import numpy as np
+import folium
+from branca.element import MacroElement
+from jinja2 import Template
+
+FEATURE_INDEX_PROPERTY = 'feature_index'
+
+def index_features(gdf: gpd.GeoDataFrame, properties: list[str]) -> gpd.GeoDataFrame:
+    """
+    Returns the GeoDataFrame reduced to the given properties and its geometry, with a feature index
+    property numbering the features in order. Switchable layers look up each feature's colour by this index.
+
+    Parameters:
+        gdf (gpd.GeoDataFrame): The regions to embed.
+        properties (list[str]): The columns to keep as feature properties (e.g. the tooltip fields).
+
+    Returns:
+        gpd.GeoDataFrame: The reduced GeoDataFrame.
+    """
+    indexed_gdf = gdf[properties + [gdf.geometry.name]].copy()
+    indexed_gdf[FEATURE_INDEX_PROPERTY] = np.arange(len(indexed_gdf))
+    return indexed_gdf
+
+class ChoroplethLayerSwitcher(MacroElement):
+    """
+    Restyles a single folium.GeoJson layer between several choropleth layers in the browser. The geometry
+    is embedded once; each layer only adds a compact array of precomputed fill colours (one per feature,
+    in feature index order) and its colour ramp for the legend. A radio control picks the layer and shows
+    its legend. Must be added to the map after the GeoJson layer, whose features need the feature index
+    property (see index_features).
+    """
+    _template = Template("""
+        {% macro script(this, kwargs) %}
+        (function () {
+            var geojson = {{ this.geojson.get_name() }};
+            var layers = {{ this.layers|tojson }};
+            var baseStyle = {{ this.base_style|tojson }};
+
+            function legendHtml(layer) {
+                var stops = layer.colors.filter(function (color, i) {
+                    return i % Math.max(1, Math.floor(layer.colors.length / 16)) === 0;
+                });
+                return '<div style="font-weight: bold; margin-top: 6px;">' + layer.caption + '</div>' +
+                    '<div style="height: 10px; width: 200px; background: linear-gradient(to right, ' + stops.join(', ') + ');"></div>' +
+                    '<div style="display: flex; justify-content: space-between;">' +
+                    '<span>' + layer.vmin.toLocaleString() + '</span><span>' + layer.vmax.toLocaleString() + '</span></div>';
+            }
+
+            var legend;
+            function activate(index) {
+                var layer = layers[index];
+                var style = function (feature) {
+                    var fillColor = layer.fill_colors[feature.properties.{{ this.index_property }}];
+                    return Object.assign({}, baseStyle, {fillColor: fillColor});
+                };
+                // resetStyle (used by the highlight on mouseout) restores options.style, so replace it too
+                geojson.options.style = style;
+                geojson.setStyle(style);
+                legend.innerHTML = legendHtml(layer);
+            }
+
+            var control = L.control({position: {{ this.position|tojson }}});
+            control.onAdd = function () {
+                var container = L.DomUtil.create('div', 'leaflet-bar');
+                container.style.background = 'white';
+                container.style.padding = '6px 10px';
+                container.style.font = '12px arial';
+                layers.forEach(function (layer, index) {
+                    var label = L.DomUtil.create('label', '', container);
+                    label.style.display = 'block';
+                    var input = L.DomUtil.create('input', '', label);
+                    input.type = 'radio';
+                    input.name = '{{ this.get_name() }}';
+                    input.checked = index === {{ this.active }};
+                    input.onchange = function () { activate(index); };
+                    label.appendChild(document.createTextNode(' ' + layer.name));
+                });
+                legend = L.DomUtil.create('div', '', container);
+                L.DomEvent.disableClickPropagation(container);
+                return container;
+            };
+            control.addTo({{ this._parent.get_name() }});
+            activate({{ this.active }});
+        })();
+        {% endmacro %}
+    """)
+
+    def __init__(self, geojson: folium.GeoJson, layers: list[dict], active: int = 0, position: str = 'topleft',
+                 base_style: dict = None):
+        """
+        Parameters:
+            geojson (folium.GeoJson): The layer to restyle.
+            layers (list[dict]): The choropleth layers. Each has a 'name', 'fill_colors' (one hex colour per
+                feature), 'colors' (the hex colour ramp from vmin to vmax), 'vmin', 'vmax' and 'caption'.
+            active (int): The index of the layer shown initially. Default is 0.
+            position (str): The position of the control on the map. Default is 'topleft'.
+            base_style (dict, optional): Style properties shared by every layer. Default is a black outline
+                with a fill opacity of 0.7.
+        """
+        super().__init__()
+        if not layers:
+            raise ValueError("At least one layer is required.")
+        if not 0 <= active < len(layers):
+            raise ValueError(f"Active layer {active} is out of range.")
+
+        self._name = 'ChoroplethLayerSwitcher'
+        self.geojson = geojson
+        self.layers = layers
+        self.active = active
+        self.position = position
+        self.index_property = FEATURE_INDEX_PROPERTY
+        self.base_style = base_style or {'color': 'black', 'weight': 1, 'fillOpacity': 0.7}
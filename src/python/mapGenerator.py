@@ -1,18 +1,28 @@
 import folium.plugins
 import pandas as pd
+import numpy as np
 import geopandas as gpd
 import folium
 from folium import LayerControl
-import branca.colormap as cm
 from typing import Tuple
-from shapely.geometry import box
 from typing import Tuple, Literal
 import matplotlib.pyplot as plt
+from matplotlib.colors import to_hex
 from folium.plugins import MarkerCluster
 
 import sys
 import json
 import os
+import uuid
+
+from postcode_lookup import load_postcode_ranges, postcodes_in_states
+from boundary_cache import load_boundary_pyramid, select_level
+from crosswalk_processor import load_crosswalk
+from color_processor import colorize
+from layer_switcher import ChoroplethLayerSwitcher, index_features
+from output_directories import OUTPUT_DIRECTORY
+from sales_matrix import SalesMatrix
+from growth_metrics import compute_growth_metrics, load_growth_metrics
 
 class VisualisationMap:
     """
@@ -30,6 +40,8 @@ class VisualisationMap:
         """
         self.includedStates = includedStates
         self.resolution = resolution
+        # The years of sales, set by process_sales_data
+        self.years = None
 
         self.BASE_PATH = os.path.dirname(os.path.abspath(__file__))
 
@@ -61,6 +73,7 @@ class VisualisationMap:
         }
         
         self.config = self.SHAPEFILE_CONFIGS[resolution]
+        self.postcode_ranges = load_postcode_ranges('Australia')
         self.postcode_gdf = self._load_postcode_data(includedStates)
         
         # Load electoral data if needed
@@ -73,202 +86,106 @@ class VisualisationMap:
 
     def _load_postcode_data(self, includedStates: list[str]) -> gpd.GeoDataFrame:
         """Load and prepare postcode spatial data."""
-        postcode_gdf = gpd.read_file(self.POSTCODE_SHAPEFILE)
+        # Load projected to GDA2020 at every level of detail, from the boundary cache if possible
+        postcode_gdf = load_boundary_pyramid(self.POSTCODE_SHAPEFILE, crs='EPSG:7855')
         postcode_gdf['postcode'] = postcode_gdf['POA_CODE21'].astype(str).str.zfill(4)
-        
-        # Project to GDA2020
-        postcode_gdf = postcode_gdf.to_crs('EPSG:7855')
 
         # Filter for states if using postcode resolution
         if self.resolution == 'Postcode':
-            # Create a mapping of state ranges
-            state_ranges = {
-                'New South Wales': [(1000, 2599), (2619, 2899), (2921, 2999)],
-                'Australian Capital Territory': [(2600, 2618), (2900, 2920)],
-                'Victoria': [(3000, 3999)],
-                'Queensland': [(4000, 4999), (9000, 9999)],
-                'South Australia': [(5000, 5999)],
-                'Western Australia': [(6000, 6797), (6800, 6999)],
-                'Tasmania': [(7000, 7999)],
-                'Northern Territory': [(800, 899)]
-            }
-            
-            # Function to check if a postcode is in any of the ranges for a state
-            def is_in_state_ranges(postcode: str, state_ranges_list: list) -> bool:
-                try:
-                    postcode_num = int(postcode)
-                    return any(start <= postcode_num <= end for start, end in state_ranges_list)
-                except ValueError:
-                    # For non-numeric postcodes, return False
-                    return False
-            
-            # Create a mask for included states
-            mask = pd.Series(False, index=postcode_gdf.index)
-            for state in includedStates:
-                if state in state_ranges:
-                    state_mask = postcode_gdf['postcode'].apply(
-                        lambda x: is_in_state_ranges(x, state_ranges[state])
-                    )
-                    mask |= state_mask
-            
-            # Apply the filter
-            postcode_gdf = postcode_gdf[mask]
-
-        # Simplify geometries
-        postcode_gdf.geometry = postcode_gdf.geometry.simplify(100, preserve_topology=True)
-        postcode_gdf = postcode_gdf[~postcode_gdf.geometry.is_empty]
+            # Filter postcodes using the compiled range lookup
+            postcode_gdf = postcode_gdf[postcodes_in_states(postcode_gdf['postcode'], includedStates, self.postcode_ranges)]
+
+        # Keep only the level of detail suited to the extent of the included states
+        postcode_gdf = select_level(postcode_gdf)
         
         return postcode_gdf
 
     def _load_electoral_data(self, includedStates: list[str]) -> gpd.GeoDataFrame:
         """Load and prepare electoral district spatial data."""
-        electoral_gdf = gpd.read_file(self.config['path'])
-        electoral_gdf = electoral_gdf.to_crs('EPSG:7855')
+        electoral_gdf = load_boundary_pyramid(self.config['path'], crs='EPSG:7855')
         
         # Filter for specified states
         electoral_gdf = electoral_gdf[electoral_gdf[self.config['state_column']].isin(includedStates)]
         
-        # Simplify geometries
-        electoral_gdf.geometry = electoral_gdf.geometry.simplify(100, preserve_topology=True)
-        electoral_gdf = electoral_gdf[~electoral_gdf.geometry.is_empty]
-        
-        return electoral_gdf
+        return select_level(electoral_gdf)
 
     def _load_state_data(self, includedStates: list[str]) -> gpd.GeoDataFrame:
-        state_gdf = gpd.read_file(self.config['path'])
-        state_gdf = state_gdf.to_crs('EPSG:7855')
+        state_gdf = load_boundary_pyramid(self.config['path'], crs='EPSG:7855')
         state_gdf = state_gdf[state_gdf[self.config['name_column']].isin(includedStates)]
-        state_gdf.geometry = state_gdf.geometry.simplify(100, preserve_topology=True)
-        state_gdf = state_gdf[~state_gdf.geometry.is_empty]
-        return state_gdf
+        return select_level(state_gdf)
 
-    def _create_color_map(self, column: str, data: gpd.GeoDataFrame, is_percentage: bool = False) -> cm.LinearColormap:
+    def process_sales_data(self, sales_by_year: dict[str, pd.DataFrame], dataset_key=None) -> gpd.GeoDataFrame:
         """
-        Create a color map for the choropleth visualization.
-        
+        Process and merge sales data with spatial data.
+
         Args:
-            column: Column name to create color map for
-            data: GeoDataFrame containing the data
-            is_percentage: Whether the data represents percentage changes
+            sales_by_year: Postcode sales ('postcode' and 'sales' columns) keyed by year, e.g. {'2023': ..., '2024': ...}.
+                Growth metrics compare the last two years; 'sales_cagr' spans every year.
+            dataset_key: A hashable identifier of the sales files (e.g. their paths, sizes and modification times),
+                under which a long-lived process caches the growth metrics. They are computed afresh when omitted.
         """
-        if is_percentage:
-            # For percentage changes, create a symmetric scale around zero
-            max_abs_value = max(abs(data[column].min()), abs(data[column].max()))
-            vmin = -max_abs_value
-            vmax = max_abs_value
-             # Use Matplotlib's diverging colormap
-            mpl_cmap = plt.get_cmap('RdYlGn')  # Or other colormaps like 'coolwarm', 'seismic'
-            colors = [mpl_cmap(i) for i in range(mpl_cmap.N)]  # Discrete color steps from Matplotlib
-
-            caption = f'{column.replace("_", " ").title()} (%)'
-        else:
-            # For absolute values, use regular min/max
-            vmin = data[column].min()
-            vmax = data[column].max()
-            # Sequential color scheme for absolute values
-            mpl_cmap = plt.get_cmap('Blues')  # Or other colormaps like 'coolwarm', 'seismic'
-            colors = [mpl_cmap(i) for i in range(mpl_cmap.N)]  # Discrete color steps from Matplotlib
-            caption = f'{column.replace("_", " ").title()} ($)'
-        
-        return cm.LinearColormap(colors=colors, vmin=vmin, vmax=vmax, caption=caption)
-        
-    def process_sales_data(self, sales_2023: pd.DataFrame, sales_2024: pd.DataFrame) -> gpd.GeoDataFrame:
-        """Process and merge sales data with spatial data."""
-        # Clean and prepare sales data for each year
-        def clean_sales_data(df: pd.DataFrame, year: str) -> pd.DataFrame:
-            df = df.copy()
-            df['postcode'] = df['postcode'].astype(str).str.zfill(4)
-            df = df.rename(columns={'sales': f'sales_{year}'})
-            return df[[f'sales_{year}', 'postcode']]
-
-        # Prepare sales data
-        sales_2023_clean = clean_sales_data(sales_2023, '2023')
-        sales_2024_clean = clean_sales_data(sales_2024, '2024')
-
-        # Merge sales data
-        merged_sales = pd.merge(sales_2023_clean, sales_2024_clean, on='postcode', how='outer')
-        merged_sales = merged_sales.fillna(0)
-
-        # Calculate basic metrics
-        merged_sales['total_sales'] = merged_sales['sales_2023'] + merged_sales['sales_2024']
-        total_market_sales = merged_sales['total_sales'].sum()
-        merged_sales['sales_weight'] = merged_sales['total_sales'] / total_market_sales
+        if len(sales_by_year) < 2:
+            raise ValueError("At least two years of sales are required.")
+
+        self.years = sorted(sales_by_year)
+        years = pd.PeriodIndex(self.years, freq='Y')
+
+        # Build a postcode-by-year sales matrix
+        postcode_sales = [
+            df.assign(postcode=df['postcode'].astype(str).str.zfill(4)).groupby('postcode')['sales'].sum()
+            for df in (sales_by_year[year] for year in self.years)
+        ]
+        postcodes = pd.Index(sorted(set().union(*(sales.index for sales in postcode_sales))))
+        sales = SalesMatrix(
+            np.column_stack([year_sales.reindex(postcodes, fill_value=0).to_numpy(dtype=np.float64) for year_sales in postcode_sales]),
+            postcodes,
+            years
+        )
 
         if self.resolution == 'Postcode':
-            # Direct merge for postcode resolution
-            merged_gdf = self.postcode_gdf.merge(merged_sales, on='postcode', how='left')
+            # Align postcode sales to the postcode geometries, with zeros for postcodes without sales
+            merged_gdf = self.postcode_gdf.copy()
+            sales = sales.reindex(merged_gdf['postcode'])
         else:
-            # Spatial joining for resolution
-            # First merge sales data with postcode geometries
-            postcode_sales_gdf = self.postcode_gdf.merge(merged_sales, on='postcode', how='left')
-            
-            # Filter postcodes to resolution bounds
-            resolution_bounds = self.resolution_gdf.total_bounds
-            postcode_sales_gdf = postcode_sales_gdf[postcode_sales_gdf.geometry.intersects(
-                gpd.GeoDataFrame(geometry=[box(*resolution_bounds)], crs=self.resolution_gdf.crs).geometry[0]
-            )]
-            
-            # Create centroids for spatial join
-            postcode_sales_gdf['centroid'] = postcode_sales_gdf.geometry.centroid
-            postcode_sales_centroids = gpd.GeoDataFrame(postcode_sales_gdf, geometry='centroid')
-            
-            # Perform spatial join
-            resolution_data = gpd.sjoin(
-                postcode_sales_centroids, 
-                self.resolution_gdf, 
-                how='left', 
-                predicate='within'
-            )
-            
-            # Group by resolution and aggregate
-            merged_gdf = resolution_data.groupby(self.config['name_column']).agg({
-                'sales_2023': 'sum',
-                'sales_2024': 'sum',
-                'sales_weight': 'sum',
-                'postcode': 'count'
-            }).reset_index()
-            
-            # Merge back with electoral geometries
-            merged_gdf = self.resolution_gdf.merge(
-                merged_gdf, 
-                on=self.config['name_column'], 
-                how='left'
+            # Aggregate postcode sales to the resolution with the precomputed area-weighted crosswalk,
+            # which splits postcodes straddling a boundary between the regions they overlap. Regions are keyed
+            # by id, like the period pipeline, so both share one crosswalk; names are only shown
+            crosswalk = load_crosswalk(
+                self.POSTCODE_SHAPEFILE,
+                self.SHAPEFILE_CONFIGS['Postcode']['id_column'],
+                self.config['path'],
+                self.config['id_column']
             )
+            crosswalk = crosswalk.assign(region=crosswalk['region'].astype(str))
+            merged_gdf = self.resolution_gdf.copy()
+            region_ids = merged_gdf[self.config['id_column']].astype(str)
+            merged_gdf['postcode'] = region_ids.map(crosswalk.groupby('region').size()).fillna(0)
+            sales = sales.aggregate(crosswalk).reindex(region_ids)
+
+        # Compare the last two years, from metrics cached per dataset, resolution and states when the dataset is identified
+        if dataset_key is None:
+            metrics = compute_growth_metrics(sales)
+        else:
+            metrics = load_growth_metrics((self.resolution, tuple(self.includedStates), dataset_key), sales)
 
-        merged_gdf['sales_avg'] = (merged_gdf['sales_2024'] + merged_gdf['sales_2023']) / 2
-
-        # Calculate relative percentage change
-        merged_gdf['sales_pct_change'] = (
-            (merged_gdf['sales_2024'] - merged_gdf['sales_2023']) /
-            merged_gdf['sales_avg']
-        ).fillna(0) * 100  # Avoid division by zero
-
-        # Define alpha (controls weight emphasis)
-        alpha = 0.5
-
-        # Calculate weights based on average sales
-        merged_gdf['sales_weight'] = merged_gdf['sales_avg'] ** alpha
-
-        # Calculate weighted percentage change
-        merged_gdf['weighted_pct_change'] = (
-            merged_gdf['sales_pct_change'] * merged_gdf['sales_weight']
-        ).round(0) * 100
-
-        # Normalize the weighted percentage change by total weights
-        total_weight = merged_gdf['sales_weight'].sum()
-        merged_gdf['normalized_weighted_pct_change'] = (
-            merged_gdf['weighted_pct_change'] / total_weight
-        ).round(2)
-
-        # Fill NaN values for relevant columns
-        for col in ['sales_2023', 'sales_2024', 'sales_pct_change', 
-                    'weighted_pct_change', 'normalized_weighted_pct_change', 'sales_weight']:
-            merged_gdf[col] = merged_gdf[col].fillna(0)
+        for year, year_sales in zip(self.years, sales.values.T):
+            merged_gdf[f'sales_{year}'] = year_sales
+        merged_gdf['total_sales'] = sales.totals()
+        for metric in ['sales_avg', 'sales_pct_change', 'sales_weight', 'weighted_pct_change',
+                       'normalized_weighted_pct_change', 'yoy_pct_change', 'log_growth']:
+            merged_gdf[metric] = metrics[metric][:, -1]
+        merged_gdf['sales_cagr'] = metrics['cagr']
 
         return merged_gdf.to_crs('EPSG:4326')
 
-    def generate_map(self, merged_gdf: gpd.GeoDataFrame) -> folium.Map:
-        """Generate and save the interactive map visualization."""
+    def generate_map(self, merged_gdf: gpd.GeoDataFrame, output_html_path: str = None) -> folium.Map:
+        """
+        Generate and save the interactive map visualization.
+
+        Args:
+            merged_gdf: GeoDataFrame of regions merged with their sales data
+            output_html_path: Where to save the map. Default is a new uniquely named file under src/python/output
+        """
 
         # Calculate bounds for Australia view
         bounds = merged_gdf.geometry.total_bounds
@@ -288,34 +205,33 @@ class VisualisationMap:
         )
 
         # Create color maps
-        colormap_2023 = self._create_color_map('sales_2023', merged_gdf)
-        colormap_2024 = self._create_color_map('sales_2024', merged_gdf)
-        colormap_normal_change = self._create_color_map('sales_pct_change', merged_gdf, True)
-        colormap_weighted_change = self._create_color_map('normalized_weighted_pct_change', merged_gdf, True)
+        years = self.years
+        if years is None:
+            raise ValueError("Sales data must be processed with process_sales_data before generating the map.")
+        colormaps = {
+            **{f'sales_{year}': (f'{year} Sales', colorize(merged_gdf[f'sales_{year}'])) for year in years},
+            'normalized_weighted_pct_change': ('Weighted Sales YoY% Change', colorize(merged_gdf['normalized_weighted_pct_change'], True)),
+            'sales_pct_change': ('Normal Sales YoY% Change', colorize(merged_gdf['sales_pct_change'], True)),
+        }
 
         # Create feature groups for each layer
-        fg_2023 = folium.FeatureGroup(name='2023 Sales', show=False)
-        fg_2024 = folium.FeatureGroup(name='2024 Sales', show=False)
-        fg_weighted = folium.FeatureGroup(name='Weighted Sales YoY% Change', show=True)
-        fg_unweighted = folium.FeatureGroup(name='Normal Sales YoY% Change', show=False)
-        fg_tooltips = folium.FeatureGroup(name='Area Info', show=True, overlay=True)
+        fg_sales = folium.FeatureGroup(name='Sales', show=True)
         fg_stores = folium.FeatureGroup(name='Store Locations', show=True)
         fg_wholesale = folium.FeatureGroup(name='Wholesale Customers Locations', show=True)
 
-
-        # Setup tooltip fields based on resolution
+        # Setup tooltip fields based on resolution, showing the two years compared
+        year_fields = [f'sales_{year}' for year in years[-2:]]
+        year_aliases = [f'{year} Sales ($):' for year in years[-2:]]
         if self.resolution == 'Postcode':
             tooltip_fields = [
                 'postcode',
-                'sales_2023',
-                'sales_2024',
+                *year_fields,
                 'sales_pct_change',
                 'normalized_weighted_pct_change'
             ]
             tooltip_aliases = [
                 'Postcode:',
-                '2023 Sales ($):',
-                '2024 Sales ($):',
+                *year_aliases,
                 'Change (%):',
                 'Weighted Change (%):'
             ]
@@ -323,127 +239,51 @@ class VisualisationMap:
             tooltip_fields = [
                 self.config['name_column'],
                 self.config['state_column'],
-                'sales_2023',
-                'sales_2024',
+                *year_fields,
                 'sales_pct_change',
                 'normalized_weighted_pct_change'
             ]
             tooltip_aliases = [
                 'Electorate:',
                 'State:',
-                '2023 Sales ($):',
-                '2024 Sales ($):',
+                *year_aliases,
                 'Change (%):',
                 'Weighted Change (%):'
             ]
         elif self.resolution == 'State':
             tooltip_fields = [
                 self.config['name_column'],
-                'sales_2023',
-                'sales_2024',
+                *year_fields,
                 'sales_pct_change',
                 'normalized_weighted_pct_change'
             ]
             tooltip_aliases = [
                 'State:',
-                '2023 Sales ($):',
-                '2024 Sales ($):',
+                *year_aliases,
                 'Change (%):',
                 'Weighted Change (%):'
             ]
         elif self.resolution == 'National':
             tooltip_fields = [
                 self.config['name_column'],
-                'sales_2023',
-                'sales_2024',
+                *year_fields,
                 'sales_pct_change',
                 'normalized_weighted_pct_change'
             ]
             tooltip_aliases = [
                 'Country:',
-                '2023 Sales ($):',
-                '2024 Sales ($):',
+                *year_aliases,
                 'Change (%):',
                 'Weighted Change (%):'
             ]
 
-        # Function to get color based on value and colormap
-        def style_function_2023(feature):
-            sales_2023 = feature['properties'].get('sales_2023', 0)
-            value = sales_2023
-            return {
-                'fillColor': colormap_2023(value),
-                'color': 'black',
-                'weight': 1,
-                'fillOpacity': 0.7
-            }
-
-        def style_function_2024(feature):
-            sales_2024 = feature['properties'].get('sales_2024', 0)
-            value = sales_2024
-            return {
-                'fillColor': colormap_2024(value),
-                'color': 'black',
-                'weight': 1,
-                'fillOpacity': 0.7
-            }
-
-        def style_function_weighted(feature):
-            value = feature['properties']['normalized_weighted_pct_change']
-            return {
-                'fillColor': colormap_weighted_change(value),
-                'color': 'black',
-                'weight': 1,
-                'fillOpacity': 0.7
-            }
-        
-        def style_function_unweighted(feature):
-            value = feature['properties']['sales_pct_change']
-            return {
-                'fillColor': colormap_normal_change(value),
-                'color': 'black',
-                'weight': 1,
-                'fillOpacity': 0.7
-            }
-
-        # Add GeoJSON layers with custom styling
-        folium.GeoJson(
-            merged_gdf,
-            name='2023 Sales',
-            style_function=style_function_2023,
-            zoom_on_click=True
-        ).add_to(fg_2023)
-
-        folium.GeoJson(
-            merged_gdf,
-            name='2024 Sales',
-            style_function=style_function_2024,
-            zoom_on_click=True
-        ).add_to(fg_2024)
-
-        folium.GeoJson(
-            merged_gdf,
-            name='Weighted Change',
-            style_function=style_function_weighted,
-            zoom_on_click=True
-        ).add_to(fg_weighted)
-
-        folium.GeoJson(
-            merged_gdf,
-            name='Un-Weighted Change',
-            style_function=style_function_unweighted,
-            zoom_on_click=True
-        ).add_to(fg_unweighted)
-
-        # Add hover tooltips layer
-        folium.GeoJson(
-            merged_gdf,
-            style_function=lambda x: {
-                'fillColor': '#ffffff',
-                'color': '#000000',
-                'fillOpacity': 0.0,
-                'weight': 0.1
-            },
+        # Embed the geometry once, with only the tooltip fields as properties. The sales layers are
+        # switched in the browser by restyling this layer from per-feature colour arrays
+        indexed_gdf = index_features(merged_gdf, tooltip_fields)
+        sales_geojson = folium.GeoJson(
+            indexed_gdf,
+            name='Sales',
+            zoom_on_click=True,
             highlight_function=lambda x: {
                 'fillColor': '#000000',
                 'color': '#000000',
@@ -457,22 +297,27 @@ class VisualisationMap:
                     "font-size: 12px; padding: 10px;"),
                 localize=True
             )
-        ).add_to(fg_tooltips)
+        ).add_to(fg_sales)
+
+        layers = [
+            {
+                'name': name,
+                'fill_colors': fill_colors.tolist(),
+                'colors': [to_hex(color) for color in colormap.colors],
+                'vmin': float(colormap.vmin),
+                'vmax': float(colormap.vmax),
+                'caption': colormap.caption
+            }
+            for name, (fill_colors, colormap) in colormaps.values()
+        ]
 
         # Add all feature groups to map
-        fg_2023.add_to(m)
-        fg_2024.add_to(m)
-        fg_weighted.add_to(m)
-        fg_unweighted.add_to(m)
-        fg_tooltips.add_to(m)
+        fg_sales.add_to(m)
         fg_stores.add_to(m)  # Add the stores feature group to the map
         fg_wholesale.add_to(m)
 
-        # Add colormaps as legends
-        colormap_2023.add_to(m)
-        colormap_2024.add_to(m)
-        colormap_weighted_change.add_to(m)
-        colormap_normal_change.add_to(m)
+        # Add the layer switcher, which also shows the legend of the active layer
+        ChoroplethLayerSwitcher(sales_geojson, layers, active=len(years)).add_to(m)
 
         folium.plugins.Geocoder(
             position="bottomright",
@@ -493,7 +338,9 @@ class VisualisationMap:
         ).add_to(m)
 
         # Save the map
-        output_html_path = os.path.join(os.getcwd(), 'src\\python\\generated_map.html')
+        if output_html_path is None:
+            os.makedirs(OUTPUT_DIRECTORY, exist_ok=True)
+            output_html_path = os.path.join(OUTPUT_DIRECTORY, f'{uuid.uuid4().hex}.html')
         m.save(output_html_path)
         return output_html_path
     
@@ -522,13 +369,14 @@ if __name__ == "__main__":
         states = states.split(',') if isinstance(states, str) else states
 
         map = VisualisationMap(states, resolution)
-        sales_2023_path = os.path.join(BASE_PATH, 'data', 'sales2023copy.xlsx')
-        sales_2024_path = os.path.join(BASE_PATH, 'data', 'sales2024copy.xlsx')
+        sales_paths = {
+            '2023': os.path.join(BASE_PATH, 'data', 'sales2023copy.xlsx'),
+            '2024': os.path.join(BASE_PATH, 'data', 'sales2024copy.xlsx'),
+        }
 
-        sales_2023 = pd.read_excel(sales_2023_path)
-        sales_2024 = pd.read_excel(sales_2024_path)
+        sales_by_year = {year: pd.read_excel(sales_path) for year, sales_path in sales_paths.items()}
 
-        merged_gdf = map.process_sales_data(sales_2023, sales_2024)
+        merged_gdf = map.process_sales_data(sales_by_year)
 
         map_path = map.generate_map(merged_gdf)
         output = json.dumps({"map_html_path": map_path})
@@ -7,17 +7,26 @@ The steps taken are:
 """
 import geopandas as gpd
 import pandas as pd
+import shapely
 import os
 import folium
 from folium import LayerControl, plugins
+from folium.plugins import VectorGridProtobuf
 import json 
 from importlib import import_module
 import sys
-
-import branca.colormap as cm
-import matplotlib.pyplot as plt
+import uuid
 
 from geoframe_processor import generate_choropleth_gdf
+from topology_processor import build_topology, TOPOLOGY_OBJECT_NAME
+from tile_processor import generate_vector_tiles, VectorTileTooltip
+from color_processor import colorize
+from layer_switcher import ChoroplethLayerSwitcher, index_features
+from time_bucketing import ROLLING_SALES_COLUMN, PERIOD_CHANGE_COLUMN, PERIOD_COLUMNS_ATTR
+from matplotlib.colors import to_hex
+from progress_reporter import report_progress
+from instrumentation import instrumented_stage
+from output_directories import OUTPUT_DIRECTORY, TILES_DIRECTORY
 
 def load_config(config_path):
     # Add the directory containing the config file to Python path
@@ -36,46 +45,77 @@ def load_config(config_path):
     # Return the CONFIG dictionary
     return config_module.CONFIG
 
-def _create_color_map(column: str, data: gpd.GeoDataFrame, is_percentage: bool = False) -> cm.LinearColormap:
+def _round_coordinates(gdf: gpd.GeoDataFrame, precision: int) -> gpd.GeoDataFrame:
     """
-    Create a color map for the choropleth visualization.
-    
+    Snaps every vertex to a grid of a number of decimal places in one vectorised pass. Repeated vertices
+    and parts that collapse (e.g. islands smaller than the grid) are dropped and the geometries are kept
+    valid; regions that collapse entirely are dropped. Five places in degrees is about a metre.
+    """
+    geometries = shapely.set_precision(gdf.geometry.values, 10 ** -precision)
+    gdf = gdf.set_geometry(gpd.GeoSeries(geometries, index=gdf.index, crs=gdf.crs))
+    return gdf[~gdf.geometry.is_empty]
+
+@instrumented_stage('generate_map')
+def generate_map(
+    shapefile_resolution,
+    merged_gdf: gpd.GeoDataFrame,
+    config: json,
+    output_format: str = 'geojson',
+    topology_quantization: int = 100000,
+    topology_tolerance: float = 0.001,
+    tile_min_zoom: int = 4,
+    tile_max_zoom: int = 10,
+    coordinate_precision: int = 5,
+    output_html_path: str = None,
+    job_id: str = None
+) -> str:
+    """
+    Generate and save the interactive map visualization.
+
     Args:
-        column: Column name to create color map for
-        data: GeoDataFrame containing the data
-        is_percentage: Whether the data represents percentage changes
+        shapefile_resolution: The resolution of the regions in merged_gdf
+        merged_gdf: GeoDataFrame of regions merged with their sales data
+        config: Shapefile configuration for the resolution
+        output_format: How the regions are embedded in the HTML. 'geojson' embeds plain GeoJSON,
+            'topojson' embeds a TopoJSON topology whose shared borders are stored and simplified once,
+            'mvt' writes vector tiles to public/tiles and embeds only a tile layer that loads the visible tiles
+        topology_quantization: Number of quantized steps per axis used for TopoJSON coordinates
+        topology_tolerance: Simplification tolerance (in degrees) applied to the TopoJSON arcs
+        tile_min_zoom: Lowest zoom level to generate vector tiles for
+        tile_max_zoom: Highest zoom level to generate vector tiles for; the map overzooms beyond it
+        coordinate_precision: Decimal places kept in embedded GeoJSON coordinates (5 is about a metre),
+            or None to keep full precision. TopoJSON and vector tiles quantize coordinates themselves
+        output_html_path: Where to save the map. Default is <job_id>.html under src/python/output
+        job_id: Identifies this map's output files (the map and its vector tiles), so concurrent maps
+            never write to the same paths. Default is a new random id
     """
-    if is_percentage:
-        # For percentage changes, create a symmetric scale around zero
-        max_abs_value = max(abs(data[column].min()), abs(data[column].max()))
-        vmin = -max_abs_value
-        vmax = max_abs_value
-            # Use Matplotlib's diverging colormap
-        mpl_cmap = plt.get_cmap('RdYlGn')  # Or other colormaps like 'coolwarm', 'seismic'
-        colors = [mpl_cmap(i) for i in range(mpl_cmap.N)]  # Discrete color steps from Matplotlib
-
-        caption = f'{column.replace("_", " ").title()} (%)'
-    else:
-        # For absolute values, use regular min/max
-        vmin = data[column].min()
-        vmax = data[column].max()
-        # Sequential color scheme for absolute values
-        mpl_cmap = plt.get_cmap('Blues')  # Or other colormaps like 'coolwarm', 'seismic'
-        colors = [mpl_cmap(i) for i in range(mpl_cmap.N)]  # Discrete color steps from Matplotlib
-        caption = f'{column.replace("_", " ").title()} ($)'
-    
-    return cm.LinearColormap(colors=colors, vmin=vmin, vmax=vmax, caption=caption)
+    if job_id is None:
+        job_id = uuid.uuid4().hex
+    # Ids become file names, so never let them escape the output directories
+    job_id = os.path.basename(str(job_id))
+
+    valid_output_formats = ['geojson', 'topojson', 'mvt']
+    if output_format not in valid_output_formats:
+        raise ValueError(f"Invalid output format. Must be one of {valid_output_formats}")
 
-def generate_map(shapefile_resolution, merged_gdf: gpd.GeoDataFrame, config: json) -> str:
-    """Generate and save the interactive map visualization."""
+    if coordinate_precision is not None and coordinate_precision < 0:
+        raise ValueError(f"Invalid coordinate precision ({coordinate_precision}). Must be at least 0")
 
     if isinstance(merged_gdf, dict):
         merged_gdf = gpd.GeoDataFrame.from_features(merged_gdf["features"])
 
+    # The period sales columns, oldest first (see geoframe_processor.generate_choropleth_gdf)
+    period_columns = [column for column in merged_gdf.attrs.get(PERIOD_COLUMNS_ATTR, []) if column in merged_gdf.columns]
+
     if merged_gdf.crs.to_epsg() == 7855:
          # Reproject to EPSG:4326 (WGS84)
         merged_gdf = merged_gdf.to_crs(epsg=4326)
 
+    if output_format == 'geojson' and coordinate_precision is not None:
+        # Full float64 vertices are mostly digits no screen can show. Round before colouring, so regions
+        # that collapse are dropped from the colour arrays too and every feature keeps its own colour
+        merged_gdf = _round_coordinates(merged_gdf, coordinate_precision)
+
     # Calculate bounds for Australia view
     bounds = merged_gdf.geometry.total_bounds
     
@@ -94,113 +134,154 @@ def generate_map(shapefile_resolution, merged_gdf: gpd.GeoDataFrame, config: jso
         max_lon=bounds[2],
     )
 
-    # Create color maps
-    colormap = _create_color_map('total_sales', merged_gdf)
+    # The choropleth layers: sales of each kept period, the rolling sum and the change of the latest
+    # period, or the total over the date range when the frame has no periods. The latest period is shown first.
+    value_aliases = {column: f'{column} Sales ($):' for column in period_columns}
+    for column, alias in ((ROLLING_SALES_COLUMN, 'Rolling Sales ($):'), (PERIOD_CHANGE_COLUMN, 'Change on Previous Period ($):')):
+        if column in merged_gdf.columns:
+            value_aliases[column] = alias
+    if not value_aliases:
+        value_aliases = {'total_sales': 'Total Sales ($):'}
+    active_column = period_columns[-1] if period_columns else next(iter(value_aliases))
+
+    # Colour every region in one vectorised pass per layer
+    colormaps = {
+        column: colorize(
+            merged_gdf[column].rename(f'{column} Sales' if column in period_columns else column),
+            diverging=column == PERIOD_CHANGE_COLUMN
+        )
+        for column in value_aliases
+    }
+    fill_colors, colormap = colormaps[active_column]
+
     # Create feature groups for each layer
-    fg = folium.FeatureGroup(name='Total Sales', show=True)
-    fg_tooltips = folium.FeatureGroup(name='Area Info', show=True, overlay=True)
+    fg = folium.FeatureGroup(name='Sales', show=True)
 
     # Setup tooltip fields based on resolution
     if shapefile_resolution == 'Postcode':
-        tooltip_fields = [
-            'zip',
-            'total_sales'
-        ]
-        tooltip_aliases = [
-            'Postcode:',
-            'Total Sales($):'
-        ]    
-        columns_to_keep = ["zip", "total_sales", "geometry"]
+        identifier_fields = ['zip']
+        identifier_aliases = ['Postcode:']
 
     elif shapefile_resolution in ['StateElectorate', 'FederalElectorate']:
-        tooltip_fields = [
-            config['name_column'],
-            config['state_column'],
-            'total_sales'
-        ]
-        tooltip_aliases = [
-            'Electorate:',
-            'State:',
-            'Sales: $'
-        ]    
-        columns_to_keep = ["zip", "total_sales", "geometry"]
+        identifier_fields = [config['name_column'], config['state_column']]
+        identifier_aliases = ['Electorate:', 'State:']
 
     elif shapefile_resolution == 'State':
-        tooltip_fields = [
-            'province',
-            'total_sales'
-        ]
-        tooltip_aliases = [
-            'State:',
-            'Sales: $'
-        ]
-        columns_to_keep = ["province", "total_sales", "geometry"]
+        identifier_fields = ['province']
+        identifier_aliases = ['State:']
 
     elif shapefile_resolution == 'National':
-        tooltip_fields = [
-            config['name_column'],
-            'total_sales'
-        ]
-        tooltip_aliases = [
-            'Country:',
-            'Sales: $'
-        ]
-        columns_to_keep = ["country", "total_sales", "geometry"]
+        identifier_fields = ['country']
+        identifier_aliases = ['Country:']
 
+    value_fields = ['total_sales', *[column for column in value_aliases if column != 'total_sales']]
+    tooltip_fields = identifier_fields + value_fields
+    tooltip_aliases = identifier_aliases + ['Total Sales ($):'] + [value_aliases[column] for column in value_fields[1:]]
 
-    merged_gdf = merged_gdf[columns_to_keep]
+    # Only embed the properties the tooltip and style read, with sales to the cent
+    merged_gdf = merged_gdf[tooltip_fields + ['geometry']].assign(fill_color=fill_colors)
+    merged_gdf[value_fields] = merged_gdf[value_fields].round(2)
     
-    # Function to get color based on value and colormap
+    # Styles only read the precomputed colour
     def style_function(feature):
-        sales = feature['properties'].get('total_sales', 0)
-        value = sales
         return {
-            'fillColor': colormap(value),
+            'fillColor': feature['properties']['fill_color'],
             'color': 'black',
             'weight': 1,
             'fillOpacity': 0.7
         }
 
-    # Add GeoJSON layers with custom styling
-    folium.GeoJson(
-        merged_gdf,
-        name='Total Sales',
-        style_function=style_function,
-        zoom_on_click=True
-    ).add_to(fg)
-
-    print("Folium Layers Generated")
-
-    # Add hover tooltips layer
-    folium.GeoJson(
-        merged_gdf,
-        style_function=lambda x: {
-            'fillColor': '#ffffff',
-            'color': '#000000',
-            'fillOpacity': 0.0,
-            'weight': 0.1
-        },
-        highlight_function=lambda x: {
-            'fillColor': '#000000',
-            'color': '#000000',
-            'fillOpacity': 0.50,
-            'weight': 0.1
-        },
-        tooltip=folium.GeoJsonTooltip(
-            fields=tooltip_fields,
-            aliases=tooltip_aliases,
-            style=("background-color: white; color: #333333; font-family: arial; "
-                "font-size: 12px; padding: 10px;"),
-            localize=True
+    tooltip = folium.GeoJsonTooltip(
+        fields=tooltip_fields,
+        aliases=tooltip_aliases,
+        style=("background-color: white; color: #333333; font-family: arial; "
+            "font-size: 12px; padding: 10px;"),
+        localize=True
+    )
+
+    if output_format == 'mvt':
+        # Slice the regions into vector tiles served by the Express app, so the page only
+        # loads the tiles in view instead of embedding every region
+        layer_name = shapefile_resolution.lower()
+        generate_vector_tiles(
+            merged_gdf,
+            os.path.join(TILES_DIRECTORY, job_id),
+            min_zoom=tile_min_zoom,
+            max_zoom=tile_max_zoom,
+            layer_name=layer_name
+        )
+
+        vector_grid = VectorGridProtobuf(
+            f'/tiles/{job_id}/{{z}}/{{x}}/{{y}}.pbf',
+            name='Sales',
+            options=(
+                '{"interactive": true, "maxNativeZoom": %d, "vectorTileLayerStyles": {"%s": function (properties) {'
+                'return {"fill": true, "fillColor": properties.fill_color, "fillOpacity": 0.7, "color": "black", "weight": 1};'
+                '}}}' % (tile_max_zoom, layer_name)
+            )
         )
-    ).add_to(fg_tooltips)
+        VectorTileTooltip(tooltip_fields, tooltip_aliases).add_to(vector_grid)
+        vector_grid.add_to(fg)
+
+        report_progress('layers_generated', features=len(merged_gdf))
 
-    # Add all feature groups to map
-    fg.add_to(m)
-    fg_tooltips.add_to(m)
+        fg.add_to(m)
 
-    # Add colormaps as legends
-    colormap.add_to(m)
+        # Tiles carry a single colour, so only the latest period is drawn; the rest are in the tooltip
+        colormap.add_to(m)
+
+    elif output_format == 'topojson':
+        # Embed the regions once as a topology with shared, simplified arcs and quantized coordinates.
+        # The tooltip is attached to the styled layer so the topology is not embedded a second time.
+        topology = build_topology(merged_gdf, quantization=topology_quantization, simplify_tolerance=topology_tolerance)
+        folium.TopoJson(
+            topology,
+            object_path=f'objects.{TOPOLOGY_OBJECT_NAME}',
+            name='Sales',
+            style_function=style_function,
+            tooltip=tooltip
+        ).add_to(fg)
+
+        report_progress('layers_generated', features=len(merged_gdf))
+
+        fg.add_to(m)
+
+        # The topology is styled once, so only the latest period is drawn; the rest are in the tooltip
+        colormap.add_to(m)
+
+    else:
+        # Embed the geometry once; the period, rolling and change layers are switched in the browser
+        # by restyling it from per-feature colour arrays
+        sales_geojson = folium.GeoJson(
+            index_features(merged_gdf, tooltip_fields),
+            name='Sales',
+            zoom_on_click=True,
+            highlight_function=lambda x: {
+                'fillColor': '#000000',
+                'color': '#000000',
+                'fillOpacity': 0.50,
+                'weight': 0.1
+            },
+            tooltip=tooltip
+        ).add_to(fg)
+
+        report_progress('layers_generated', features=len(merged_gdf))
+
+        fg.add_to(m)
+
+        layers = [
+            {
+                'name': value_aliases[column].rstrip(':').replace(' ($)', ''),
+                'fill_colors': layer_colors.tolist(),
+                'colors': [to_hex(color) for color in layer_colormap.colors],
+                'vmin': float(layer_colormap.vmin),
+                'vmax': float(layer_colormap.vmax),
+                'caption': layer_colormap.caption
+            }
+            for column, (layer_colors, layer_colormap) in colormaps.items()
+        ]
+        # The layer switcher also shows the legend of the active layer
+        ChoroplethLayerSwitcher(sales_geojson, layers, active=list(colormaps).index(active_column)).add_to(m)
 
     folium.plugins.Geocoder(
         position="bottomright",
@@ -223,9 +304,11 @@ def generate_map(shapefile_resolution, merged_gdf: gpd.GeoDataFrame, config: jso
     ).add_to(m)
 
     # Save the map
-    output_html_path = os.path.join(os.getcwd(), 'src\\generated_map.html')
-    print("saving..")
+    if output_html_path is None:
+        os.makedirs(OUTPUT_DIRECTORY, exist_ok=True)
+        output_html_path = os.path.join(OUTPUT_DIRECTORY, f'{job_id}.html')
     m.save(output_html_path)
+    report_progress('saved', bytes=os.path.getsize(output_html_path))
     return output_html_path
 
 def validate_inputs(resolution: str, states: list[str], timeResolution: str, timeLength: int, startTime, endTime):
@@ -241,11 +324,11 @@ def validate_inputs(resolution: str, states: list[str], timeResolution: str, tim
             raise ValueError(f"Invalid state ({state}). Must be one of {valid_states}")
         
     valid_time_resolutions = {"Month":6, "Quarter":8, "Year":5}
-    if valid_time_resolutions[time_resolution] is None:
+    if valid_time_resolutions.get(timeResolution) is None:
         raise ValueError(f"Invalid time resolution ({timeResolution}). Must be one of {valid_time_resolutions}")
     
-    if timeLength > valid_time_resolutions[time_resolution]:
-        raise ValueError(f"Invalid time length for the selected time resolutiom. Time length must be less than {valid_time_resolutions[resolution] + 1}")
+    if timeLength > valid_time_resolutions[timeResolution]:
+        raise ValueError(f"Invalid time length for the selected time resolutiom. Time length must be less than {valid_time_resolutions[timeResolution] + 1}")
     
     if endTime <= startTime:
         raise ValueError(f"Invalid start and end times. Start time must be before end time")
@@ -0,0 +1,198 @@
+"""
+A long-lived map generation worker. Rather than starting a new interpreter (and re-importing
+geopandas, folium and matplotlib) for every map, the Express server keeps a small pool of these
+workers running and sends them jobs over a JSON-lines protocol:
+
+    stdin:  {"id": "...", "resolution": "Postcode", "states": ["Queensland"],
+             "yearly_sales_filepaths": {"2023": "...", "2024": "..."}}
+            {"id": "...", "resolution": "Postcode", "states": ["Queensland"],
+             "start_date": "2023-01-01", "end_date": "2023-12-31", "sales_data_filepath": "...", ...}
+    stdout: {"id": "...", "event": "progress", "stage": "sales_processed", "elapsed": 0.42, "stage_elapsed": 0.42, ...}
+            {"id": "...", "map_html_path": "...", "elapsed": 1.23}
+            {"id": "...", "error": "..."}
+
+Jobs with 'yearly_sales_filepaths' build a year-on-year growth map from yearly postcode sales
+workbooks (see mapGenerator.VisualisationMap); other jobs build a period map from a transaction log
+(see map_processor). Progress lines are written as each pipeline stage finishes (see progress_reporter), with the time
+since the job started and since the previous stage. A {"ready": true} line is written once the
+worker has warmed up. Anything the pipeline prints
+is redirected to stderr so stdout only carries protocol messages.
+
+The pool already runs a worker per core, so each worker parses multi-file transaction logs
+sequentially unless MAP_WORKER_SALES_PROCESSES allows it more processes.
+"""
+import pandas as pd
+import contextlib
+import json
+import os
+import sys
+import time
+
+from map_processor import load_config, generate_map, validate_inputs
+from output_directories import OUTPUT_DIRECTORY
+from geoframe_processor import generate_choropleth_gdf
+from boundary_cache import load_boundary_pyramid
+from crosswalk_processor import load_crosswalk
+from progress_reporter import progress_reporting, report_progress
+from mapGenerator import VisualisationMap
+from instrumentation import metrics_labels
+
+BASE_PATH = os.path.dirname(os.path.abspath(__file__))
+# Processes each job may parse sales files with; more than one multiplies the pool's processes
+SALES_PROCESSES = int(os.environ.get('MAP_WORKER_SALES_PROCESSES', 1))
+
+def warm_up(config: dict) -> None:
+    """Loads every configured boundary pyramid and electorate crosswalk so the first job does not pay for them."""
+    for resolution_config in config.values():
+        shapefile_path = resolution_config.get('path') if isinstance(resolution_config, dict) else None
+        if shapefile_path and os.path.exists(shapefile_path):
+            load_boundary_pyramid(shapefile_path, crs='EPSG:7855')
+
+    postcode_config = config.get('Postcode', {})
+    for resolution in ('StateElectorate', 'FederalElectorate'):
+        resolution_config = config.get(resolution, {})
+        if os.path.exists(postcode_config.get('path', '')) and os.path.exists(resolution_config.get('path', '')):
+            load_crosswalk(postcode_config['path'], postcode_config['id_column'], resolution_config['path'], resolution_config['id_column'])
+
+def run_job(job: dict, configs: dict) -> dict:
+    """Generates a map for a single job, as a growth map if it has 'yearly_sales_filepaths' and a period map otherwise."""
+    if 'yearly_sales_filepaths' in job:
+        return run_growth_job(job)
+    return run_period_job(job, configs)
+
+def run_growth_job(job: dict) -> dict:
+    """
+    Generates a year-on-year growth map for a single job.
+
+    Parameters:
+        job (dict): The job parameters. 'resolution', 'states' and 'yearly_sales_filepaths' (the path of
+            each year's postcode sales workbook, keyed by year, at least two years) are required.
+
+    Returns:
+        dict: The protocol response, holding the saved map path.
+    """
+    sales_by_year = {}
+    sales_files = []
+    for year, sales_filepath in job['yearly_sales_filepaths'].items():
+        if not os.path.exists(sales_filepath):
+            raise FileNotFoundError(f"No sales data for {year}: '{sales_filepath}' does not exist.")
+        stat = os.stat(sales_filepath)
+        sales_files.append((str(year), os.path.abspath(sales_filepath), stat.st_size, stat.st_mtime_ns))
+        sales_by_year[str(year)] = pd.read_excel(sales_filepath)
+    report_progress('sales_processed', rows=sum(len(sales) for sales in sales_by_year.values()))
+
+    visualisation_map = VisualisationMap(job['states'], job['resolution'])
+    report_progress('shapefile_loaded')
+
+    # The worker outlives its jobs, so growth metrics are cached per sales file fingerprint
+    merged_gdf = visualisation_map.process_sales_data(sales_by_year, dataset_key=tuple(sorted(sales_files)))
+    report_progress('merged', features=len(merged_gdf))
+
+    # The job id names the map, so concurrent jobs never share output paths
+    output_html_path = os.path.join(OUTPUT_DIRECTORY, f"{os.path.basename(str(job['id']))}.html")
+    os.makedirs(OUTPUT_DIRECTORY, exist_ok=True)
+    map_path = visualisation_map.generate_map(merged_gdf, output_html_path=output_html_path)
+    report_progress('saved', bytes=os.path.getsize(map_path))
+
+    return {'map_html_path': map_path}
+
+def run_period_job(job: dict, configs: dict) -> dict:
+    """
+    Generates a period map from a transaction log for a single job.
+
+    Parameters:
+        job (dict): The job parameters. 'resolution', 'states', 'start_date', 'end_date' and 'sales_data_filepath'
+            (a path, glob pattern or list of them) are required; 'country', 'time_resolution', 'time_length' and
+            'output_format' are optional.
+        configs (dict): Loaded shapefile configs keyed by country.
+
+    Returns:
+        dict: The protocol response, holding the saved map path.
+    """
+    country = job.get('country', 'Australia')
+    if country not in configs:
+        configs[country] = load_config(os.path.join(BASE_PATH, 'shapefiles', country, 'config.py'))
+    config = configs[country]
+
+    resolution = job['resolution']
+    included_states = job['states']
+    time_resolution = job.get('time_resolution', 'Month')
+    time_length = int(job.get('time_length', 6))
+    start_date = pd.Timestamp(job['start_date'])
+    end_date = pd.Timestamp(job['end_date'])
+
+    validate_inputs(resolution, included_states, time_resolution, time_length, start_date, end_date)
+
+    gdf = generate_choropleth_gdf(
+        sales_data_filepath=job['sales_data_filepath'],
+        shapefile_country=country,
+        shapefile_resolution=resolution,
+        shapefile_config=config,
+        start_date=start_date,
+        end_date=end_date,
+        included_states=included_states,
+        time_resolution=time_resolution,
+        time_length=time_length,
+        max_workers=SALES_PROCESSES
+    )
+
+    # The job id names the map and any tiles, so concurrent jobs never share output paths
+    map_path = generate_map(
+        resolution,
+        gdf,
+        config[resolution],
+        output_format=job.get('output_format', 'geojson'),
+        job_id=job['id']
+    )
+
+    return {'map_html_path': map_path}
+
+def main() -> None:
+    protocol_output = sys.stdout
+
+    def respond(message: dict) -> None:
+        protocol_output.write(json.dumps(message) + '\n')
+        protocol_output.flush()
+
+    configs = {}
+    with contextlib.redirect_stdout(sys.stderr):
+        configs['Australia'] = load_config(os.path.join(BASE_PATH, 'shapefiles', 'Australia', 'config.py'))
+        warm_up(configs['Australia'])
+    respond({'ready': True, 'pid': os.getpid()})
+
+    for line in sys.stdin:
+        if not line.strip():
+            continue
+
+        job_id = None
+        started = time.perf_counter()
+        try:
+            job = json.loads(line)
+            job_id = job.get('id')
+            if not job_id:
+                raise ValueError("Job is missing an 'id'.")
+
+            stage_started = started
+
+            def report_stage(stage: str, details: dict) -> None:
+                nonlocal stage_started
+                now = time.perf_counter()
+                respond({
+                    'id': job_id,
+                    'event': 'progress',
+                    'stage': stage,
+                    'elapsed': round(now - started, 3),
+                    'stage_elapsed': round(now - stage_started, 3),
+                    **details
+                })
+                stage_started = now
+
+            with contextlib.redirect_stdout(sys.stderr), progress_reporting(report_stage), metrics_labels(job_id=job_id):
+                response = run_job(job, configs)
+            respond({'id': job_id, **response, 'elapsed': round(time.perf_counter() - started, 3)})
+
+        except Exception as e:
+            respond({'id': job_id, 'error': str(e), 'elapsed': round(time.perf_counter() - started, 3)})
+
+if __name__ == "__main__":
+    main()
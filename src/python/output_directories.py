@@ -0,0 +1,7 @@
+import os
+
+# Where the Python pipelines write generated maps and vector tiles. The Express server publishes
+# and sweeps these directories, so they are kept free of any rendering dependencies.
+BASE_PATH = os.path.dirname(os.path.abspath(__file__))
+OUTPUT_DIRECTORY = os.path.join(BASE_PATH, 'output')
+TILES_DIRECTORY = os.path.normpath(os.path.join(BASE_PATH, '..', '..', 'public', 'tiles'))
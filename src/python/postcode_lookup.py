@@ -0,0 +1,105 @@
+import numpy as np
+import pandas as pd
+import importlib.util
+import os
+from functools import lru_cache
+
+BASE_PATH = os.path.dirname(os.path.abspath(__file__))
+POSTCODE_COUNT = 10000
+UNKNOWN_STATE = 'Unknown'
+
+# Keys of 'postcode_ranges' that span several states rather than naming one
+AGGREGATE_REGIONS = {'Overall'}
+
+def load_postcode_ranges(country: str = 'Australia') -> dict:
+    """Returns the 'postcode_ranges' of a country's shapefile config."""
+    config_path = os.path.join(BASE_PATH, 'shapefiles', country, 'config.py')
+    spec = importlib.util.spec_from_file_location(f'{country.lower()}_config', config_path)
+    config_module = importlib.util.module_from_spec(spec)
+    spec.loader.exec_module(config_module)
+    return config_module.CONFIG['postcode_ranges']
+
+def _ranges_key(postcode_ranges: dict) -> tuple:
+    """Converts a postcode ranges dictionary into a hashable key for the compiled table caches."""
+    return tuple(
+        (state, tuple((int(start), int(end)) for start, end in ranges))
+        for state, ranges in postcode_ranges.items()
+    )
+
+@lru_cache(maxsize=None)
+def _compile_state_table(ranges_key: tuple) -> tuple[np.ndarray, np.ndarray]:
+    """
+    Compiles postcode ranges into an array indexed by postcode holding the index of its state.
+    Where ranges overlap, the state listed first wins. Postcodes outside every range hold the
+    index of UNKNOWN_STATE, which is the last entry of the returned state names.
+    """
+    states = [state for state, _ in ranges_key if state not in AGGREGATE_REGIONS]
+    state_names = np.array(states + [UNKNOWN_STATE], dtype=object)
+    table = np.full(POSTCODE_COUNT, len(states), dtype=np.int16)
+
+    # Fill in reverse so states listed earlier overwrite overlapping later ones
+    for state_index, state in reversed(list(enumerate(states))):
+        for start, end in dict(ranges_key)[state]:
+            table[max(start, 0):min(end, POSTCODE_COUNT - 1) + 1] = state_index
+
+    return table, state_names
+
+@lru_cache(maxsize=None)
+def _compile_membership_table(ranges_key: tuple, states: frozenset) -> np.ndarray:
+    """Compiles an array indexed by postcode that is True for postcodes inside the given states' ranges."""
+    table = np.zeros(POSTCODE_COUNT, dtype=bool)
+    for state, ranges in ranges_key:
+        if state in states:
+            for start, end in ranges:
+                table[max(start, 0):min(end, POSTCODE_COUNT - 1) + 1] = True
+    return table
+
+def to_postcode_numbers(postcodes) -> np.ndarray:
+    """
+    Converts a column of postcodes (strings or numbers) to integers in one vectorised pass.
+    Non-numeric or out of range postcodes are returned as -1.
+    """
+    numbers = pd.to_numeric(pd.Series(postcodes).astype(str).str.strip(), errors='coerce').to_numpy(dtype=float)
+    valid = (numbers >= 0) & (numbers < POSTCODE_COUNT) & (numbers == np.floor(numbers))
+    return np.where(valid, numbers, -1).astype(np.int64)
+
+def classify_postcodes(postcodes, postcode_ranges: dict) -> np.ndarray:
+    """
+    Maps a column of postcodes to the state each belongs to.
+
+    Parameters:
+        postcodes: An array-like of postcodes (strings or numbers).
+        postcode_ranges (dict): Mapping of state names to lists of inclusive (start, end) postcode ranges,
+            as in config.CONFIG['postcode_ranges'].
+
+    Returns:
+        np.ndarray: The state name of every postcode, or 'Unknown' where no range matches.
+    """
+    table, state_names = _compile_state_table(_ranges_key(postcode_ranges))
+    numbers = to_postcode_numbers(postcodes)
+
+    state_indexes = np.full(len(numbers), len(state_names) - 1, dtype=np.int16)
+    valid = numbers >= 0
+    state_indexes[valid] = table[numbers[valid]]
+    return state_names[state_indexes]
+
+def postcodes_in_states(postcodes, states: list[str], postcode_ranges: dict) -> np.ndarray:
+    """
+    Checks which postcodes in a column fall inside the postcode ranges of the given states.
+
+    Parameters:
+        postcodes: An array-like of postcodes (strings or numbers).
+        states (list[str]): The states (or aggregate regions such as 'Overall') to match against.
+        postcode_ranges (dict): Mapping of state names to lists of inclusive (start, end) postcode ranges,
+            as in config.CONFIG['postcode_ranges'].
+
+    Returns:
+        np.ndarray: A boolean mask, True where the postcode is inside one of the states' ranges.
+    """
+    table = _compile_membership_table(_ranges_key(postcode_ranges), frozenset(states))
+    numbers = to_postcode_numbers(postcodes)
+
+    mask = np.zeros(len(numbers), dtype=bool)
+    valid = numbers >= 0
+    mask[valid] = table[numbers[valid]]
+    return mask
@@ -0,0 +1,44 @@
+import contextlib
+from typing import Callable
+
+# The message printed for each pipeline stage when no reporter is installed
+STAGE_MESSAGES = {
+    'sales_processed': 'Sales Data Processed',
+    'shapefile_loaded': 'Shapefile Loaded',
+    'merged': 'Sales Merged',
+    'layers_generated': 'Folium Layers Generated',
+    'saved': 'Map Saved',
+}
+
+# The installed reporter, called with the stage name and any details
+_reporter = None
+
+def report_progress(stage: str, **details) -> None:
+    """
+    Reports that the pipeline has finished a stage. Stages are printed unless a reporter is installed
+    with progress_reporting, in which case they are passed to it instead.
+
+    Parameters:
+        stage (str): The stage just finished, e.g. 'sales_processed'.
+        **details: Any JSON serializable details of the stage (e.g. row counts).
+    """
+    if _reporter is None:
+        print(STAGE_MESSAGES.get(stage, stage))
+    else:
+        _reporter(stage, details)
+
+@contextlib.contextmanager
+def progress_reporting(reporter: Callable[[str, dict], None]):
+    """
+    Installs a reporter for the stages reported inside the with block.
+
+    Parameters:
+        reporter (Callable[[str, dict], None]): Called with the name and details of each finished stage.
+    """
+    global _reporter
+    previous_reporter = _reporter
+    _reporter = reporter
+    try:
+        yield
+    finally:
+        _reporter = previous_reporter
@@ -0,0 +1,175 @@
+import pandas as pd
+import json
+import os
+from atomic_file import write_atomically, is_temporary_file
+from transaction_store import (
+    store_directory,
+    load_manifest,
+    validate_transaction_columns
+)
+
+CUBE_PREFIX = 'sales_cube-'
+CUBE_MANIFEST_FILENAME = 'sales_cube.manifest.json'
+CUBE_INDEX_COLUMNS = ['zip', 'province', 'country']
+
+def _cube_filename(manifest: dict) -> str:
+    """Names the cube of a store revision, so a cube file is never rewritten once published."""
+    return f"{CUBE_PREFIX}{manifest['source_sha256'][:16]}-{manifest.get('revision', 0)}.parquet"
+
+def _aggregate_months(transactions: pd.DataFrame) -> pd.DataFrame:
+    """Aggregates transactions into total sales per (zip, province, country, month)."""
+    transactions = transactions.assign(month=transactions['created_at'].dt.to_period('M').dt.to_timestamp())
+    return (
+        transactions.groupby(CUBE_INDEX_COLUMNS + ['month'], as_index=False, observed=True)['total_price']
+        .sum()
+        .rename(columns={'total_price': 'total_sales'})
+    )
+
+def _aggregate_partitions(data_filepath: str, manifest: dict, month_labels: list[str]) -> pd.DataFrame:
+    """Re-aggregates the given month partitions of a transaction store into cube rows."""
+    directory = store_directory(data_filepath)
+
+    month_sales = []
+    for month_label in month_labels:
+        partition_path = os.path.join(directory, manifest['partitions'][month_label])
+        try:
+            transactions = pd.read_parquet(partition_path)
+        except Exception as e:
+            raise ValueError(f"Error reading transaction partition '{partition_path}': {e}")
+        validate_transaction_columns(transactions)
+        month_sales.append(_aggregate_months(transactions))
+
+    if not month_sales:
+        return pd.DataFrame(columns=CUBE_INDEX_COLUMNS + ['month', 'total_sales'])
+    return pd.concat(month_sales, ignore_index=True)
+
+def _write_json(path: str, contents: dict) -> None:
+    with open(path, 'w') as file:
+        json.dump(contents, file, indent=4)
+
+def _write_cube(data_filepath: str, cube: pd.DataFrame, manifest: dict) -> None:
+    """
+    Publishes the cube of a store revision: the cube file first and then the cube manifest pointing at it,
+    both through unique temporary files. Cubes of other revisions are removed once they are no longer listed.
+    """
+    directory = store_directory(data_filepath)
+    cube_filename = _cube_filename(manifest)
+
+    write_atomically(os.path.join(directory, cube_filename), lambda temporary_path: cube.to_parquet(temporary_path, index=False))
+    write_atomically(os.path.join(directory, CUBE_MANIFEST_FILENAME), lambda temporary_path: _write_json(temporary_path, {
+        'cube': cube_filename,
+        'source_sha256': manifest['source_sha256'],
+        'revision': manifest.get('revision', 0),
+        'row_count': len(cube)
+    }))
+
+    for filename in os.listdir(directory):
+        # Temporary files are other processes' writes in progress
+        if is_temporary_file(filename):
+            continue
+        if filename.startswith(CUBE_PREFIX) and filename != cube_filename:
+            try:
+                os.remove(os.path.join(directory, filename))
+            except FileNotFoundError:
+                # Another process removed it first
+                pass
+
+def build_sales_cube(data_filepath: str) -> pd.DataFrame:
+    """
+    Builds and persists a pre-aggregated sales cube for an Excel file of transactions. The cube holds
+    the total sales per (zip, province, country, month) and is stored next to the transaction store.
+
+    Parameters:
+        - data_filepath: A file path to an Excel file of transactions.
+
+    Returns:
+        - A pandas DataFrame with the columns 'zip', 'province', 'country', 'month' and 'total_sales'.
+    """
+    manifest = load_manifest(data_filepath)
+    cube = _aggregate_partitions(data_filepath, manifest, list(manifest['partitions']))
+    _write_cube(data_filepath, cube, manifest)
+    return cube
+
+def load_sales_cube(data_filepath: str) -> pd.DataFrame:
+    """
+    Loads the sales cube of an Excel file of transactions, building it first if it is missing or was
+    built from an older revision of the transaction store. When the store has only had batches appended
+    since (see transaction_store.append_transactions), only the months they fell into are re-aggregated
+    and the rest of the cube is kept as is.
+
+    Parameters:
+        - data_filepath: A file path to an Excel file of transactions.
+
+    Returns:
+        - A pandas DataFrame with the columns 'zip', 'province', 'country', 'month' and 'total_sales'.
+    """
+    manifest = load_manifest(data_filepath)
+    directory = store_directory(data_filepath)
+
+    try:
+        with open(os.path.join(directory, CUBE_MANIFEST_FILENAME), 'r') as file:
+            cube_manifest = json.load(file)
+    except (OSError, ValueError):
+        cube_manifest = {}
+
+    # Appends keep the source hash, so a cube of the same source knows which months it is missing
+    month_revisions = manifest.get('month_revisions', {})
+    cube_revision = cube_manifest.get('revision', 0)
+    is_same_source = (
+        'cube' in cube_manifest
+        and cube_manifest.get('source_sha256') == manifest['source_sha256']
+        and cube_revision <= manifest.get('revision', 0)
+    )
+    if not is_same_source or not set(manifest['partitions']) <= set(month_revisions):
+        return build_sales_cube(data_filepath)
+
+    cube_path = os.path.join(directory, cube_manifest['cube'])
+    try:
+        cube = pd.read_parquet(cube_path)
+    except FileNotFoundError:
+        # A newer revision's cube replaced it since the manifest was read
+        return build_sales_cube(data_filepath)
+    except Exception as e:
+        raise ValueError(f"Error reading sales cube '{cube_path}': {e}")
+
+    changed_months = [month_label for month_label, revision in month_revisions.items() if revision > cube_revision]
+    if changed_months:
+        changed_timestamps = [pd.Period(month_label, freq='M').to_timestamp() for month_label in changed_months]
+        cube = pd.concat([
+            cube[~cube['month'].isin(changed_timestamps)],
+            _aggregate_partitions(data_filepath, manifest, changed_months)
+        ], ignore_index=True).sort_values('month', kind='stable', ignore_index=True)
+        _write_cube(data_filepath, cube, manifest)
+
+    return cube
+
+def query_sales_cube(
+    data_filepath: str,
+    start_month: pd.Period,
+    end_month: pd.Period,
+    index_columns: list[str],
+    provinces: list[str] = None
+) -> pd.Series:
+    """
+    Slices the sales cube of an Excel file to a range of whole months and rolls it up to the
+    requested index columns.
+
+    Parameters:
+        - data_filepath: A file path to an Excel file of transactions.
+        - start_month: The first month to include.
+        - end_month: The last month to include.
+        - index_columns: The columns to group by, a subset of 'zip', 'province' and 'country'.
+        - provinces: Optional list of provinces to include. Default is None (include all provinces).
+
+    Returns:
+        - A pandas Series of total sales indexed by the index columns and 'month' (as monthly periods).
+    """
+    cube = load_sales_cube(data_filepath)
+
+    mask = (cube['month'] >= start_month.to_timestamp()) & (cube['month'] <= end_month.to_timestamp())
+    if provinces:
+        mask &= cube['province'].isin(provinces)
+    cube = cube[mask]
+
+    months = cube['month'].dt.to_period('M')
+    return cube.groupby(index_columns + [months], observed=True)['total_sales'].sum()
@@ -0,0 +1,98 @@
+import pandas as pd
+import numpy as np
+from time_bucketing import bucket_periods, period_labels
+from crosswalk_processor import crosswalk_weights
+
+class SalesMatrix:
+    """
+    Sales as a dense region-by-period array: a contiguous float64 array with one row per region and one
+    column per period, alongside the region ids and periods labelling its rows and columns. Resampling,
+    aggregation to other regions and alignment to geometries all work on the array; a labelled DataFrame
+    is only built at the rendering edge with to_frame.
+    """
+
+    def __init__(self, values: np.ndarray, region_ids, periods: pd.PeriodIndex) -> None:
+        """
+        Initialize the matrix.
+
+        Args:
+            values: 2D array of sales, one row per region and one column per period
+            region_ids: The unique id of each row's region
+            periods: The period of each column, in ascending order
+        """
+        self.values = np.ascontiguousarray(values, dtype=np.float64)
+        self.region_ids = pd.Index(region_ids)
+        self.periods = pd.PeriodIndex(periods)
+
+        if self.values.shape != (len(self.region_ids), len(self.periods)):
+            raise ValueError(
+                f"Sales values of shape {self.values.shape} do not match {len(self.region_ids)} regions "
+                f"and {len(self.periods)} periods."
+            )
+        if not self.region_ids.is_unique:
+            raise ValueError("Region ids must be unique.")
+
+    def __len__(self) -> int:
+        return len(self.region_ids)
+
+    @classmethod
+    def from_totals(cls, region_ids, months, totals, start_date: pd.Timestamp, end_date: pd.Timestamp) -> 'SalesMatrix':
+        """
+        Builds a monthly matrix from (region, month, total) triples, e.g. the levels and values of a grouped
+        sales Series. Every month between the start and end dates gets a column; totals outside them are dropped.
+
+        Args:
+            region_ids: The region of each total
+            months: The month (Period) of each total
+            totals: The sales totals
+            start_date: The first day of the first month
+            end_date: A day of the last month
+        """
+        month_range = pd.period_range(pd.Period(start_date, freq='M'), pd.Period(end_date, freq='M'), freq='M')
+        region_codes, unique_region_ids = pd.factorize(np.asarray(region_ids))
+        month_positions = pd.PeriodIndex(months, freq='M').asi8 - month_range[0].ordinal
+
+        inside = (month_positions >= 0) & (month_positions < len(month_range))
+        values = np.zeros((len(unique_region_ids), len(month_range)), dtype=np.float64)
+        np.add.at(values, (region_codes[inside], month_positions[inside]), np.asarray(totals, dtype=np.float64)[inside])
+
+        return cls(values, unique_region_ids, month_range)
+
+    def totals(self) -> np.ndarray:
+        """Returns the total sales of each region over every period."""
+        return self.values.sum(axis=1)
+
+    def resample(self, time_resolution: str, start_date: pd.Timestamp = None, end_date: pd.Timestamp = None) -> 'SalesMatrix':
+        """Returns the matrix with its monthly columns summed into Month, Quarter or Year periods (see time_bucketing)."""
+        values, periods = bucket_periods(self.values, self.periods, time_resolution, start_date, end_date)
+        return SalesMatrix(values, self.region_ids, periods)
+
+    def last_periods(self, count: int) -> 'SalesMatrix':
+        """Returns the matrix with only its most recent count periods."""
+        kept = slice(max(len(self.periods) - count, 0), len(self.periods))
+        return SalesMatrix(self.values[:, kept], self.region_ids, self.periods[kept])
+
+    def reindex(self, region_ids) -> 'SalesMatrix':
+        """
+        Returns the rows of the given regions, in their order, with zeros for regions without sales. Used
+        to align sales to geometries by position instead of merging and filling a DataFrame.
+        """
+        region_ids = pd.Index(region_ids)
+        rows = self.region_ids.get_indexer(region_ids)
+        found = rows >= 0
+
+        values = np.zeros((len(region_ids), len(self.periods)), dtype=np.float64)
+        values[found] = self.values[rows[found]]
+        return SalesMatrix(values, region_ids, self.periods)
+
+    def aggregate(self, crosswalk: pd.DataFrame) -> 'SalesMatrix':
+        """
+        Aggregates a postcode matrix to the regions of a crosswalk (see crosswalk_processor.load_crosswalk)
+        with a sparse matrix multiply. Postcodes missing from the crosswalk are dropped.
+        """
+        weights, postcodes, regions = crosswalk_weights(crosswalk)
+        return SalesMatrix(weights @ self.reindex(postcodes).values, regions, self.periods)
+
+    def to_frame(self, time_resolution: str = 'Month') -> pd.DataFrame:
+        """Returns the matrix as a DataFrame indexed by region id, with a column per period labelled as by period_labels."""
+        return pd.DataFrame(self.values, index=self.region_ids, columns=period_labels(self.periods, time_resolution))
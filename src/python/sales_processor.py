@@ -1,26 +1,118 @@
 import pandas as pd
 from datetime import date
+from concurrent.futures import ProcessPoolExecutor
+from functools import partial
 import os
+import warnings
+from transaction_store import read_transactions, iter_transaction_chunks, validate_transaction_columns, resolve_transaction_sources
+from sales_cube import query_sales_cube
+from spatial_index import RegionIndex, LATITUDE_COLUMN, LONGITUDE_COLUMN
+from instrumentation import instrumented_stage
+from sales_matrix import SalesMatrix
 
-def process_sales(data_filepath: str, start_date: date, end_date: date, resolution: str) -> pd.DataFrame:
+@instrumented_stage('process_sales')
+def process_sales(data_filepath: str | list[str], start_date: date, end_date: date, resolution: str, provinces: list[str] = None, 
+                  chunk_size: int = None, region_index: RegionIndex = None, max_workers: int = None) -> pd.DataFrame:
     """
-    Process an Excel file containing raw transaction logs and produces a pandas DataFrame 
+    Process Excel, CSV or Parquet files containing raw transaction logs and produces a pandas DataFrame 
     with either postcodes or provinces as indexes and months as columns. Data cells contain 
-    the total sales for that month.
+    the total sales for that month. Each file is ingested once into a month partitioned 
+    Parquet store (see transaction_store) and pre-aggregated into a monthly sales cube 
+    (see sales_cube), so whole months are answered from the cube and only partial edge 
+    months are read from the raw transactions. When there are several files (e.g. one 
+    per month or per store), each is parsed and aggregated in its own process and the 
+    (region, month) totals of every file are summed.
 
     Parameters:
-        - data_filepath: A file path to an Excel file of transactions. The Excel file must have 
-          the headers: 'created_at', 'zip', 'province', 'country', 'total_price'.
+        - data_filepath: A file path or glob pattern (e.g. 'data/sales-*.xlsx') of Excel, CSV or 
+          Parquet files of transactions, or a list of them. The files must have the headers: 
+          'created_at', 'zip', 'province', 'country', 'total_price', and are read with the declared 
+          schema of transaction_store (ISO 8601 'created_at').
         - start_date: A date object representing the start of the analysis period (inclusive).
         - end_date: A date object representing the end of the analysis period (inclusive).
         - resolution: Determines the level of aggregation ('State' groups by province, otherwise by zip).
+        - provinces: Optional list of provinces to include. Default is None (include all provinces).
+        - chunk_size: Optional number of rows to read at a time. When given, the source file (Excel, 
+          CSV or Parquet) is streamed in chunks instead of read through the store, so logs larger 
+          than memory can be processed. Default is None (read through the store).
+        - region_index: Optional index of region boundaries (see spatial_index.load_region_index). When 
+          given, transactions are assigned to regions from their 'latitude' and 'longitude' columns 
+          and aggregated by 'region_id' instead of by zip or province. Default is None.
+        - max_workers: Optional maximum number of processes parsing files at once. Default is None 
+          (one per CPU core, up to the number of files).
 
     Returns:
         - A pandas DataFrame with postcodes or provinces as indexes and months between the start 
           and end dates as columns, containing total sales for each period.
     """
-    if not os.path.exists(data_filepath):
-        raise FileNotFoundError(f"The file '{data_filepath}' does not exist. Please check the file path.")
+    index_columns = _index_columns(resolution, region_index)
+    grouped_sales = _grouped_sales(data_filepath, start_date, end_date, provinces, index_columns, chunk_size, region_index, max_workers)
+
+    return _pivot_sales(grouped_sales, index_columns, start_date, end_date)
+
+@instrumented_stage('process_sales_matrix')
+def process_sales_matrix(data_filepath: str | list[str], start_date: date, end_date: date, resolution: str, provinces: list[str] = None, 
+                         chunk_size: int = None, region_index: RegionIndex = None, max_workers: int = None) -> SalesMatrix:
+    """
+    Processes transactions like process_sales, but returns the monthly sales as a SalesMatrix rather than 
+    a wide DataFrame, so they can be resampled, aggregated and aligned to geometries as a single array.
+    Months are kept as process_sales keeps them: a first month that starts before the start date is 
+    dropped, while a last month that ends after the end date is kept with the sales up to the end date.
+
+    Parameters:
+        The same as process_sales.
+
+    Returns:
+        - A SalesMatrix with a row per postcode (4-digit strings), province (for the 'State' resolution) 
+          or coordinate based region, and a column per month from the first month starting on or after 
+          the start date to the month of the end date.
+    """
+    start_timestamp = pd.Timestamp(start_date)
+    first_month = start_timestamp.to_period('M')
+    if start_timestamp > first_month.start_time:
+        first_month += 1
+    if first_month > pd.Timestamp(end_date).to_period('M'):
+        raise ValueError("The date range must include the first day of at least one month.")
+
+    index_columns = _index_columns(resolution, region_index)
+    grouped_sales = _grouped_sales(data_filepath, start_date, end_date, provinces, index_columns, chunk_size, region_index, max_workers)
+
+    region_ids = grouped_sales.index.get_level_values(index_columns[0]).astype(str)
+    if index_columns[0] == 'zip':
+        region_ids = region_ids.str.zfill(4)
+
+    return SalesMatrix.from_totals(
+        region_ids,
+        grouped_sales.index.get_level_values('month'),
+        grouped_sales.to_numpy(),
+        first_month.start_time,
+        pd.Timestamp(end_date)
+    )
+
+def _index_columns(resolution: str, region_index: RegionIndex) -> list[str]:
+    """Returns the columns transactions are grouped by for a resolution."""
+    if region_index is not None:
+        return ['region_id']
+    elif resolution == 'State':
+        return ['province', 'country']
+    return ['zip', 'province', 'country']
+
+def _grouped_sales(
+    data_filepath: str | list[str],
+    start_date: date,
+    end_date: date,
+    provinces: list[str],
+    index_columns: list[str],
+    chunk_size: int,
+    region_index: RegionIndex,
+    max_workers: int = None
+) -> pd.Series:
+    """
+    Validates the arguments of process_sales and returns the (region, month) sales totals of every source.
+    Sources are aggregated independently, in parallel when there are several, and their partial totals
+    are then summed.
+    """
+    sources = resolve_transaction_sources(data_filepath)
 
     if not isinstance(start_date, date) or not isinstance(end_date, date):
         raise TypeError("Both 'start_date' and 'end_date' must be instances of 'datetime.date'.")
@@ -28,40 +120,168 @@ def process_sales(data_filepath: str, start_date: date, end_date: date, resoluti
     if start_date > end_date:
         raise ValueError("The 'start_date' must not be later than the 'end_date'.")
 
-    try:
-        transactions = pd.read_excel(data_filepath, parse_dates=['created_at'])
-        transactions['created_at'] = pd.to_datetime(transactions['created_at'], format='mixed')
-    except Exception as e:
-        raise ValueError(f"Error reading Excel file: {e}")
-
-    required_columns = {'created_at', 'zip', 'province', 'country', 'total_price'}
-    missing_columns = required_columns - set(transactions.columns)
-    if missing_columns:
-        raise ValueError(f"The Excel file is missing required columns: {missing_columns}. Expected columns are: {required_columns}.")
+    aggregate_source = partial(
+        _source_grouped_sales,
+        start_date=start_date,
+        end_date=end_date,
+        provinces=provinces,
+        index_columns=index_columns,
+        chunk_size=chunk_size,
+        region_index=region_index
+    )
 
-    # Filter transactions within the date range
-    mask = (transactions['created_at'] >= pd.Timestamp(start_date)) & (transactions['created_at'] <= pd.Timestamp(end_date))
-    filtered_transactions = transactions[mask]
+    worker_count = min(max_workers or os.cpu_count() or 1, len(sources))
+    if worker_count > 1:
+        with ProcessPoolExecutor(max_workers=worker_count) as executor:
+            source_sales = list(executor.map(aggregate_source, sources))
+    else:
+        source_sales = [aggregate_source(source) for source in sources]
 
-    if filtered_transactions.empty:
+    source_sales = [sales for sales in source_sales if not sales.empty]
+    if not source_sales:
         raise ValueError("No transactions found in the specified date range.")
+    elif len(source_sales) == 1:
+        return source_sales[0]
 
-    # Extract the month from created_at
-    filtered_transactions['month'] = filtered_transactions['created_at'].dt.to_period('M')
+    return pd.concat(source_sales).groupby(level=list(range(len(index_columns) + 1)), observed=True).sum()
 
-    # Define grouping level
-    if resolution == 'State':
-        index_columns = ['province', 'country']
-    else:
-        index_columns = ['zip', 'province', 'country']
+def _source_grouped_sales(
+    data_filepath: str,
+    start_date: date,
+    end_date: date,
+    provinces: list[str],
+    index_columns: list[str],
+    chunk_size: int,
+    region_index: RegionIndex
+) -> pd.Series:
+    """Returns the (region, month) sales totals of a single source, which are empty if it has no transactions in range."""
+    if chunk_size:
+        # Fold bounded chunks of the source into running (region, month) totals
+        return _stream_grouped_sales(data_filepath, start_date, end_date, provinces, index_columns, chunk_size, region_index)
+    elif region_index is not None:
+        # The cube is keyed by zip, so coordinate based regions are aggregated from the raw transactions
+        transactions = read_transactions(data_filepath, start_date, end_date, provinces)
+        validate_transaction_columns(transactions)
+        if transactions.empty:
+            return _empty_sales()
+        return _group_sales(_assign_regions(transactions, region_index), index_columns)
 
-    # Group by selected index columns and month, then sum total sales
-    grouped_sales = (
-        filtered_transactions.groupby(index_columns + ['month'], as_index=False)['total_price']
-        .sum()
-        .rename(columns={'total_price': 'total_sales'})
+    return _cube_grouped_sales(data_filepath, start_date, end_date, provinces, index_columns)
+
+def _cube_grouped_sales(
+    data_filepath: str,
+    start_date: date,
+    end_date: date,
+    provinces: list[str],
+    index_columns: list[str]
+) -> pd.Series:
+    """
+    Answers (region, month) sales totals from the pre-aggregated sales cube. Months that are only
+    partly inside the analysis period cannot be answered from monthly totals, so those edge months
+    are aggregated from the raw transactions of their partitions instead.
+    """
+    start_timestamp = pd.Timestamp(start_date)
+    end_timestamp = pd.Timestamp(end_date)
+    start_month = start_timestamp.to_period('M')
+    end_month = end_timestamp.to_period('M')
+
+    # Whole months covered by the analysis period
+    first_full_month = start_month if start_timestamp == start_month.start_time else start_month + 1
+    last_full_month = end_month if end_timestamp >= end_month.end_time else end_month - 1
+
+    month_sales = []
+    if first_full_month <= last_full_month:
+        month_sales.append(query_sales_cube(data_filepath, first_full_month, last_full_month, index_columns, provinces))
+
+    edge_months = {month for month in (start_month, end_month) if not first_full_month <= month <= last_full_month}
+    for month in sorted(edge_months):
+        transactions = read_transactions(
+            data_filepath,
+            max(start_timestamp, month.start_time),
+            min(end_timestamp, month.end_time),
+            provinces
+        )
+        validate_transaction_columns(transactions)
+        if not transactions.empty:
+            month_sales.append(_group_sales(transactions, index_columns))
+
+    month_sales = [sales for sales in month_sales if not sales.empty]
+    if not month_sales:
+        return _empty_sales()
+
+    return pd.concat(month_sales).groupby(level=list(range(len(index_columns) + 1)), observed=True).sum()
+
+def _group_sales(transactions: pd.DataFrame, index_columns: list[str]) -> pd.Series:
+    """Sums the total price of transactions per region and month."""
+    months = transactions['created_at'].dt.to_period('M').rename('month')
+    return transactions.groupby(index_columns + [months], observed=True)['total_price'].sum()
+
+def _empty_sales() -> pd.Series:
+    """Returns the totals of a source without transactions in range."""
+    return pd.Series(dtype='float64', name='total_price')
+
+def _assign_regions(transactions: pd.DataFrame, region_index: RegionIndex) -> pd.DataFrame:
+    """
+    Adds a 'region_id' column holding the region each transaction's coordinates fall in. Transactions
+    outside every region (or without coordinates) are dropped by the grouping, so they are reported with
+    a warning rather than lost silently.
+    """
+    missing_columns = {LATITUDE_COLUMN, LONGITUDE_COLUMN} - set(transactions.columns)
+    if missing_columns:
+        raise ValueError(f"Transactions must have {missing_columns} columns to be assigned to regions by coordinates.")
+
+    region_ids = region_index.assign(
+        transactions[LONGITUDE_COLUMN].to_numpy(dtype=float),
+        transactions[LATITUDE_COLUMN].to_numpy(dtype=float)
     )
 
+    unassigned = pd.isna(region_ids)
+    if unassigned.any():
+        warnings.warn(
+            f"{int(unassigned.sum())} of {len(transactions)} transactions "
+            f"({transactions['total_price'].to_numpy()[unassigned].sum():.2f} in sales) are outside every region "
+            "and are not mapped.",
+            stacklevel=2
+        )
+
+    return transactions.assign(region_id=region_ids)
+
+def _stream_grouped_sales(
+    data_filepath: str,
+    start_date: date,
+    end_date: date,
+    provinces: list[str],
+    index_columns: list[str],
+    chunk_size: int,
+    region_index: RegionIndex = None
+) -> pd.Series:
+    """
+    Reads the source file in chunks of at most chunk_size rows and folds each chunk into running
+    (region, month) totals, so memory use depends on the number of regions and months rather than
+    the number of transactions.
+    """
+    grouped_sales = None
+    for chunk in iter_transaction_chunks(data_filepath, chunk_size):
+        # Chunks are read with the declared schema, so 'created_at' is already parsed
+        mask = (chunk['created_at'] >= pd.Timestamp(start_date)) & (chunk['created_at'] <= pd.Timestamp(end_date))
+        if provinces:
+            mask &= chunk['province'].isin(provinces)
+        chunk = chunk[mask]
+        if chunk.empty:
+            continue
+
+        if region_index is not None:
+            chunk = _assign_regions(chunk, region_index)
+
+        chunk_sales = _group_sales(chunk, index_columns)
+        grouped_sales = chunk_sales if grouped_sales is None else grouped_sales.add(chunk_sales, fill_value=0)
+
+    return grouped_sales if grouped_sales is not None else _empty_sales()
+
+def _pivot_sales(grouped_sales: pd.Series, index_columns: list[str], start_date: date, end_date: date) -> pd.DataFrame:
+    """Pivots (region, month) sales totals into a DataFrame with months as columns."""
+    grouped_sales = grouped_sales.rename('total_sales').reset_index()
+
     # Pivot to make months the columns
     sales = grouped_sales.pivot_table(
         index=index_columns, 
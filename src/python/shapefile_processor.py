@@ -1,11 +1,16 @@
 import geopandas as gpd
 import pandas as pd
 import os
+from postcode_lookup import postcodes_in_states
+from boundary_cache import load_boundary_pyramid, select_level
+from instrumentation import instrumented_stage
 
 def international_shapefile_parser():
     pass
 
-def national_shapefile_parser(country: str, resolution: str, config: dict, included_states: list[str] = None) -> gpd.GeoDataFrame:
+@instrumented_stage('national_shapefile_parser')
+def national_shapefile_parser(country: str, resolution: str, config: dict, included_states: list[str] = None, 
+                              tolerance: float = None) -> gpd.GeoDataFrame:
     """
     Parses a shapefile for a specified country and resolution into a GeoPandas DataFrame.
 
@@ -14,6 +19,8 @@ def national_shapefile_parser(country: str, resolution: str, config: dict, inclu
         resolution (str): The resolution to parse. Options: 'Postcode', 'StateElectorate', 'FederalElectorate', 'State'.
         config (dict): Configuration dictionary specifying shapefile paths, columns, and other details.
         included_states (list[str], optional): List of states to include in the resulting GeoDataFrame. Default is None (include all states).
+        tolerance (float, optional): Simplification tolerance (in metres) of the level of detail to use. Must be one of 
+            boundary_cache.LOD_TOLERANCES. Default is None (pick the level that suits the bounds of the included states).
 
     Returns:
         gpd.GeoDataFrame: Parsed and filtered GeoDataFrame.
@@ -34,18 +41,8 @@ def national_shapefile_parser(country: str, resolution: str, config: dict, inclu
     if not shapefile_path or not os.path.exists(shapefile_path):
         raise FileNotFoundError(f"Shapefile path '{shapefile_path}' is invalid or does not exist.")
     
-    # Load shapefile
-    try:
-        gdf = gpd.read_file(shapefile_path)
-    except Exception as e:
-        raise ValueError(f"Failed to load shapefile '{shapefile_path}': {e}")
-    
-
-    # Project to GDA2020 CRS (EPSG:7855)
-    try:
-        gdf = gdf.to_crs('EPSG:7855')
-    except Exception as e:
-        raise ValueError(f"Failed to project GeoDataFrame to GDA2020 (EPSG:7855): {e}")
+    # Load the shapefile projected to GDA2020 CRS (EPSG:7855) at every level of detail, from the boundary cache if possible
+    gdf = load_boundary_pyramid(shapefile_path, crs='EPSG:7855')
 
     # Special handling for 'Postcode' resolution (range-based filtering)
     if resolution == 'Postcode' and included_states:
@@ -54,37 +51,22 @@ def national_shapefile_parser(country: str, resolution: str, config: dict, inclu
         if not state_ranges:
             raise ValueError(f"No postcode ranges defined for the included states: {included_states}.")
 
-        # Function to check if a postcode is in the valid range
-        def is_in_state_ranges(postcode: str, state_ranges_list: list[tuple]) -> bool:
-            try:
-                postcode_num = int(postcode)
-                return any(start <= postcode_num <= end for start, end in state_ranges_list)
-            except ValueError:
-                return False  # Handle non-numeric postcodes
-
-        # Filter postcodes using ranges
+        # Filter postcodes using the compiled range lookup
         gdf['postcode'] = gdf[resolution_config['id_column']].astype(str).str.zfill(4)
-        mask = pd.Series(False, index=gdf.index)
-        for state, ranges in state_ranges.items():
-            state_mask = gdf['postcode'].apply(lambda x: is_in_state_ranges(x, ranges))
-            mask |= state_mask
-        gdf = gdf[mask]
+        gdf = gdf[postcodes_in_states(gdf['postcode'], list(state_ranges), postcode_ranges)]
 
     # Apply filtering for specific states if provided
     elif included_states:
-        state_column = resolution_config.get('name_column')
+        # Electorates record their state in 'state_column'; the State shapefile is filtered on its own name
+        state_column = resolution_config.get('state_column', resolution_config.get('name_column'))
         if not state_column:
-            raise KeyError(f"State filtering is not supported for the '{resolution}' resolution (no 'id_column' in config).")
+            raise KeyError(f"State filtering is not supported for the '{resolution}' resolution (no 'state_column' in config).")
         if state_column not in gdf.columns:
             raise ValueError(f"'{state_column}' column not found in shapefile for state filtering.")
         
         gdf = gdf[gdf[state_column].isin(included_states)]
 
-    # Simplify geometries
-    try:
-        gdf.geometry = gdf.geometry.simplify(100, preserve_topology=True)
-        gdf = gdf[~gdf.geometry.is_empty]
-    except Exception as e:
-        raise ValueError(f"Error simplifying geometries: {e}")
+    # Keep only the level of detail suited to the extent of the included states
+    gdf = select_level(gdf, tolerance)
 
     return gdf
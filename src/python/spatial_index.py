@@ -0,0 +1,167 @@
+import numpy as np
+import shapely
+import pyarrow as pa
+import pyarrow.parquet as pq
+from pyproj import Transformer
+import hashlib
+import json
+import os
+from boundary_cache import load_boundaries, CACHE_DIRECTORY, LOD_TOLERANCES
+from atomic_file import write_atomically
+
+LATITUDE_COLUMN = 'latitude'
+LONGITUDE_COLUMN = 'longitude'
+DEFAULT_BATCH_SIZE = 1000000
+BOUNDS_COLUMNS = ['minx', 'miny', 'maxx', 'maxy']
+
+# Indexes already loaded by this process, keyed by cache path
+_loaded_indexes = {}
+
+class RegionIndex:
+    """
+    Point-in-polygon assignment of coordinates to regions. Candidate regions come from a Shapely STRtree
+    over the regions' bounding boxes, and are confirmed against the prepared region geometries. Points
+    are projected and queried in vectorised batches.
+    """
+
+    def __init__(self, region_ids: np.ndarray, geometries: np.ndarray, crs: str, bounds: np.ndarray = None) -> None:
+        """
+        Initialize the index over a set of regions.
+
+        Args:
+            region_ids: The id of each region
+            geometries: The boundary of each region, in the given CRS
+            crs: The CRS of the geometries
+            bounds: The (minx, miny, maxx, maxy) of each region, computed from the geometries if not given
+        """
+        self.region_ids = np.asarray(region_ids, dtype=object)
+        self.geometries = np.asarray(geometries)
+        self.crs = crs
+        self.bounds = np.asarray(bounds if bounds is not None else shapely.bounds(self.geometries), dtype=np.float64)
+        self._build()
+
+    def _build(self) -> None:
+        # Boxes are cheaper to index than the boundaries, and preparing the boundaries speeds up every later test
+        self.tree = shapely.STRtree(shapely.box(*self.bounds.T))
+        shapely.prepare(self.geometries)
+
+    def __getstate__(self) -> dict:
+        # The tree and transformer are rebuilt after unpickling, so only the regions are sent to other processes
+        state = self.__dict__.copy()
+        state.pop('_transformer', None)
+        state.pop('tree', None)
+        state['geometries'] = shapely.to_wkb(self.geometries)
+        return state
+
+    def __setstate__(self, state: dict) -> None:
+        self.__dict__.update(state)
+        self.geometries = shapely.from_wkb(self.geometries)
+        self._build()
+
+    @property
+    def transformer(self) -> Transformer:
+        if not hasattr(self, '_transformer'):
+            self._transformer = Transformer.from_crs('EPSG:4326', self.crs, always_xy=True)
+        return self._transformer
+
+    def assign(self, longitudes, latitudes, batch_size: int = DEFAULT_BATCH_SIZE) -> np.ndarray:
+        """
+        Finds the region containing each point.
+
+        Args:
+            longitudes: Longitudes of the points (WGS84)
+            latitudes: Latitudes of the points (WGS84)
+            batch_size: Number of points projected and queried at a time
+
+        Returns:
+            The region id of each point, or None where the point is outside every region
+        """
+        longitudes = np.asarray(longitudes, dtype=np.float64)
+        latitudes = np.asarray(latitudes, dtype=np.float64)
+        if longitudes.shape != latitudes.shape:
+            raise ValueError("Longitudes and latitudes must have the same length.")
+
+        assigned = np.full(len(longitudes), None, dtype=object)
+        for start in range(0, len(longitudes), batch_size):
+            end = start + batch_size
+            x, y = self.transformer.transform(longitudes[start:end], latitudes[start:end])
+            points = shapely.points(x, y)
+
+            # Candidates by bounding box, confirmed against the region boundaries
+            point_indexes, region_indexes = self.tree.query(points)
+            inside = shapely.intersects(self.geometries[region_indexes], points[point_indexes])
+            point_indexes, region_indexes = point_indexes[inside], region_indexes[inside]
+
+            # A point on a shared border intersects both regions; keep the first match
+            point_indexes, first_matches = np.unique(point_indexes, return_index=True)
+            assigned[start + point_indexes] = self.region_ids[region_indexes[first_matches]]
+
+        return assigned
+
+    def to_table(self) -> pa.Table:
+        """Returns the regions as an Arrow table of ids, WKB boundaries and bounds, as persisted by load_region_index."""
+        return pa.table({
+            'region_id': pa.array(self.region_ids, type=pa.string()),
+            'wkb': pa.array(shapely.to_wkb(self.geometries), type=pa.binary()),
+            **{column: self.bounds[:, position] for position, column in enumerate(BOUNDS_COLUMNS)}
+        })
+
+    @classmethod
+    def from_table(cls, table: pa.Table, crs: str) -> 'RegionIndex':
+        """Builds an index from a table written by to_table."""
+        return cls(
+            table.column('region_id').to_numpy(zero_copy_only=False),
+            shapely.from_wkb(table.column('wkb').to_numpy(zero_copy_only=False)),
+            crs,
+            np.column_stack([table.column(column).to_numpy() for column in BOUNDS_COLUMNS])
+        )
+
+def _index_path(shapefile_path: str, id_column: str, crs: str) -> str:
+    """Returns the cache file path of a region index, keyed by shapefile path, modification time, id column and CRS."""
+    shapefile_path = os.path.abspath(shapefile_path)
+    key = json.dumps([shapefile_path, os.stat(shapefile_path).st_mtime, id_column, crs])
+    digest = hashlib.sha256(key.encode('utf-8')).hexdigest()[:16]
+    shapefile_name = os.path.splitext(os.path.basename(shapefile_path))[0]
+
+    return os.path.join(os.path.dirname(shapefile_path), CACHE_DIRECTORY, f'regions-{shapefile_name}-{digest}.parquet')
+
+def load_region_index(shapefile_path: str, id_column: str, crs: str = 'EPSG:7855') -> RegionIndex:
+    """
+    Loads the region index of a shapefile, building it from the finest level of the cached boundaries
+    and persisting its region ids, WKB boundaries and bounds first if needed, so later loads skip the
+    boundary pyramid and bounds computation. Indexes are also kept in memory for the rest of the process.
+
+    Parameters:
+        shapefile_path (str): Path to the region shapefile.
+        id_column (str): The column identifying regions.
+        crs (str): The projected CRS to index the regions in. Default is GDA2020 (EPSG:7855).
+
+    Returns:
+        RegionIndex: The index of the shapefile's regions.
+    """
+    if not shapefile_path or not os.path.exists(shapefile_path):
+        raise FileNotFoundError(f"Shapefile path '{shapefile_path}' is invalid or does not exist.")
+
+    index_path = _index_path(shapefile_path, id_column, crs)
+    if index_path in _loaded_indexes:
+        return _loaded_indexes[index_path]
+
+    region_index = None
+    if os.path.exists(index_path):
+        try:
+            region_index = RegionIndex.from_table(pq.read_table(index_path), crs)
+        except Exception:
+            # A corrupt or unreadable index is rebuilt below
+            region_index = None
+
+    if region_index is None:
+        gdf = load_boundaries(shapefile_path, crs=crs, tolerance=min(LOD_TOLERANCES))
+        if id_column not in gdf.columns:
+            raise ValueError(f"'{id_column}' column not found in shapefile '{shapefile_path}'.")
+        region_index = RegionIndex(gdf[id_column].astype(str).to_numpy(), gdf.geometry.values, crs)
+
+        table = region_index.to_table()
+        write_atomically(index_path, lambda temporary_path: pq.write_table(table, temporary_path))
+
+    _loaded_indexes[index_path] = region_index
+    return region_index
@@ -0,0 +1,12 @@
+import os
+import sys
+
+import pytest
+
+# The pipeline modules are imported by name, as the worker and scripts run them from src/python
+sys.path.insert(0, os.path.dirname(os.path.dirname(os.path.abspath(__file__))))
+
+@pytest.fixture(autouse=True)
+def disable_pipeline_metrics(monkeypatch):
+    """Keeps instrumented stages from appending to the metrics log of the checkout."""
+    monkeypatch.setenv('PIPELINE_METRICS_PATH', '')
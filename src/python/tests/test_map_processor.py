@@ -0,0 +1,59 @@
+import json
+import os
+import re
+
+import geopandas as gpd
+import pytest
+import shapely
+from shapely.geometry import MultiPolygon, box
+
+from map_processor import _round_coordinates, generate_map
+
+# Smaller than the grid of five decimal places, so it collapses when rounded
+ISLAND = box(150.0000001, -30.0000002, 150.0000002, -30.0000001)
+
+def regions(geometries) -> gpd.GeoDataFrame:
+    return gpd.GeoDataFrame(
+        {'zip': [f'{index:04d}' for index in range(len(geometries))], 'total_sales': [float(index) for index in range(len(geometries))]},
+        geometry=geometries,
+        crs='EPSG:4326'
+    )
+
+def test_round_coordinates_drops_collapsed_parts():
+    gdf = regions([MultiPolygon([box(150, -30, 151, -29), ISLAND]), box(150.1, -30.1, 150.2, -30.0)])
+
+    rounded = _round_coordinates(gdf, 5)
+
+    assert rounded['zip'].tolist() == ['0000', '0001']
+    assert rounded.geometry.is_valid.all()
+    assert shapely.get_num_geometries(rounded.geometry.values).tolist() == [1, 1]
+    assert rounded.geometry.area.tolist() == pytest.approx(gdf.geometry.area.tolist(), rel=1e-6)
+
+@pytest.mark.parametrize('precision', [0, 5])
+def test_round_coordinates_drops_regions_that_collapse(precision):
+    gdf = regions([box(150, -30, 151, -29), box(150.3, -30.3, 150.3000001, -30.2999999)])
+
+    rounded = _round_coordinates(gdf, precision)
+
+    assert rounded['zip'].tolist() == ['0000']
+    assert rounded.geometry.is_valid.all()
+
+def test_round_coordinates_keeps_the_requested_digits():
+    gdf = regions([box(150.123456789, -30.987654321, 151.111111111, -29.222222222)])
+
+    coordinates = shapely.get_coordinates(_round_coordinates(gdf, 3).geometry.values)
+
+    assert (abs(coordinates * 1000 - (coordinates * 1000).round()) < 1e-6).all()
+
+def test_generate_map_colours_match_regions_after_a_drop(tmp_path):
+    # The middle region collapses, so the colours of the last must not shift onto it
+    gdf = regions([box(150, -30, 151, -29), box(150.3, -30.3, 150.3000001, -30.2999999), box(152, -30, 153, -29)])
+    gdf['total_sales'] = [1.0, 50.0, 100.0]
+
+    map_path = generate_map('Postcode', gdf, {}, output_html_path=os.path.join(tmp_path, 'map.html'))
+
+    with open(map_path) as file:
+        html = file.read()
+    fill_colors = json.loads(re.search(r'"fill_colors": (\[[^\]]*\])', html).group(1))
+    assert len(fill_colors) == 2
+    assert fill_colors[0] != fill_colors[1]
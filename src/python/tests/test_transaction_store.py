@@ -0,0 +1,127 @@
+import os
+from datetime import date
+
+import numpy as np
+import pandas as pd
+import pytest
+
+import sales_cube
+import transaction_store
+from sales_processor import process_sales
+
+POSTCODES = {'0800': 'Northern Territory', '2000': 'New South Wales', '2600': 'Australian Capital Territory', '4000': 'Queensland'}
+
+def make_transactions(start: str, end: str, count: int, seed: int) -> pd.DataFrame:
+    """Random transactions between two dates, with postcodes as text so leading zeros survive Excel."""
+    rng = np.random.default_rng(seed)
+    start, end = pd.Timestamp(start), pd.Timestamp(end)
+    zips = rng.choice(list(POSTCODES), count)
+    return pd.DataFrame({
+        'created_at': start + pd.to_timedelta(rng.integers(0, int((end - start).total_seconds()), count), unit='s'),
+        'zip': zips,
+        'province': [POSTCODES[zip_code] for zip_code in zips],
+        'country': 'Australia',
+        'total_price': rng.integers(100, 100000, count) / 100,
+    })
+
+def baseline_process_sales(data_filepath: str, start_date: date, end_date: date, resolution: str) -> pd.DataFrame:
+    """process_sales as it was before the transaction store: a full read, filter and pivot per call."""
+    transactions = pd.read_excel(data_filepath, parse_dates=['created_at'], dtype={'zip': str})
+    transactions['created_at'] = pd.to_datetime(transactions['created_at'], format='mixed')
+
+    mask = (transactions['created_at'] >= pd.Timestamp(start_date)) & (transactions['created_at'] <= pd.Timestamp(end_date))
+    filtered_transactions = transactions[mask].copy()
+    filtered_transactions['month'] = filtered_transactions['created_at'].dt.to_period('M')
+
+    index_columns = ['province', 'country'] if resolution == 'State' else ['zip', 'province', 'country']
+    grouped_sales = (
+        filtered_transactions.groupby(index_columns + ['month'], as_index=False)['total_price']
+        .sum()
+        .rename(columns={'total_price': 'total_sales'})
+    )
+    sales = grouped_sales.pivot_table(index=index_columns, columns='month', values='total_sales', fill_value=0)
+    sales.columns = sales.columns.to_timestamp()
+    sales = sales.loc[:, start_date:end_date]
+    sales['total_sales'] = sales.sum(axis=1)
+    return sales.reset_index()
+
+def assert_same_sales(actual: pd.DataFrame, expected: pd.DataFrame) -> None:
+    """Compares sales frames by value, ignoring how the identifier columns are typed."""
+    def normalise(sales):
+        identifiers = [column for column in sales.columns if isinstance(column, str) and column != 'total_sales']
+        sales = sales.astype({column: str for column in identifiers})
+        sales.columns = [str(column) for column in sales.columns]
+        return sales.sort_values(identifiers, ignore_index=True)
+
+    pd.testing.assert_frame_equal(normalise(actual), normalise(expected), check_dtype=False, check_exact=False, rtol=1e-9)
+
+@pytest.fixture
+def workbook(tmp_path):
+    path = os.path.join(tmp_path, 'sales.xlsx')
+    make_transactions('2023-10-01', '2024-05-31', 600, seed=1).to_excel(path, index=False)
+    return path
+
+DATE_RANGES = [
+    (date(2023, 11, 1), date(2024, 3, 31)),     # whole months, answered from the cube
+    (date(2023, 11, 15), date(2024, 3, 10)),    # partial edge months, read from the partitions
+    (date(2024, 2, 3), date(2024, 2, 20)),      # within a single month
+]
+
+@pytest.mark.parametrize('resolution', ['Postcode', 'State'])
+@pytest.mark.parametrize('start_date, end_date', DATE_RANGES)
+def test_store_matches_baseline(workbook, resolution, start_date, end_date):
+    expected = baseline_process_sales(workbook, start_date, end_date, resolution)
+
+    # The first call ingests the workbook and builds the cube, the second reads them back
+    for _ in range(2):
+        assert_same_sales(process_sales(workbook, start_date, end_date, resolution), expected)
+
+@pytest.mark.parametrize('start_date, end_date', DATE_RANGES)
+def test_chunked_matches_baseline(workbook, start_date, end_date):
+    expected = baseline_process_sales(workbook, start_date, end_date, 'Postcode')
+    assert_same_sales(process_sales(workbook, start_date, end_date, 'Postcode', chunk_size=64), expected)
+
+def test_append_reaggregates_only_affected_months(workbook, tmp_path, monkeypatch):
+    start_date, end_date = date(2023, 10, 1), date(2024, 6, 30)
+    process_sales(workbook, start_date, end_date, 'Postcode')
+
+    batch = make_transactions('2024-02-01', '2024-03-31', 50, seed=2)
+    assert transaction_store.append_transactions(workbook, batch) == ['2024-02', '2024-03']
+
+    aggregated_months = []
+    aggregate_partitions = sales_cube._aggregate_partitions
+    def recording_aggregate_partitions(data_filepath, manifest, month_labels):
+        aggregated_months.extend(month_labels)
+        return aggregate_partitions(data_filepath, manifest, month_labels)
+    monkeypatch.setattr(sales_cube, '_aggregate_partitions', recording_aggregate_partitions)
+
+    actual = process_sales(workbook, start_date, end_date, 'Postcode')
+    assert aggregated_months == ['2024-02', '2024-03']
+
+    combined_workbook = os.path.join(tmp_path, 'combined.xlsx')
+    pd.concat([pd.read_excel(workbook, dtype={'zip': str}), batch]).to_excel(combined_workbook, index=False)
+    assert_same_sales(actual, baseline_process_sales(combined_workbook, start_date, end_date, 'Postcode'))
+
+def test_reingest_removes_months_no_longer_in_the_source(tmp_path):
+    path = os.path.join(tmp_path, 'sales.csv')
+    make_transactions('2024-01-01', '2024-03-31', 100, seed=3).to_csv(path, index=False)
+    first_manifest = transaction_store.load_manifest(path)
+    assert list(first_manifest['partitions']) == ['2024-01', '2024-02', '2024-03']
+
+    make_transactions('2024-03-01', '2024-04-30', 100, seed=4).to_csv(path, index=False)
+    manifest = transaction_store.load_manifest(path)
+    assert list(manifest['partitions']) == ['2024-03', '2024-04']
+    assert manifest['revision'] == first_manifest['revision'] + 1
+
+    directory = transaction_store.store_directory(path)
+    for month_label, partition in first_manifest['partitions'].items():
+        assert os.path.exists(os.path.join(directory, partition)) == (month_label in manifest['partitions'])
+    assert not [name for name in os.listdir(directory) if name.endswith('.tmp')]
+
+def test_created_at_offsets_and_non_iso_dates_become_naive_utc():
+    transactions = make_transactions('2024-01-01', '2024-01-02', 3, seed=5)
+    transactions['created_at'] = ['2024-01-31T20:00:00-05:00', '13/02/2024 10:00', '2024-03-01']
+
+    created_at = transaction_store.enforce_transaction_schema(transactions)['created_at']
+    assert created_at.dt.tz is None
+    assert created_at.tolist() == [pd.Timestamp('2024-02-01 01:00'), pd.Timestamp('2024-02-13 10:00'), pd.Timestamp('2024-03-01')]
@@ -0,0 +1,168 @@
+import geopandas as gpd
+import shapely
+import mapbox_vector_tile
+from branca.element import MacroElement
+from jinja2 import Template
+import json
+import math
+import os
+import shutil
+
+TILE_EXTENT = 4096
+TILE_BUFFER = 64
+WEB_MERCATOR_HALF_SIZE = 20037508.342789244
+
+def _tile_size(zoom: int) -> float:
+    """Returns the width of a tile at a zoom level, in Web Mercator metres."""
+    return 2 * WEB_MERCATOR_HALF_SIZE / 2 ** zoom
+
+def _tile_bounds(zoom: int, x: int, y: int) -> tuple[float, float, float, float]:
+    """Returns the (minx, miny, maxx, maxy) Web Mercator bounds of a tile."""
+    size = _tile_size(zoom)
+    minx = -WEB_MERCATOR_HALF_SIZE + x * size
+    maxy = WEB_MERCATOR_HALF_SIZE - y * size
+    return minx, maxy - size, minx + size, maxy
+
+def _tile_range(bounds, zoom: int) -> tuple[range, range]:
+    """Returns the x and y ranges of the tiles covering Web Mercator bounds at a zoom level."""
+    size = _tile_size(zoom)
+    last_tile = 2 ** zoom - 1
+
+    def clamp(value: float) -> int:
+        return min(max(int(math.floor(value)), 0), last_tile)
+
+    x_range = range(clamp((bounds[0] + WEB_MERCATOR_HALF_SIZE) / size), clamp((bounds[2] + WEB_MERCATOR_HALF_SIZE) / size) + 1)
+    y_range = range(clamp((WEB_MERCATOR_HALF_SIZE - bounds[3]) / size), clamp((WEB_MERCATOR_HALF_SIZE - bounds[1]) / size) + 1)
+    return x_range, y_range
+
+def generate_vector_tiles(
+    gdf: gpd.GeoDataFrame,
+    output_directory: str,
+    min_zoom: int = 4,
+    max_zoom: int = 10,
+    layer_name: str = 'regions',
+    properties: list[str] = None
+) -> dict:
+    """
+    Slices a GeoDataFrame into Mapbox Vector Tiles for a range of zoom levels. Geometries are simplified
+    to the pixel size of each zoom level and clipped to each tile (with a small buffer), and tiles are
+    written as {z}/{x}/{y}.pbf under the output directory, alongside a metadata.json file.
+
+    Parameters:
+        gdf (gpd.GeoDataFrame): The regions to tile, in any CRS.
+        output_directory (str): The directory to write the tiles to. Any existing contents are replaced.
+        min_zoom (int): The lowest zoom level to generate. Default is 4.
+        max_zoom (int): The highest zoom level to generate. Default is 10.
+        layer_name (str): The name of the tile layer holding the regions. Default is 'regions'.
+        properties (list[str], optional): The columns to carry as feature attributes. Default is None
+            (all non-geometry columns).
+
+    Returns:
+        dict: The tile set metadata, as written to metadata.json.
+    """
+    if min_zoom < 0 or max_zoom < min_zoom:
+        raise ValueError(f"Invalid zoom range {min_zoom}-{max_zoom}.")
+
+    if gdf.empty:
+        raise ValueError("Cannot generate vector tiles from an empty GeoDataFrame.")
+
+    if properties is None:
+        properties = [column for column in gdf.columns if column != gdf.geometry.name]
+
+    gdf = gdf.to_crs(epsg=3857)
+    geometries = gdf.geometry.values
+    records = [
+        {key: value for key, value in record.items() if value is not None}
+        for record in gdf[properties].to_dict('records')
+    ]
+    bounds = gdf.geometry.total_bounds
+
+    if os.path.exists(output_directory):
+        shutil.rmtree(output_directory)
+
+    tile_count = 0
+    for zoom in range(min_zoom, max_zoom + 1):
+        size = _tile_size(zoom)
+        buffer = size * TILE_BUFFER / TILE_EXTENT
+
+        # Anything smaller than a tile pixel at this zoom is invisible, so simplify to that size
+        zoom_geometries = shapely.simplify(geometries, size / TILE_EXTENT, preserve_topology=True)
+        zoom_tree = shapely.STRtree(zoom_geometries)
+
+        x_range, y_range = _tile_range(bounds, zoom)
+        for x in x_range:
+            for y in y_range:
+                tile_bounds = _tile_bounds(zoom, x, y)
+                buffered_bounds = (
+                    tile_bounds[0] - buffer, tile_bounds[1] - buffer,
+                    tile_bounds[2] + buffer, tile_bounds[3] + buffer
+                )
+                indexes = zoom_tree.query(shapely.box(*buffered_bounds), predicate='intersects')
+                if len(indexes) == 0:
+                    continue
+
+                clipped = shapely.clip_by_rect(zoom_geometries[indexes], *buffered_bounds)
+                features = [
+                    {'geometry': geometry, 'properties': records[index]}
+                    for index, geometry in zip(indexes, clipped)
+                    if not geometry.is_empty
+                ]
+                if not features:
+                    continue
+
+                tile = mapbox_vector_tile.encode(
+                    [{'name': layer_name, 'features': features}],
+                    default_options={'quantize_bounds': tile_bounds, 'extents': TILE_EXTENT}
+                )
+
+                tile_path = os.path.join(output_directory, str(zoom), str(x), f'{y}.pbf')
+                os.makedirs(os.path.dirname(tile_path), exist_ok=True)
+                with open(tile_path, 'wb') as file:
+                    file.write(tile)
+                tile_count += 1
+
+    metadata = {
+        'name': layer_name,
+        'format': 'pbf',
+        'minzoom': min_zoom,
+        'maxzoom': max_zoom,
+        'bounds': list(gpd.GeoSeries(shapely.box(*bounds), crs=gdf.crs).to_crs(epsg=4326).total_bounds),
+        'fields': properties,
+        'tile_count': tile_count
+    }
+    os.makedirs(output_directory, exist_ok=True)
+    with open(os.path.join(output_directory, 'metadata.json'), 'w') as file:
+        json.dump(metadata, file, indent=4)
+
+    return metadata
+
+class VectorTileTooltip(MacroElement):
+    """
+    Shows a hover tooltip for features of a folium VectorGridProtobuf layer, which does not support
+    folium.GeoJsonTooltip. Must be added to the VectorGridProtobuf layer.
+    """
+    _template = Template("""
+        {% macro script(this, kwargs) %}
+        {{ this._parent.get_name() }}.on('mouseover', function (e) {
+            var properties = e.layer.properties;
+            var fields = {{ this.fields|tojson }};
+            var aliases = {{ this.aliases|tojson }};
+            var content = fields.map(function (field, i) {
+                var value = properties[field];
+                return '<b>' + aliases[i] + '</b> ' + (typeof value === 'number' ? value.toLocaleString() : value);
+            }).join('<br>');
+            e.target._map.openTooltip(content, e.latlng);
+        });
+        {{ this._parent.get_name() }}.on('mouseout', function (e) {
+            e.target._map.eachLayer(function (layer) {
+                if (layer instanceof L.Tooltip) { e.target._map.closeTooltip(layer); }
+            });
+        });
+        {% endmacro %}
+    """)
+
+    def __init__(self, fields: list[str], aliases: list[str]):
+        super().__init__()
+        self._name = 'VectorTileTooltip'
+        self.fields = fields
+        self.aliases = aliases
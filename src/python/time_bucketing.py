@@ -0,0 +1,130 @@
+import pandas as pd
+import numpy as np
+
+# The pandas period frequency of each time resolution
+TIME_RESOLUTIONS = {'Month': 'M', 'Quarter': 'Q', 'Year': 'Y'}
+PERIOD_LABEL_FORMATS = {'Month': '%b-%Y', 'Quarter': 'Q%q-%Y', 'Year': '%Y'}
+
+ROLLING_SALES_COLUMN = 'rolling_sales'
+PERIOD_CHANGE_COLUMN = 'period_change'
+
+# Periods only partly inside the date range are labelled with this suffix
+PARTIAL_PERIOD_SUFFIX = ' (partial)'
+# The GeoDataFrame attribute listing the period sales columns, oldest first
+PERIOD_COLUMNS_ATTR = 'period_columns'
+
+def _validate_time_resolution(time_resolution: str) -> str:
+    """Returns the period frequency of a time resolution."""
+    if time_resolution not in TIME_RESOLUTIONS:
+        raise ValueError(f"Invalid time resolution ({time_resolution}). Must be one of {list(TIME_RESOLUTIONS)}")
+    return TIME_RESOLUTIONS[time_resolution]
+
+def bucket_periods(
+    values: np.ndarray,
+    months: pd.PeriodIndex,
+    time_resolution: str,
+    start_date: pd.Timestamp = None,
+    end_date: pd.Timestamp = None
+) -> tuple[np.ndarray, pd.PeriodIndex]:
+    """
+    Sums region-by-month values into region-by-period values. Months are summed with one np.add.reduceat
+    over the month axis and scattered into a dense period axis, so periods without sales are zero
+    rather than missing. Periods only partly inside the date range hold the sales of the months inside it.
+
+    Parameters:
+        values (np.ndarray): 2D array of values, one row per region and one column per month.
+        months (pd.PeriodIndex): The month of each column, in ascending order.
+        time_resolution (str): 'Month', 'Quarter' or 'Year'.
+        start_date (pd.Timestamp, optional): Start of the period axis. Default is None (the first month).
+        end_date (pd.Timestamp, optional): End of the period axis. Default is None (the last month).
+
+    Returns:
+        tuple[np.ndarray, pd.PeriodIndex]: The region-by-period values and the period of each column.
+    """
+    frequency = _validate_time_resolution(time_resolution)
+    values = np.asarray(values, dtype=np.float64)
+    if values.ndim != 2 or values.shape[1] != len(months):
+        raise ValueError("Values must be a 2D array with one column per month.")
+
+    if start_date is None and end_date is None and len(months) == 0:
+        raise ValueError("A date range is required when there are no months.")
+
+    first_period = pd.Period(start_date if start_date is not None else months.min().start_time, freq=frequency)
+    last_period = pd.Period(end_date if end_date is not None else months.max().start_time, freq=frequency)
+    periods = pd.period_range(first_period, last_period, freq=frequency)
+
+    bucketed = np.zeros((values.shape[0], len(periods)), dtype=np.float64)
+    if len(months) == 0:
+        return bucketed, periods
+
+    positions = months.asfreq(frequency).asi8 - first_period.ordinal
+    if np.any(np.diff(positions) < 0):
+        raise ValueError("Months must be in ascending order.")
+
+    inside = (positions >= 0) & (positions < len(periods))
+    values, positions = values[:, inside], positions[inside]
+    if len(positions) == 0:
+        return bucketed, periods
+
+    # Sum each run of months falling in the same period, then place the runs on the dense axis
+    run_starts = np.flatnonzero(np.r_[True, positions[1:] != positions[:-1]])
+    bucketed[:, positions[run_starts]] = np.add.reduceat(values, run_starts, axis=1)
+
+    return bucketed, periods
+
+def rolling_sums(values: np.ndarray, window: int) -> np.ndarray:
+    """
+    Returns the sum of each period and the window - 1 periods before it, from one cumulative sum over
+    the period axis. Windows at the start of the axis sum the periods available.
+    """
+    if window < 1:
+        raise ValueError(f"Invalid rolling window ({window}). Must be at least 1")
+
+    cumulative = np.cumsum(values, axis=1)
+    cumulative = np.concatenate([np.zeros((cumulative.shape[0], 1)), cumulative], axis=1)
+    ends = np.arange(1, cumulative.shape[1])
+    return cumulative[:, ends] - cumulative[:, np.maximum(ends - window, 0)]
+
+def like_for_like_change(values: np.ndarray, months: pd.PeriodIndex, time_resolution: str) -> np.ndarray:
+    """
+    Returns the change of each region's sales in the last period from the period before it, comparing
+    like for like: only months at the same position of both periods are compared. A last period cut
+    short by the date range (e.g. Jan-May 2024) is compared with the same months of the period before
+    it (Jan-May 2023), not the whole of it. Zero where there is no earlier period.
+
+    Parameters:
+        values (np.ndarray): 2D array of values, one row per region and one column per month.
+        months (pd.PeriodIndex): The month of each column, in ascending order.
+        time_resolution (str): 'Month', 'Quarter' or 'Year'.
+
+    Returns:
+        np.ndarray: The change of each region.
+    """
+    frequency = _validate_time_resolution(time_resolution)
+    values = np.asarray(values, dtype=np.float64)
+    if len(months) == 0:
+        return np.zeros(values.shape[0])
+
+    periods = months.asfreq(frequency)
+    # The position of each month within its period, 0 for the first month
+    offsets = months.asi8 - periods.asfreq('M', how='start').asi8
+
+    current = np.asarray(periods == periods[-1])
+    previous = np.asarray(periods == periods[-1] - 1)
+    shared_offsets = np.intersect1d(offsets[current], offsets[previous])
+    current &= np.isin(offsets, shared_offsets)
+    previous &= np.isin(offsets, shared_offsets)
+
+    return values[:, current].sum(axis=1) - values[:, previous].sum(axis=1)
+
+def partial_periods(periods: pd.PeriodIndex, start_date: pd.Timestamp, end_date: pd.Timestamp) -> np.ndarray:
+    """Returns whether each period is only partly inside the date range (whole days, inclusive)."""
+    return np.asarray(
+        (periods.start_time < pd.Timestamp(start_date).normalize())
+        | (periods.end_time.normalize() > pd.Timestamp(end_date).normalize())
+    )
+
+def period_labels(periods: pd.PeriodIndex, time_resolution: str) -> list[str]:
+    """Returns the column label of each period, e.g. 'Jan-2024', 'Q1-2024' or '2024'."""
+    _validate_time_resolution(time_resolution)
+    return list(periods.strftime(PERIOD_LABEL_FORMATS[time_resolution]))
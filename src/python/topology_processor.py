@@ -0,0 +1,35 @@
+import geopandas as gpd
+import topojson as tp
+
+TOPOLOGY_OBJECT_NAME = 'regions'
+
+def build_topology(gdf: gpd.GeoDataFrame, quantization: int = 100000, simplify_tolerance: float = 0) -> dict:
+    """
+    Builds a TopoJSON topology from a GeoDataFrame. Borders shared by neighbouring regions are stored
+    once as arcs, and simplification runs on those arcs, so neighbours stay gap and sliver free.
+
+    Parameters:
+        gdf (gpd.GeoDataFrame): The regions to convert. All non-geometry columns become feature properties.
+        quantization (int): The number of quantized steps across each axis of the bounding box. Coordinates
+            are stored as delta-encoded integers on this grid. Default is 100000.
+        simplify_tolerance (float): The tolerance, in the units of the GeoDataFrame's CRS, used to simplify
+            the shared arcs. Default is 0 (no simplification).
+
+    Returns:
+        dict: A TopoJSON dictionary with the regions under objects.regions.
+    """
+    if gdf.empty:
+        raise ValueError("Cannot build a topology from an empty GeoDataFrame.")
+
+    try:
+        topology = tp.Topology(
+            gdf,
+            object_name=TOPOLOGY_OBJECT_NAME,
+            prequantize=quantization,
+            toposimplify=simplify_tolerance,
+            prevent_oversimplify=True
+        )
+    except Exception as e:
+        raise ValueError(f"Failed to build topology: {e}")
+
+    return topology.to_dict()
@@ -0,0 +1,467 @@
+import pandas as pd
+from datetime import date
+import glob
+import hashlib
+import json
+import os
+import openpyxl
+import pyarrow as pa
+import pyarrow.csv as pv
+import pyarrow.parquet as pq
+from atomic_file import write_atomically
+
+STORE_DIRECTORY = '.transaction_store'
+PARTITION_PREFIX = 'month='
+PARTITION_FILENAME = 'part-0.parquet'
+MANIFEST_FILENAME = 'manifest.json'
+HASH_CHUNK_SIZE = 1024 * 1024
+REQUIRED_COLUMNS = {'created_at', 'zip', 'province', 'country', 'total_price'}
+
+# The declared schema of transaction files. Readers cast to it instead of inferring types, so postcodes keep
+# their leading zeros, repeated labels are stored once and timestamps are parsed in one pass with a known format.
+# Timestamps with a UTC offset are converted to UTC and stored without a time zone, like those without one.
+# Columns that are not all ISO 8601 (e.g. '13/02/2024 10:00' typed into a workbook) are parsed value by value
+CREATED_AT_FORMAT = 'ISO8601'
+CREATED_AT_FALLBACK_FORMAT = 'mixed'
+CATEGORY_COLUMNS = ['zip', 'province', 'country']
+TRANSACTION_ARROW_TYPES = {
+    'created_at': pa.timestamp('ns'),
+    'zip': pa.dictionary(pa.int32(), pa.string()),
+    'province': pa.dictionary(pa.int32(), pa.string()),
+    'country': pa.dictionary(pa.int32(), pa.string()),
+    'total_price': pa.float64(),
+}
+TRANSACTION_FILE_EXTENSIONS = ('.xlsx', '.xlsm', '.csv', '.parquet')
+
+def store_directory(data_filepath: str) -> str:
+    """
+    Returns the directory used to store the month partitions of a transaction workbook.
+    The store lives in a hidden directory next to the source workbook.
+    """
+    source_directory = os.path.dirname(os.path.abspath(data_filepath))
+    source_name = os.path.basename(data_filepath)
+    return os.path.join(source_directory, STORE_DIRECTORY, source_name)
+
+def resolve_transaction_sources(data_sources: str | list[str]) -> list[str]:
+    """
+    Expands transaction sources into the file paths they name. A source is a file path or a glob pattern
+    (e.g. 'data/sales-*.xlsx'); patterns expand to their matches in sorted order. Each file is listed once.
+
+    Parameters:
+        - data_sources: A source, or a list of sources.
+
+    Returns:
+        - The file paths of the sources, in the order given.
+    """
+    if isinstance(data_sources, (str, os.PathLike)):
+        data_sources = [data_sources]
+
+    filepaths = []
+    for source in map(os.fspath, data_sources):
+        if any(character in source for character in '*?['):
+            matches = sorted(glob.glob(source))
+            if not matches:
+                raise FileNotFoundError(f"No files match the pattern '{source}'. Please check the file path.")
+            filepaths.extend(matches)
+        elif os.path.exists(source):
+            filepaths.append(source)
+        else:
+            raise FileNotFoundError(f"The file '{source}' does not exist. Please check the file path.")
+
+    if not filepaths:
+        raise ValueError("At least one transaction file is required.")
+
+    return list(dict.fromkeys(filepaths))
+
+def _partition_path(directory: str, month: pd.Period) -> str:
+    return os.path.join(directory, f'{PARTITION_PREFIX}{month.strftime("%Y-%m")}', PARTITION_FILENAME)
+
+def _write_partition(partition_path: str, transactions: pd.DataFrame) -> None:
+    write_atomically(partition_path, lambda temporary_path: transactions.to_parquet(temporary_path, index=False))
+
+def validate_transaction_columns(transactions: pd.DataFrame) -> None:
+    """Raises a ValueError if a DataFrame of transactions is missing any of the required columns."""
+    missing_columns = REQUIRED_COLUMNS - set(transactions.columns)
+    if missing_columns:
+        raise ValueError(f"The transaction file is missing required columns: {missing_columns}. Expected columns are: {REQUIRED_COLUMNS}.")
+
+def enforce_transaction_schema(transactions: pd.DataFrame) -> pd.DataFrame:
+    """
+    Casts the required columns of a DataFrame of transactions to the declared schema: 'created_at' to
+    datetimes in UTC without a time zone (parsed as ISO 8601 when they are not datetimes already, or
+    format by format when not all of them are, with any UTC offset applied), 'zip', 'province' and
+    'country' to categoricals of strings and 'total_price' to float64. Columns already of their type
+    are not copied.
+    """
+    validate_transaction_columns(transactions)
+    columns = {}
+
+    created_at = transactions['created_at']
+    if not pd.api.types.is_datetime64_any_dtype(created_at):
+        try:
+            created_at = pd.to_datetime(created_at, format=CREATED_AT_FORMAT, utc=True)
+        except (ValueError, TypeError):
+            try:
+                created_at = pd.to_datetime(created_at, format=CREATED_AT_FALLBACK_FORMAT, utc=True)
+            except (ValueError, TypeError) as e:
+                raise ValueError(f"The 'created_at' column must hold dates or timestamps: {e}")
+    if isinstance(created_at.dtype, pd.DatetimeTZDtype):
+        columns['created_at'] = created_at.dt.tz_convert('UTC').dt.tz_localize(None)
+
+    for column in CATEGORY_COLUMNS:
+        values = transactions[column]
+        if isinstance(values.dtype, pd.CategoricalDtype) and pd.api.types.is_string_dtype(values.cat.categories):
+            continue
+        if column == 'zip' and pd.api.types.is_numeric_dtype(values):
+            # Postcodes read as numbers would otherwise become e.g. '2000.0'
+            values = values.astype('Int64')
+        columns[column] = values.astype(str).where(values.notna()).astype('category')
+
+    if transactions['total_price'].dtype != 'float64':
+        columns['total_price'] = transactions['total_price'].astype('float64')
+
+    return transactions.assign(**columns) if columns else transactions
+
+def _transaction_file_extension(data_filepath: str) -> str:
+    extension = os.path.splitext(data_filepath)[1].lower()
+    if extension not in TRANSACTION_FILE_EXTENSIONS:
+        raise ValueError(f"Unsupported transaction file type '{extension}'. Expected .xlsx, .csv or .parquet.")
+    return extension
+
+def _read_csv_transactions(data_filepath: str) -> pd.DataFrame:
+    """
+    Reads a CSV file of transactions with the pyarrow CSV reader. Arrow parses a column of timestamps
+    either all with or all without a UTC offset, so files with offsets are read again with 'created_at'
+    as strings, which enforce_transaction_schema then parses.
+    """
+    try:
+        return pv.read_csv(
+            data_filepath,
+            convert_options=pv.ConvertOptions(
+                column_types=TRANSACTION_ARROW_TYPES,
+                timestamp_parsers=[pv.ISO8601]
+            )
+        ).to_pandas()
+    except pa.ArrowInvalid:
+        return pv.read_csv(
+            data_filepath,
+            convert_options=pv.ConvertOptions(column_types={**TRANSACTION_ARROW_TYPES, 'created_at': pa.string()})
+        ).to_pandas()
+
+def read_transaction_file(data_filepath: str) -> pd.DataFrame:
+    """
+    Reads a whole transaction file with the declared schema. CSV files are parsed by the multithreaded
+    pyarrow CSV reader, which casts each column as it is read; Parquet files are read with pyarrow and
+    Excel files with openpyxl. All are then cast with enforce_transaction_schema.
+
+    Parameters:
+        - data_filepath: A file path to an Excel (.xlsx), CSV (.csv) or Parquet (.parquet) file of transactions.
+
+    Returns:
+        - A pandas DataFrame of the transactions, typed as by enforce_transaction_schema.
+    """
+    extension = _transaction_file_extension(data_filepath)
+
+    try:
+        if extension == '.csv':
+            transactions = _read_csv_transactions(data_filepath)
+        elif extension == '.parquet':
+            transactions = pd.read_parquet(data_filepath)
+        else:
+            transactions = pd.read_excel(data_filepath, dtype={'zip': str})
+        return enforce_transaction_schema(transactions)
+    except (OSError, ValueError, pa.ArrowException) as e:
+        raise ValueError(f"Error reading transaction file '{data_filepath}': {e}")
+
+def _hash_file(filepath: str) -> str:
+    """Returns the SHA-256 hex digest of a file, read in fixed size chunks."""
+    digest = hashlib.sha256()
+    with open(filepath, 'rb') as file:
+        for block in iter(lambda: file.read(HASH_CHUNK_SIZE), b''):
+            digest.update(block)
+    return digest.hexdigest()
+
+def _read_manifest(manifest_path: str) -> dict:
+    if not os.path.exists(manifest_path):
+        return {}
+    try:
+        with open(manifest_path, 'r') as file:
+            return json.load(file)
+    except (OSError, ValueError):
+        return {}
+
+def _write_json(path: str, contents: dict) -> None:
+    with open(path, 'w') as file:
+        json.dump(contents, file, indent=4)
+
+def _write_manifest(manifest_path: str, manifest: dict) -> None:
+    write_atomically(manifest_path, lambda temporary_path: _write_json(temporary_path, manifest))
+
+def _is_store_current(data_filepath: str, manifest_path: str, manifest: dict) -> bool:
+    """
+    Checks whether the stored partitions still match the source workbook. The file size
+    and modification time are compared first so the content hash is only computed when the
+    workbook may have changed. If the content is unchanged (e.g. the file was touched or copied),
+    the manifest is refreshed so later checks stay cheap.
+    """
+    if not manifest:
+        return False
+
+    source_stat = os.stat(data_filepath)
+    if manifest.get('source_size') != source_stat.st_size:
+        return False
+    if manifest.get('source_mtime') == source_stat.st_mtime:
+        return True
+
+    if manifest.get('source_sha256') != _hash_file(data_filepath):
+        return False
+
+    manifest['source_mtime'] = source_stat.st_mtime
+    _write_manifest(manifest_path, manifest)
+    return True
+
+def ingest_transactions(data_filepath: str) -> dict:
+    """
+    Converts a file of transactions into typed Parquet files partitioned by month, with a
+    content-hash manifest. The file is read with the declared schema (see read_transaction_file),
+    so later reads do not have to re-parse dates or re-infer types.
+
+    Parameters:
+        - data_filepath: A file path to an Excel, CSV or Parquet file of transactions. The file must
+          have the headers: 'created_at', 'zip', 'province', 'country', 'total_price'.
+
+    Returns:
+        - The manifest of the store, listing the stored month partitions.
+    """
+    if not os.path.exists(data_filepath):
+        raise FileNotFoundError(f"The file '{data_filepath}' does not exist. Please check the file path.")
+
+    directory = store_directory(data_filepath)
+    manifest_path = os.path.join(directory, MANIFEST_FILENAME)
+
+    transactions = read_transaction_file(data_filepath)
+
+    previous_manifest = _read_manifest(manifest_path)
+
+    # Partitions are replaced whole, so concurrent readers see either the previous or the new month
+    partitions = {}
+    months = transactions['created_at'].dt.to_period('M')
+    for month, month_transactions in transactions.groupby(months, sort=True):
+        partition_path = _partition_path(directory, month)
+        _write_partition(partition_path, month_transactions)
+        partitions[month.strftime('%Y-%m')] = os.path.relpath(partition_path, directory)
+
+    # Every month is rewritten by an ingest, so every month changes with its revision
+    revision = previous_manifest.get('revision', 0) + 1
+    source_stat = os.stat(data_filepath)
+    manifest = {
+        'source_path': os.path.abspath(data_filepath),
+        'source_size': source_stat.st_size,
+        'source_mtime': source_stat.st_mtime,
+        'source_sha256': _hash_file(data_filepath),
+        'row_count': len(transactions),
+        'columns': list(transactions.columns),
+        'partitions': partitions,
+        'month_revisions': dict.fromkeys(partitions, revision),
+        'revision': revision
+    }
+    _write_manifest(manifest_path, manifest)
+
+    # Only once the manifest no longer lists them, remove partitions of months no longer in the workbook
+    for month_label, partition in previous_manifest.get('partitions', {}).items():
+        if month_label not in partitions:
+            try:
+                os.remove(os.path.join(directory, partition))
+            except FileNotFoundError:
+                # Another process removed it first
+                pass
+
+    return manifest
+
+def load_manifest(data_filepath: str) -> dict:
+    """Returns the manifest of a workbook's store, ingesting the workbook first if the store is missing or stale."""
+    if not os.path.exists(data_filepath):
+        raise FileNotFoundError(f"The file '{data_filepath}' does not exist. Please check the file path.")
+
+    manifest_path = os.path.join(store_directory(data_filepath), MANIFEST_FILENAME)
+    manifest = _read_manifest(manifest_path)
+    if not _is_store_current(data_filepath, manifest_path, manifest):
+        manifest = ingest_transactions(data_filepath)
+
+    return manifest
+
+def append_transactions(data_filepath: str, transactions: pd.DataFrame) -> list[str]:
+    """
+    Appends a batch of new transactions to the store of a transaction file. Only the month partitions
+    the batch falls into are rewritten, and the sales cube re-aggregates only those months when it is next
+    loaded. Appended batches are kept until the source workbook itself changes, at which point the store
+    is rebuilt from the workbook alone.
+
+    Parameters:
+        - data_filepath: A file path to the transaction file whose store the batch is appended to.
+        - transactions: A pandas DataFrame of new transactions with the same columns as the workbook.
+
+    Returns:
+        - The labels ('YYYY-MM') of the months affected by the batch.
+    """
+    transactions = enforce_transaction_schema(transactions)
+    manifest = load_manifest(data_filepath)
+    directory = store_directory(data_filepath)
+
+    affected_months = []
+    months = transactions['created_at'].dt.to_period('M')
+    for month, month_transactions in transactions.groupby(months, sort=True):
+        month_label = month.strftime('%Y-%m')
+        partition_path = _partition_path(directory, month)
+
+        if month_label in manifest['partitions']:
+            try:
+                existing_transactions = pd.read_parquet(partition_path)
+            except Exception as e:
+                raise ValueError(f"Error reading transaction partition '{partition_path}': {e}")
+            month_transactions = pd.concat([existing_transactions, month_transactions], ignore_index=True)
+
+        _write_partition(partition_path, month_transactions)
+        manifest['partitions'][month_label] = os.path.relpath(partition_path, directory)
+        affected_months.append(month_label)
+
+    manifest['partitions'] = dict(sorted(manifest['partitions'].items()))
+    manifest['row_count'] += len(transactions)
+    manifest['revision'] = manifest.get('revision', 0) + 1
+    # Record the revision each month last changed in, so stores derived from the partitions (see
+    # sales_cube) only re-aggregate the months appended to since they were built
+    manifest['month_revisions'] = {
+        **manifest.get('month_revisions', {}),
+        **dict.fromkeys(affected_months, manifest['revision'])
+    }
+    _write_manifest(os.path.join(directory, MANIFEST_FILENAME), manifest)
+
+    return affected_months
+
+def read_transactions(
+    data_filepath: str,
+    start_date: date = None,
+    end_date: date = None,
+    provinces: list[str] = None
+) -> pd.DataFrame:
+    """
+    Reads the transactions of a file from its month partitioned store, ingesting the file
+    first if it has not been ingested yet or has changed since the last ingest. Only the partitions
+    overlapping the requested date range are opened, and the province filter is pushed down to the
+    Parquet reader.
+
+    Parameters:
+        - data_filepath: A file path to an Excel, CSV or Parquet file of transactions.
+        - start_date: Optional start of the period to read (inclusive). Default is None (no lower bound).
+        - end_date: Optional end of the period to read (inclusive). Default is None (no upper bound).
+        - provinces: Optional list of provinces to read. Default is None (read all provinces).
+
+    Returns:
+        - A pandas DataFrame of the transactions with 'created_at' as datetimes.
+    """
+    manifest = load_manifest(data_filepath)
+    directory = store_directory(data_filepath)
+
+    start_month = pd.Timestamp(start_date).to_period('M') if start_date is not None else None
+    end_month = pd.Timestamp(end_date).to_period('M') if end_date is not None else None
+    filters = [('province', 'in', list(provinces))] if provinces else None
+
+    month_transactions = []
+    for month_label, partition in manifest.get('partitions', {}).items():
+        month = pd.Period(month_label, freq='M')
+        if (start_month is not None and month < start_month) or (end_month is not None and month > end_month):
+            continue
+
+        partition_path = os.path.join(directory, partition)
+        try:
+            month_transactions.append(pd.read_parquet(partition_path, filters=filters))
+        except Exception as e:
+            raise ValueError(f"Error reading transaction partition '{partition_path}': {e}")
+
+    if not month_transactions:
+        return pd.DataFrame(columns=manifest.get('columns', []))
+
+    # Partitions have their own categories, so concatenating them falls back to strings
+    transactions = enforce_transaction_schema(pd.concat(month_transactions, ignore_index=True))
+
+    # Partitions are whole months, so trim the edge months to the exact dates requested
+    if start_date is not None:
+        transactions = transactions[transactions['created_at'] >= pd.Timestamp(start_date)]
+    if end_date is not None:
+        transactions = transactions[transactions['created_at'] <= pd.Timestamp(end_date)]
+
+    return transactions.reset_index(drop=True)
+
+def load_transactions(data_filepath: str) -> pd.DataFrame:
+    """
+    Loads every transaction of a file from its columnar store.
+
+    Parameters:
+        - data_filepath: A file path to an Excel, CSV or Parquet file of transactions.
+
+    Returns:
+        - A pandas DataFrame of the transactions with 'created_at' as datetimes.
+    """
+    return read_transactions(data_filepath)
+
+def _enforce_chunk_schema(data_filepath: str, chunk: pd.DataFrame) -> pd.DataFrame:
+    """Casts a chunk to the declared schema, reporting bad values the same way as read_transaction_file."""
+    try:
+        return enforce_transaction_schema(chunk)
+    except ValueError as e:
+        raise ValueError(f"Error reading transaction file '{data_filepath}': {e}")
+
+def iter_transaction_chunks(data_filepath: str, chunk_size: int):
+    """
+    Reads a transaction file in chunks of at most chunk_size rows without loading it whole.
+    Excel files are read row by row with openpyxl in read-only mode, CSV files with the pandas
+    chunked reader and Parquet files one record batch at a time.
+
+    Parameters:
+        - data_filepath: A file path to an Excel (.xlsx), CSV (.csv) or Parquet (.parquet) file of transactions.
+        - chunk_size: The maximum number of rows in each chunk.
+
+    Returns:
+        - A generator of pandas DataFrames, one per chunk, typed as by enforce_transaction_schema.
+    """
+    if not os.path.exists(data_filepath):
+        raise FileNotFoundError(f"The file '{data_filepath}' does not exist. Please check the file path.")
+
+    if chunk_size <= 0:
+        raise ValueError("The 'chunk_size' must be a positive number of rows.")
+
+    extension = _transaction_file_extension(data_filepath)
+
+    if extension == '.csv':
+        chunks = pd.read_csv(
+            data_filepath,
+            chunksize=chunk_size,
+            dtype={'zip': str, 'province': 'category', 'country': 'category', 'total_price': 'float64'}
+        )
+        for chunk in chunks:
+            yield _enforce_chunk_schema(data_filepath, chunk)
+
+    elif extension == '.parquet':
+        parquet_file = pq.ParquetFile(data_filepath)
+        for batch in parquet_file.iter_batches(batch_size=chunk_size):
+            yield _enforce_chunk_schema(data_filepath, batch.to_pandas())
+
+    elif extension in ('.xlsx', '.xlsm'):
+        workbook = openpyxl.load_workbook(data_filepath, read_only=True, data_only=True)
+        try:
+            rows = workbook.worksheets[0].iter_rows(values_only=True)
+            header = next(rows, None)
+            if header is None:
+                return
+            columns = [str(column) for column in header]
+
+            chunk = []
+            for row in rows:
+                chunk.append(row)
+                if len(chunk) == chunk_size:
+                    yield _enforce_chunk_schema(data_filepath, pd.DataFrame(chunk, columns=columns))
+                    chunk = []
+            if chunk:
+                yield _enforce_chunk_schema(data_filepath, pd.DataFrame(chunk, columns=columns))
+        finally:
+            workbook.close()
@@ -1,9 +1,12 @@
 // src/routes/api.mjs
 import express from 'express';  // Use ESM import for express
 import { getUrls } from '../controllers/apiController.mjs';  // Import getUrls from the controller
-import { spawn } from 'child_process';
-import path from 'path';
+import { randomUUID } from 'crypto';
+import { getMapWorkerPool } from '../services/mapWorkerPool.mjs';
+import { getMapCache, mapCacheKey, fileFingerprint } from '../services/mapCache.mjs';
+import { publishJobMap, removeJobMap, isValidJobId, createMapJob, getMapJob, jobTilesDirectory } from '../services/mapJobs.mjs';
 import fs from 'fs';
+import path from 'path';
 import { dirname } from 'path';
 import { fileURLToPath } from 'url';
 
@@ -13,14 +16,150 @@ router.get('/urls', getUrls);
 
 const __filename = fileURLToPath(import.meta.url);
 const __dirname = dirname(__filename);
-const publicDirectory = path.join(__dirname, '../../public');
+const dataDirectory = path.join(__dirname, '..', 'python', 'data');
+
+// A transaction log, or a glob pattern of several, to build period maps from. When unset, maps compare
+// the yearly sales workbooks.
+const salesTransactionsFilepath = process.env.SALES_TRANSACTIONS_FILEPATH;
+
+const SSE_HEARTBEAT_MS = 15000;
+
+// The yearly sales workbooks a growth map compares, keyed by year. A single year is compared with the year before it.
+function yearlySalesFilepaths(years) {
+  const requestedYears = [...new Set(years.map(Number))].sort((a, b) => a - b);
+  const comparedYears = requestedYears.length === 1 ? [requestedYears[0] - 1, requestedYears[0]] : requestedYears;
+  return Object.fromEntries(comparedYears.map((year) => [String(year), path.join(dataDirectory, `sales${year}copy.xlsx`)]));
+}
+
+// Matches one path segment of a glob pattern, as Python's glob does: '*' and '?' never match a
+// separator, '[...]' is a character class ('[!...]' negated) and hidden names only match a leading '.'
+function globSegmentPattern(segment) {
+  let pattern = '';
+  for (let i = 0; i < segment.length; i++) {
+    const character = segment[i];
+    const classEnd = character === '[' ? segment.indexOf(']', i + 2) : -1;
+    if (character === '*') {
+      pattern += '.*';
+    } else if (character === '?') {
+      pattern += '.';
+    } else if (classEnd !== -1) {
+      const members = segment.slice(i + 1, classEnd);
+      pattern += `[${members.startsWith('!') ? `^${members.slice(1)}` : members.replace(/^\^/, '\\^')}]`;
+      i = classEnd;
+    } else {
+      pattern += character.replace(/[.+^${}()|[\]\\]/g, '\\$&');
+    }
+  }
+  return new RegExp(`^${pattern}$`, 's');
+}
+
+// Expands a transaction file path or glob pattern into the files it names, sorted like
+// transaction_store.resolve_transaction_sources, so each matched file is fingerprinted
+async function transactionFilepaths(source) {
+  if (!/[*?[]/.test(source)) {
+    return [source];
+  }
+
+  const resolved = path.resolve(source);
+  const { root } = path.parse(resolved);
+  let matches = [root];
+  for (const segment of resolved.slice(root.length).split(path.sep).filter(Boolean)) {
+    if (!/[*?[]/.test(segment)) {
+      matches = matches.map((match) => path.join(match, segment));
+      continue;
+    }
+    const segmentPattern = globSegmentPattern(segment);
+    const expanded = await Promise.all(matches.map(async (directory) => {
+      const names = await fs.promises.readdir(directory).catch(() => []);
+      return names
+        .filter((name) => segmentPattern.test(name) && (!name.startsWith('.') || segment.startsWith('.')))
+        .map((name) => path.join(directory, name));
+    }));
+    matches = expanded.flat();
+  }
 
-// Route to trigger the Python script
+  const files = (await Promise.all(matches.map((match) => fs.promises.stat(match).then((stats) => stats.isFile(), () => false))))
+    .flatMap((isFile, i) => (isFile ? [matches[i]] : []))
+    .sort();
+  if (files.length === 0) {
+    throw Object.assign(new Error(`No files match the pattern '${source}'`), { code: 'ENOENT', path: source });
+  }
+  return files;
+}
+
+// The worker job parameters, cache parameters and input files of a map request
+async function mapJobInputs({ resolution, states, years, timeResolution, timeLength }) {
+  if (salesTransactionsFilepath) {
+    // The worker reads exactly the files fingerprinted for the cache key
+    const transactionFiles = await transactionFilepaths(salesTransactionsFilepath);
+    const startDate = `${Math.min(...years.map(Number))}-01-01`;
+    const endDate = `${Math.max(...years.map(Number))}-12-31`;
+    return {
+      workerParams: {
+        resolution,
+        states,
+        start_date: startDate,
+        end_date: endDate,
+        time_resolution: timeResolution,
+        time_length: timeLength,
+        sales_data_filepath: transactionFiles,
+      },
+      cacheParams: { pipeline: 'periods', resolution, states, startDate, endDate, timeResolution, timeLength },
+      inputFiles: transactionFiles,
+    };
+  }
+
+  const salesFilepaths = yearlySalesFilepaths(years);
+  return {
+    workerParams: { resolution, states, yearly_sales_filepaths: salesFilepaths },
+    cacheParams: { pipeline: 'growth', resolution, states, years: Object.keys(salesFilepaths) },
+    inputFiles: Object.values(salesFilepaths),
+  };
+}
+
+// Builds the map for a job, recording its progress as the worker reports each stage
+function runMapJob(job, request) {
+  // Identical requests over unchanged data are served from the map cache, and concurrent
+  // identical requests share a single build
+  const mapCache = getMapCache();
+  return mapJobInputs(request)
+    .then(({ workerParams, cacheParams, inputFiles }) => Promise.all(inputFiles.map(fileFingerprint))
+      .then((fingerprints) => ({ workerParams, cacheParams, fingerprints })))
+    .catch((error) => {
+      throw error.code === 'ENOENT' ? new Error(`Sales data not found: ${path.basename(error.path)}`) : error;
+    })
+    .then(({ workerParams, cacheParams, fingerprints }) => {
+      const key = mapCacheKey(cacheParams, fingerprints);
+
+      // Dispatch to a resident Python worker rather than spawning a new interpreter per request. Jobs
+      // joining a build already in flight are sent its stage progress too.
+      return mapCache.getOrBuild(key, (reportProgress) => {
+        const workerJob = { id: job.id, ...workerParams };
+        const onProgress = ({ id, event, ...details }) => reportProgress(details);
+        return getMapWorkerPool().submit(workerJob, { onProgress }).then((result) => {
+          console.log(`Map ${job.id} generated in ${result.elapsed}s`);
+          // Tiles the map reads live as long as its cache entry
+          const tiles = jobTilesDirectory(job.id);
+          return { path: result.map_html_path, artifacts: tiles ? [tiles] : [] };
+        });
+      }, { onProgress: ({ stage, ...details }) => job.progress(stage, details) });
+    })
+    .then(({ path: cachedPath, cached }) => {
+      job.succeed({ htmlFilePath: publishJobMap(job.id, cachedPath), cached });
+    })
+    .catch((error) => {
+      console.error(`Map ${job.id} generation error:`, error);
+      job.fail(error);
+    });
+}
+
+// Route to trigger the Python script. The map is built in the background; poll the job
+// or stream its progress events for the result.
 router.post('/generate-map', (req, res) => {
 
     console.log('Request Body:', req.body);
 
-    const {states, years, resolution} = req.body;
+    const {states, years, resolution, timeResolution = 'Month', timeLength = 6} = req.body;
 
     if (!states || !years || !resolution) {
       return res.status(400).json({ 
@@ -28,64 +167,85 @@ router.post('/generate-map', (req, res) => {
           details: { states, years, resolution }
       });
   }
-    const pythonProcess = spawn('python', [
-      path.join(__dirname, '..', 'python', 'mapGenerator.py'),
-      resolution,
-      years.join(','),
-      states.join(','),
-    ]);
-  
-    pythonProcess.stdout.on('data', (data) => {
-      const output = data.toString().trim();
-      try {
-        const outputObject = JSON.parse(output);
-        const htmlFilePath = outputObject.map_html_path;
-        
-        const filename = path.basename(htmlFilePath);   
-        const publicHtmlFilePath = path.join(publicDirectory, 'maps', filename); 
-
-        fs.mkdirSync(path.dirname(publicHtmlFilePath), { recursive: true });
-        fs.copyFileSync(htmlFilePath, publicHtmlFilePath);
-        fs.unlinkSync(htmlFilePath);
-    
-        res.status(200).json({ success: true, htmlFilePath: `/maps/${filename}` });
-  
-      } catch (error) {
-        console.error('Error parsing Python script output:', error);
-        res.status(500).json({ error: 'Failed to generate map' });
-      }
-    });
-  
-    pythonProcess.stderr.on('data', (data) => {
-      console.error(`Python Error: ${data}`);
-      res.status(500).json({ error: 'An error occurred while generating the map.' });
-    });
-  
-    pythonProcess.on('close', (code) => {
-      if (code !== 0) {
-        res.status(500).json({ error: `Python process exited with code ${code}` });
-      }
+
+    // Every request is a job with its own output files, so concurrent requests never overwrite each other
+    const pool = getMapWorkerPool();
+    if (pool.queue.length >= pool.maxQueue) {
+      return res.status(503).json({ error: 'Too many map requests are queued, please try again shortly' });
+    }
+
+    const job = createMapJob(randomUUID());
+    runMapJob(job, { resolution, states, years, timeResolution, timeLength: Number(timeLength) });
+
+    res.status(202).json({
+      success: true,
+      jobId: job.id,
+      statusUrl: `/api/jobs/${job.id}`,
+      eventsUrl: `/api/jobs/${job.id}/events`,
     });
 });
 
-router.delete('/reset-maps', (req, res) => {
-  const filePath = path.join(publicDirectory, 'maps', 'generated_map.html');
-  fs.unlink(filePath, (err) => {
-      if (err) {
-          if (err.code === 'ENOENT') {
-              // File does not exist
-              console.err(err)
-              return res.status(404).json({ error: 'File not found', filePath: filePath});
-          }
-          // Other errors
-          console.error(err);
-          return res.status(500).json({ error: 'Failed to delete file' });
-      }
+router.get('/jobs/:jobId', (req, res) => {
+  const job = getMapJob(req.params.jobId);
+  if (!job) {
+    return res.status(404).json({ error: 'Job not found', jobId: req.params.jobId });
+  }
+  res.status(200).json(job);
+});
 
-      // File successfully deleted
-      console.log('File deleted successfully');
-      res.status(200).json({ message: 'File deleted successfully' });
+// Streams a job's events as server-sent events, replaying those already recorded
+router.get('/jobs/:jobId/events', (req, res) => {
+  const job = getMapJob(req.params.jobId);
+  if (!job) {
+    return res.status(404).json({ error: 'Job not found', jobId: req.params.jobId });
+  }
+
+  res.writeHead(200, {
+    'Content-Type': 'text/event-stream',
+    'Cache-Control': 'no-cache',
+    Connection: 'keep-alive',
   });
+
+  const send = (event) => res.write(`event: ${event.type}\ndata: ${JSON.stringify(event)}\n\n`);
+  job.events.forEach(send);
+  if (job.finished) {
+    return res.end();
+  }
+
+  const heartbeat = setInterval(() => res.write(': heartbeat\n\n'), SSE_HEARTBEAT_MS);
+  const stop = () => {
+    clearInterval(heartbeat);
+    job.off('event', listener);
+  };
+  const listener = (event) => {
+    send(event);
+    if (job.finished) {
+      stop();
+      res.end();
+    }
+  };
+  job.on('event', listener);
+  req.on('close', stop);
+});
+
+router.delete('/reset-maps/:jobId', (req, res) => {
+  const { jobId } = req.params;
+  if (!isValidJobId(jobId)) {
+    return res.status(400).json({ error: 'Invalid job id', jobId });
+  }
+
+  removeJobMap(jobId)
+    .then((removed) => {
+      if (!removed) {
+        return res.status(404).json({ error: 'File not found', jobId });
+      }
+      console.log(`Map ${jobId} deleted successfully`);
+      res.status(200).json({ message: 'File deleted successfully' });
+    })
+    .catch((error) => {
+      console.error(error);
+      res.status(500).json({ error: 'Failed to delete file' });
+    });
 });
 
 export default router;
\ No newline at end of file
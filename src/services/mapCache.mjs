@@ -0,0 +1,238 @@
+// src/services/mapCache.mjs
+import { createHash } from 'crypto';
+import { EventEmitter } from 'events';
+import fs from 'fs';
+import path from 'path';
+import { dirname } from 'path';
+import { fileURLToPath } from 'url';
+
+const __filename = fileURLToPath(import.meta.url);
+const __dirname = dirname(__filename);
+const cacheDirectory = path.join(__dirname, '..', '..', 'public', 'maps', 'cache');
+
+const CACHE_EXTENSION = '.html';
+// Lists the other files a cached map depends on (e.g. its vector tiles), which are removed with it
+const ARTIFACTS_EXTENSION = '.artifacts.json';
+
+// Content hashes of input files, keyed by path, size and modification time so unchanged files are hashed once
+const fileHashes = new Map();
+
+// Returns the SHA-256 of a file's contents, re-hashing only when its size or modification time changes
+export async function fileFingerprint(filePath) {
+  const stats = await fs.promises.stat(filePath);
+  const statKey = `${path.resolve(filePath)}:${stats.size}:${stats.mtimeMs}`;
+
+  if (!fileHashes.has(statKey)) {
+    const hashing = new Promise((resolve, reject) => {
+      const hash = createHash('sha256');
+      fs.createReadStream(filePath)
+        .on('data', (chunk) => hash.update(chunk))
+        .on('end', () => resolve(hash.digest('hex')))
+        .on('error', reject);
+    });
+    fileHashes.set(statKey, hashing);
+    hashing.catch(() => fileHashes.delete(statKey));
+  }
+  return fileHashes.get(statKey);
+}
+
+// Returns the cache key of a map request: a hash of its normalized parameters and the fingerprints of its inputs
+export function mapCacheKey({ states = [], ...params }, fingerprints = []) {
+  const normalized = {
+    ...Object.fromEntries(Object.entries(params).sort(([a], [b]) => a.localeCompare(b))),
+    states: [...new Set(states)].sort(),
+    fingerprints,
+  };
+  return createHash('sha256').update(JSON.stringify(normalized)).digest('hex');
+}
+
+// The stage progress of an in-flight build. Listeners that subscribe late are replayed the stages
+// already reported, so every request sharing the build sees all of its progress.
+class BuildProgress extends EventEmitter {
+  constructor() {
+    super();
+    this.events = [];
+  }
+
+  report(event) {
+    this.events.push(event);
+    this.emit('progress', event);
+  }
+
+  // Returns a function that unsubscribes the listener
+  subscribe(listener) {
+    this.events.forEach(listener);
+    this.on('progress', listener);
+    return () => this.off('progress', listener);
+  }
+}
+
+// A content-addressed cache of generated map files with LRU eviction by entry count and total size.
+// Concurrent builds of the same key share one build.
+export class MapCache {
+  constructor({ directory = cacheDirectory, maxEntries = 50, maxBytes = 500 * 1024 * 1024 } = {}) {
+    this.directory = directory;
+    this.maxEntries = maxEntries;
+    this.maxBytes = maxBytes;
+    this.totalBytes = 0;
+    // Insertion ordered, least recently used first
+    this.entries = new Map();
+    this.inFlight = new Map();
+    this.load();
+  }
+
+  // Index maps cached by a previous run, oldest first
+  load() {
+    fs.mkdirSync(this.directory, { recursive: true });
+    fs.readdirSync(this.directory)
+      .filter((fileName) => fileName.endsWith(CACHE_EXTENSION))
+      .map((fileName) => {
+        const stats = fs.statSync(path.join(this.directory, fileName));
+        return { key: path.basename(fileName, CACHE_EXTENSION), size: stats.size, accessed: stats.mtimeMs };
+      })
+      .sort((a, b) => a.accessed - b.accessed)
+      .forEach(({ key, size }) => this.add(key, size, this.readArtifacts(key)));
+    this.evict();
+  }
+
+  filePath(key) {
+    return path.join(this.directory, `${key}${CACHE_EXTENSION}`);
+  }
+
+  artifactsPath(key) {
+    return path.join(this.directory, `${key}${ARTIFACTS_EXTENSION}`);
+  }
+
+  readArtifacts(key) {
+    try {
+      return JSON.parse(fs.readFileSync(this.artifactsPath(key), 'utf8'));
+    } catch (error) {
+      return [];
+    }
+  }
+
+  add(key, size, artifacts = []) {
+    this.entries.set(key, { size, artifacts });
+    this.totalBytes += size;
+  }
+
+  // Whether a file or directory belongs to a cached map, so it must not expire before the map does
+  ownsArtifact(artifactPath) {
+    const resolved = path.resolve(artifactPath);
+    for (const { artifacts } of this.entries.values()) {
+      if (artifacts.includes(resolved)) {
+        return true;
+      }
+    }
+    return false;
+  }
+
+  remove(key) {
+    const entry = this.entries.get(key);
+    if (!entry) {
+      return;
+    }
+    this.entries.delete(key);
+    this.totalBytes -= entry.size;
+    [this.filePath(key), this.artifactsPath(key), ...entry.artifacts].forEach((removedPath) => {
+      fs.rm(removedPath, { recursive: true, force: true }, (error) => {
+        if (error) {
+          console.error(`Failed to evict cached map ${key} file ${removedPath}:`, error);
+        }
+      });
+    });
+  }
+
+  // Returns the path of a cached map, marking it most recently used, or null if it is not cached
+  get(key) {
+    const entry = this.entries.get(key);
+    if (!entry) {
+      return null;
+    }
+    this.entries.delete(key);
+    this.entries.set(key, entry);
+    return this.filePath(key);
+  }
+
+  // Moves a generated map into the cache and returns its cached path. Artifacts are files or directories
+  // the map depends on, kept until the map is evicted.
+  put(key, sourcePath, artifacts = []) {
+    const cachedPath = this.filePath(key);
+    artifacts = artifacts.map((artifactPath) => path.resolve(artifactPath));
+    if (this.entries.has(key)) {
+      // The file is replaced by the rename below, so only forget the entry
+      this.totalBytes -= this.entries.get(key).size;
+      this.entries.delete(key);
+    }
+
+    if (artifacts.length > 0) {
+      fs.writeFileSync(this.artifactsPath(key), JSON.stringify(artifacts));
+    } else {
+      fs.rmSync(this.artifactsPath(key), { force: true });
+    }
+
+    try {
+      fs.renameSync(sourcePath, cachedPath);
+    } catch (error) {
+      // Renaming fails across devices, so fall back to copying
+      fs.copyFileSync(sourcePath, cachedPath);
+      fs.unlinkSync(sourcePath);
+    }
+
+    this.add(key, fs.statSync(cachedPath).size, artifacts);
+    this.evict(key);
+    return cachedPath;
+  }
+
+  // Removes least recently used maps until the cache is within its limits, always keeping the given key
+  evict(keepKey = null) {
+    for (const key of this.entries.keys()) {
+      if (this.entries.size <= this.maxEntries && this.totalBytes <= this.maxBytes) {
+        return;
+      }
+      if (key !== keepKey) {
+        this.remove(key);
+      }
+    }
+  }
+
+  // Returns the cached map for a key, building it with build(reportProgress) if needed. build() resolves
+  // to a map file path, or to { path, artifacts }, and may report progress events, which are passed to
+  // the onProgress of every caller sharing the build. Resolves to { path, cached }.
+  async getOrBuild(key, build, { onProgress } = {}) {
+    const cachedPath = this.get(key);
+    if (cachedPath) {
+      return { path: cachedPath, cached: true };
+    }
+
+    if (!this.inFlight.has(key)) {
+      const progress = new BuildProgress();
+      const building = Promise.resolve()
+        .then(() => build((event) => progress.report(event)))
+        .then((built) => (typeof built === 'string' ? this.put(key, built) : this.put(key, built.path, built.artifacts)))
+        .finally(() => this.inFlight.delete(key));
+      this.inFlight.set(key, { building, progress });
+    }
+
+    const { building, progress } = this.inFlight.get(key);
+    const unsubscribe = onProgress ? progress.subscribe(onProgress) : () => {};
+    try {
+      return { path: await building, cached: false };
+    } finally {
+      unsubscribe();
+    }
+  }
+}
+
+let mapCache = null;
+
+// The shared cache is created on first use, after the environment has been loaded
+export function getMapCache() {
+  if (!mapCache) {
+    mapCache = new MapCache({
+      maxEntries: Number(process.env.MAP_CACHE_MAX_ENTRIES) || 50,
+      maxBytes: (Number(process.env.MAP_CACHE_MAX_MB) || 500) * 1024 * 1024,
+    });
+  }
+  return mapCache;
+}
@@ -0,0 +1,187 @@
+// src/services/mapJobs.mjs
+import { EventEmitter } from 'events';
+import fs from 'fs';
+import path from 'path';
+import { dirname } from 'path';
+import { fileURLToPath } from 'url';
+import { getMapCache } from './mapCache.mjs';
+
+const __filename = fileURLToPath(import.meta.url);
+const __dirname = dirname(__filename);
+const publicDirectory = path.join(__dirname, '..', '..', 'public');
+export const jobsDirectory = path.join(publicDirectory, 'maps', 'jobs');
+const tilesDirectory = path.join(publicDirectory, 'tiles');
+
+// Directories holding per-job artifacts, swept by age. Tiles referenced by a cached map are kept
+// until the cache evicts the map.
+const artifactDirectories = [
+  jobsDirectory,
+  tilesDirectory,
+  path.join(__dirname, '..', 'python', 'output'),
+];
+
+// The vector tiles a job's map reads, if it was built with tiles
+export function jobTilesDirectory(jobId) {
+  const directory = path.join(tilesDirectory, jobId);
+  return fs.existsSync(directory) ? directory : null;
+}
+
+// Map jobs of this server process, keyed by id
+const jobs = new Map();
+
+// The state of a map build. Emits 'event' with every progress, done or failed event it records.
+class MapJob extends EventEmitter {
+  constructor(id) {
+    super();
+    this.id = id;
+    this.status = 'queued';
+    this.events = [];
+    this.result = null;
+    this.error = null;
+    this.updatedAt = Date.now();
+  }
+
+  get finished() {
+    return this.status === 'succeeded' || this.status === 'failed';
+  }
+
+  record(event) {
+    const recorded = { ...event, time: new Date().toISOString() };
+    this.events.push(recorded);
+    this.updatedAt = Date.now();
+    this.emit('event', recorded);
+  }
+
+  progress(stage, details = {}) {
+    this.status = 'running';
+    this.record({ type: 'progress', stage, ...details });
+  }
+
+  succeed(result) {
+    this.status = 'succeeded';
+    this.result = result;
+    this.record({ type: 'done', ...result });
+  }
+
+  fail(error) {
+    this.status = 'failed';
+    this.error = error.message;
+    this.record({ type: 'failed', error: error.message });
+  }
+
+  toJSON() {
+    return {
+      jobId: this.id,
+      status: this.status,
+      stages: this.events.filter((event) => event.type === 'progress'),
+      ...(this.result || {}),
+      ...(this.error ? { error: this.error } : {}),
+    };
+  }
+}
+
+export function createMapJob(jobId) {
+  const job = new MapJob(jobId);
+  jobs.set(jobId, job);
+  return job;
+}
+
+export function getMapJob(jobId) {
+  return jobs.get(jobId) || null;
+}
+
+const JOB_ID_PATTERN = /^[0-9a-f]{8}-[0-9a-f]{4}-[0-9a-f]{4}-[0-9a-f]{4}-[0-9a-f]{12}$/i;
+
+export function isValidJobId(jobId) {
+  return typeof jobId === 'string' && JOB_ID_PATTERN.test(jobId);
+}
+
+function jobMapPath(jobId) {
+  if (!isValidJobId(jobId)) {
+    throw new Error(`Invalid job id: ${jobId}`);
+  }
+  return path.join(jobsDirectory, `${jobId}.html`);
+}
+
+// Publishes a generated map as the job's own file and returns its public URL path. The file is
+// hard linked where possible, so publishing a cached map does not copy it.
+export function publishJobMap(jobId, mapPath) {
+  const publishedPath = jobMapPath(jobId);
+  fs.mkdirSync(jobsDirectory, { recursive: true });
+
+  try {
+    fs.linkSync(mapPath, publishedPath);
+  } catch (error) {
+    fs.copyFileSync(mapPath, publishedPath);
+  }
+
+  // Restart the artifact's TTL from the time it was handed out
+  const now = new Date();
+  fs.utimesSync(publishedPath, now, now);
+
+  return `/maps/jobs/${jobId}.html`;
+}
+
+// Removes a job's map. Resolves to false if the job has no map.
+export async function removeJobMap(jobId) {
+  try {
+    await fs.promises.unlink(jobMapPath(jobId));
+    return true;
+  } catch (error) {
+    if (error.code === 'ENOENT') {
+      return false;
+    }
+    throw error;
+  }
+}
+
+// Removes finished jobs and artifacts older than the TTL from every artifact directory
+export async function sweepJobArtifacts(ttlMs) {
+  const cutoff = Date.now() - ttlMs;
+  let removed = 0;
+
+  for (const [jobId, job] of jobs) {
+    if (job.finished && job.updatedAt < cutoff) {
+      jobs.delete(jobId);
+    }
+  }
+
+  for (const directory of artifactDirectories) {
+    let names;
+    try {
+      names = await fs.promises.readdir(directory);
+    } catch (error) {
+      continue;
+    }
+
+    for (const name of names) {
+      const artifactPath = path.join(directory, name);
+      try {
+        const stats = await fs.promises.stat(artifactPath);
+        if (stats.mtimeMs < cutoff && !getMapCache().ownsArtifact(artifactPath)) {
+          await fs.promises.rm(artifactPath, { recursive: true, force: true });
+          removed += 1;
+        }
+      } catch (error) {
+        console.error(`Failed to remove expired artifact ${artifactPath}:`, error);
+      }
+    }
+  }
+  return removed;
+}
+
+// Periodically removes expired job artifacts. Returns the interval timer.
+export function startJobArtifactSweeper({ ttlMs, intervalMs }) {
+  const sweep = () => sweepJobArtifacts(ttlMs)
+    .then((removed) => {
+      if (removed > 0) {
+        console.log(`Removed ${removed} expired map artifacts`);
+      }
+    })
+    .catch((error) => console.error('Map artifact sweep failed:', error));
+
+  sweep();
+  const timer = setInterval(sweep, intervalMs);
+  timer.unref();
+  return timer;
+}
@@ -0,0 +1,237 @@
+// src/services/mapWorkerPool.mjs
+import { spawn } from 'child_process';
+import readline from 'readline';
+import os from 'os';
+import path from 'path';
+import { dirname } from 'path';
+import { fileURLToPath } from 'url';
+
+const __filename = fileURLToPath(import.meta.url);
+const __dirname = dirname(__filename);
+const workerScript = path.join(__dirname, '..', 'python', 'map_worker.py');
+
+const RESTART_DELAY_MS = 1000;
+const MAX_RESTART_DELAY_MS = 60 * 1000;
+// A worker that fails this many starts in a row (exiting before it is ready) is not restarted again
+const MAX_START_FAILURES = 5;
+const DEFAULT_JOB_TIMEOUT_MS = 5 * 60 * 1000;
+
+// A resident Python map worker, speaking the JSON-lines protocol of map_worker.py
+class MapWorker {
+  constructor(pool, pythonCommand) {
+    this.pool = pool;
+    this.pythonCommand = pythonCommand;
+    this.ready = false;
+    this.failed = false;
+    this.startFailures = 0;
+    // Hung jobs killed by their timeout, counted apart from start failures so slow builds never take the worker offline
+    this.timeouts = 0;
+    this.currentJob = null;
+    this.start();
+  }
+
+  start() {
+    this.ready = false;
+    const child = spawn(this.pythonCommand, [workerScript], {
+      cwd: path.join(__dirname, '..', '..'),
+    });
+    this.process = child;
+
+    readline.createInterface({ input: child.stdout }).on('line', (line) => this.handleLine(line));
+
+    child.stderr.on('data', (data) => {
+      // Pipeline output and warnings are logged, they do not fail the job
+      console.error(`Map worker ${child.pid}: ${data.toString().trim()}`);
+    });
+
+    // Writes to a worker that has just died fail with EPIPE; the exit below rejects its job
+    child.stdin.on('error', (error) => {
+      console.error(`Map worker ${child.pid} input error:`, error.message);
+    });
+
+    // Spawning fails (e.g. ENOENT for a missing interpreter) without an exit event
+    child.on('error', (error) => {
+      console.error(`Map worker failed to start with '${this.pythonCommand}':`, error.message);
+      this.handleExit(child, error.message);
+    });
+
+    child.on('exit', (code, signal) => this.handleExit(child, `code ${code ?? signal}`));
+  }
+
+  // Rejects the running job and restarts the worker, backing off while it keeps failing to start
+  handleExit(child, reason) {
+    if (child !== this.process || child.exited) {
+      return;
+    }
+    child.exited = true;
+
+    if (child.timedOut) {
+      this.timeouts += 1;
+      console.error(`Map worker ${child.pid} was killed after a job timed out (${this.timeouts} timeouts so far), restarting it`);
+    } else if (!this.ready) {
+      this.startFailures += 1;
+    }
+    this.ready = false;
+    this.failJob(new Error(`Map worker exited with ${reason}`));
+
+    if (this.pool.closed) {
+      return;
+    }
+    if (this.startFailures >= MAX_START_FAILURES) {
+      this.failed = true;
+      console.error(`Map worker failed to start ${this.startFailures} times in a row, not restarting it`);
+      this.pool.workerFailed();
+      return;
+    }
+
+    const delay = Math.min(RESTART_DELAY_MS * 2 ** this.startFailures, MAX_RESTART_DELAY_MS);
+    setTimeout(() => this.start(), delay);
+  }
+
+  failJob(error) {
+    if (!this.currentJob) {
+      return;
+    }
+    clearTimeout(this.currentJob.timeout);
+    this.currentJob.reject(error);
+    this.currentJob = null;
+  }
+
+  handleLine(line) {
+    let message;
+    try {
+      message = JSON.parse(line);
+    } catch (error) {
+      console.error(`Map worker sent an invalid message: ${line}`);
+      return;
+    }
+
+    if (message.ready) {
+      this.ready = true;
+      this.startFailures = 0;
+      this.pool.dispatch();
+      return;
+    }
+
+    if (!this.currentJob || message.id !== this.currentJob.job.id) {
+      return;
+    }
+
+    if (message.event === 'progress') {
+      this.currentJob.onProgress?.(message);
+      return;
+    }
+
+    const { resolve, reject, timeout } = this.currentJob;
+    clearTimeout(timeout);
+    this.currentJob = null;
+    if (message.error) {
+      reject(new Error(message.error));
+    } else {
+      resolve(message);
+    }
+    this.pool.dispatch();
+  }
+
+  get idle() {
+    return this.ready && !this.currentJob;
+  }
+
+  run(queuedJob) {
+    this.currentJob = queuedJob;
+
+    // A job still running after the timeout is abandoned and its worker killed and restarted
+    queuedJob.timeout = setTimeout(() => {
+      const error = new Error(`Map job ${queuedJob.job.id} timed out after ${this.pool.jobTimeoutMs / 1000}s`);
+      error.code = 'JOB_TIMEOUT';
+      this.ready = false;
+      this.failJob(error);
+      this.process.timedOut = true;
+      this.process.kill('SIGKILL');
+    }, this.pool.jobTimeoutMs);
+
+    this.process.stdin.write(`${JSON.stringify(queuedJob.job)}\n`);
+  }
+
+  stop() {
+    this.process.kill();
+  }
+}
+
+// Leave a core for the server itself
+const DEFAULT_POOL_SIZE = Math.max(1, os.cpus().length - 1);
+const DEFAULT_MAX_QUEUE = 20;
+
+// A fixed-size pool of map workers, each building one map at a time, with a bounded FIFO job queue
+export class MapWorkerPool {
+  constructor({ size = DEFAULT_POOL_SIZE, maxQueue = DEFAULT_MAX_QUEUE, pythonCommand = 'python', jobTimeoutMs = DEFAULT_JOB_TIMEOUT_MS } = {}) {
+    this.closed = false;
+    this.queue = [];
+    this.maxQueue = maxQueue;
+    this.jobTimeoutMs = jobTimeoutMs;
+    this.workers = Array.from({ length: size }, () => new MapWorker(this, pythonCommand));
+  }
+
+  get failed() {
+    return this.workers.every((worker) => worker.failed);
+  }
+
+  // Called when a worker gives up restarting. Once every worker has, queued jobs can never run.
+  workerFailed() {
+    if (this.failed) {
+      this.queue.forEach(({ reject }) => reject(new Error('Map workers failed to start')));
+      this.queue = [];
+    }
+  }
+
+  // Queues a job. onProgress is called with each progress message the worker sends for it.
+  submit(job, { onProgress } = {}) {
+    return new Promise((resolve, reject) => {
+      if (this.failed) {
+        reject(new Error('Map workers failed to start'));
+        return;
+      }
+      if (this.queue.length >= this.maxQueue) {
+        const error = new Error('Too many map requests are queued, please try again shortly');
+        error.code = 'QUEUE_FULL';
+        reject(error);
+        return;
+      }
+      this.queue.push({ job, resolve, reject, onProgress });
+      this.dispatch();
+    });
+  }
+
+  dispatch() {
+    for (const worker of this.workers) {
+      if (this.queue.length === 0) {
+        return;
+      }
+      if (worker.idle) {
+        worker.run(this.queue.shift());
+      }
+    }
+  }
+
+  close() {
+    this.closed = true;
+    this.workers.forEach((worker) => worker.stop());
+    this.queue.forEach(({ reject }) => reject(new Error('Map worker pool closed')));
+    this.queue = [];
+  }
+}
+
+let mapWorkerPool = null;
+
+// The shared pool is created on first use, after the environment has been loaded
+export function getMapWorkerPool() {
+  if (!mapWorkerPool) {
+    mapWorkerPool = new MapWorkerPool({
+      size: Number(process.env.MAP_WORKER_POOL_SIZE) || DEFAULT_POOL_SIZE,
+      maxQueue: Number(process.env.MAP_JOB_QUEUE_LIMIT) || DEFAULT_MAX_QUEUE,
+      pythonCommand: process.env.PYTHON || 'python',
+      jobTimeoutMs: (Number(process.env.MAP_JOB_TIMEOUT_SECONDS) || DEFAULT_JOB_TIMEOUT_MS / 1000) * 1000,
+    });
+  }
+  return mapWorkerPool;
+}